@@ -0,0 +1,548 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+benchmark
+
+Offline performance benchmark of "Einhander" translation tools: generates
+synthetic game-like assets (VFS, pseudo VABs, bitmaps, lzss blocks, gallery
+images), times each tool command end to end and per stage, saves results
+to JSON and compares them with a baseline.
+
+Version:   0.9
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import click
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOOLS_DIR)
+from einhander import bitmap, lzss, vab, vfs  # noqa: E402
+from einhander.binio import write_u16le  # noqa: E402
+
+# asset counts and sizes per scale
+SCALES = {
+    'small': {'dirs': 2, 'files': 8, 'max_sectors': 16, 'vab_samples': 6, 'lzss_chunks': 4,
+              'batch_copies': 2, 'gallery': 3},
+    'full': {'dirs': 6, 'files': 48, 'max_sectors': 64, 'vab_samples': 24, 'lzss_chunks': 32,
+             'batch_copies': 8, 'gallery': 12},
+}
+VAB_TABLE_OFFS = 0xA20
+LZSS_BASE = 0x80010000
+LZSS_PTR_TABLE = 0x100
+LZSS_CHUNK_SIZE = 0x400  # 256 pixels wide 4bpp, 8 lines
+GALLERY_SIZE = (640, 480)
+PATCH_POS = (48, 400)
+DEFAULT_TOLERANCE = 0.10
+
+
+def random_bytes(rng, size):
+    return rng.integers(0, 256, size, dtype='uint8').tobytes()
+
+
+def random_clut(rng, count):
+    """
+    Random 15-bit CLUT with transparent first color
+    """
+    colors = rng.integers(1, 0x8000, count, dtype='uint16')
+    colors[0] = 0
+    return colors.astype('<u2').tobytes()
+
+
+def glyph_sheet(rng, width, height):
+    """
+    Font-like 4bpp indices: background 0 with glyph cells of strokes
+    """
+    import numpy as np
+    sheet = np.zeros((height, width), dtype='uint8')
+    for top in range(0, height - 7, 8):
+        for left in range(0, width - 7, 8):
+            if rng.random() < 0.2:
+                continue  # empty cell
+            for _ in range(rng.integers(2, 5)):
+                (y, x) = rng.integers(0, 7, 2)
+                (h, w) = rng.integers(1, 8 - y), rng.integers(1, 8 - x)
+                sheet[top + y:top + y + h, left + x:left + x + w] = rng.integers(1, 16)
+    return sheet
+
+
+def pack_nybbles(indices):
+    """
+    PSX 4bpp layout: low nybble is left pixel
+    """
+    return (indices[:, 0::2] | (indices[:, 1::2] << 4)).astype('uint8').tobytes()
+
+
+def picture(rng, width, height):
+    """
+    Gallery-like RGB picture: gradients, soft shapes and sensor noise
+    """
+    import numpy as np
+    ys, xs = np.mgrid[0:height, 0:width].astype('float32')
+    image = np.empty((height, width, 3), dtype='float32')
+    for channel in range(3):
+        (fx, fy, phase) = rng.random(3) * (0.02, 0.02, 6.28)
+        image[:, :, channel] = 128 + 90 * np.sin(xs * fx + ys * fy + phase)
+    for _ in range(12):
+        (cx, cy) = rng.integers(0, width), rng.integers(0, height)
+        radius = rng.integers(20, 120)
+        mask = (xs - cx) ** 2 + (ys - cy) ** 2 < radius ** 2
+        image[mask] = image[mask] * 0.5 + rng.integers(0, 256, 3) * 0.5
+    image += rng.normal(0, 6, image.shape)
+    return np.clip(image, 0, 255).astype('uint8')
+
+
+def generate_vfs(out_dir, rng, scale):
+    """
+    BININDEX.BIN and BINPACK{n}.BIN files, and the same members
+    in pack/{n} folders as einpack pack input.
+    """
+    sector = vfs.SECTOR_SIZE
+    vfs_dir = os.path.join(out_dir, 'vfs')
+    os.makedirs(vfs_dir)
+    index = bytearray(scale['dirs'] * sector)
+    for dir_num in range(scale['dirs']):
+        member_dir = os.path.join(out_dir, 'pack', str(dir_num))
+        os.makedirs(member_dir)
+        offs = 0
+        with open(os.path.join(vfs_dir, f"BINPACK{dir_num}.BIN"), 'wb') as pack_file:
+            for file_num in range(scale['files']):
+                size = int(rng.integers(1, scale['max_sectors'] + 1))
+                data = random_bytes(rng, size * sector)
+                pack_file.write(data)
+                with open(os.path.join(member_dir, f"{file_num:02}.bin"), 'wb') as member_file:
+                    member_file.write(data)
+                pos = dir_num * sector + file_num * 4
+                write_u16le(index, pos, offs)
+                write_u16le(index, pos + 2, size)
+                offs += size
+    with open(os.path.join(vfs_dir, "BININDEX.BIN"), 'wb') as index_file:
+        index_file.write(index)
+
+
+def generate_vab(out_dir, rng, scale):
+    """
+    Pseudo VAB with ADPCM samples: 0x2000 header with size table,
+    sample bodies, sector alignment and last XA sector.
+    """
+    sizes = [int(rng.integers(0x80, 0x260)) * 16 for _ in range(scale['vab_samples'])]
+    header = bytearray(random_bytes(rng, vab.HEADER_SIZE))
+    pos = VAB_TABLE_OFFS
+    write_u16le(header, pos, 0)
+    for size in sizes:
+        pos += 2
+        write_u16le(header, pos, size >> 3)
+    write_u16le(header, pos + 2, 0)  # end of table
+    adpcm_size = sum(sizes)
+    write_u16le(header, 0x1FFC, -(-adpcm_size // vab.SECTOR_SIZE))
+    with open(os.path.join(out_dir, 'voice.bin'), 'wb') as vab_file:
+        vab_file.write(header)
+        vab_file.write(random_bytes(rng, adpcm_size))
+        vab_file.write(bytes(vab.SECTOR_SIZE - adpcm_size % vab.SECTOR_SIZE))
+        vab_file.write(random_bytes(rng, vab.SECTOR_SIZE))
+
+
+def generate_bitmaps(out_dir, rng, scale):
+    """
+    Raw 4bpp font sheet, 8bpp and 16bpp pictures with CLUTs, their png images
+    and psx_bitmap_converter batch manifest.
+    """
+    import numpy as np
+    bitmaps = {
+        '4bpp': (256, 256, pack_nybbles(glyph_sheet(rng, 256, 256)), random_clut(rng, 16)),
+        '8bpp': (256, 256, (picture(rng, 256, 256)[:, :, 0] // 4 * 4 + rng.integers(0, 4, (256, 256))
+                            ).astype('uint8').tobytes(), random_clut(rng, 256)),
+    }
+    rgb = picture(rng, 320, 240).astype('uint16') >> 3
+    bitmaps['16bpp'] = (320, 240, (rgb[:, :, 0] | (rgb[:, :, 1] << 5) | (rgb[:, :, 2] << 10)
+                                   ).astype('<u2').tobytes(), None)
+    manifest = []
+    for (mode, (width, height, bitmap_data, clut)) in bitmaps.items():
+        with open(os.path.join(out_dir, f"bitmap_{mode}.bin"), 'wb') as bitmap_file:
+            bitmap_file.write(bitmap_data)
+        colors = None
+        if clut is not None:
+            with open(os.path.join(out_dir, f"clut_{mode}.bin"), 'wb') as clut_file:
+                clut_file.write(clut)
+            colors = bitmap.pal15To24(clut)
+        bitmap.buildImage(mode, bitmap_data, colors, width, height).save(
+            os.path.join(out_dir, f"image_{mode}.png"))
+        for copy in range(scale['batch_copies']):
+            manifest.append({'action': 'decode', 'mode': mode, 'bitmap': f"bitmap_{mode}.bin",
+                             'palette': f"clut_{mode}.bin", 'width': width, 'height': height,
+                             'output': f"out/decoded_{mode}_{copy}.png"})
+            manifest.append({'action': 'encode', 'mode': mode, 'image': f"image_{mode}.png",
+                             'bitmap': f"out/encoded_{mode}_{copy}.bin",
+                             'palette': f"out/encoded_{mode}_{copy}_clut.bin"})
+    with open(os.path.join(out_dir, 'bitmaps.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+
+def generate_lzss(out_dir, rng, scale):
+    """
+    Plain font sheet, packed file with its compressed line chunks and
+    pointer table, and edited plain sheet for repack.
+    """
+    count = scale['lzss_chunks']
+    sheet = glyph_sheet(rng, 256, count * 8)
+    plain = pack_nybbles(sheet)
+    edited = sheet.copy()
+    for line in rng.choice(count, max(1, count // 8), replace=False):
+        edited[line * 8:line * 8 + 8] = glyph_sheet(rng, 256, 8)
+    block_start = LZSS_PTR_TABLE + count * 0x20
+    target_size = len(plain) * 9 // 8 + count * 2 + 0x100
+    packed = bytearray(block_start + target_size)
+    (offsets, block_bytes) = lzss.pack_line_block(plain, LZSS_CHUNK_SIZE)
+    lzss.patch_line_block(packed, LZSS_BASE, LZSS_PTR_TABLE, block_start, offsets, block_bytes, target_size)
+    for (name, data) in (('lzss_plain.bin', plain), ('lzss_edited.bin', pack_nybbles(edited)),
+                         ('lzss_packed.bin', packed)):
+        with open(os.path.join(out_dir, name), 'wb') as out_file:
+            out_file.write(data)
+    return {'count': count, 'block_start': block_start, 'target_size': target_size}
+
+
+def generate_gallery(out_dir, rng, scale):
+    """
+    Gallery png pictures, some with an untranslated caption snippet,
+    translated patch with alpha, and image_patcher manifest.
+    """
+    import numpy as np
+    from PIL import Image
+    gallery_dir = os.path.join(out_dir, 'gallery')
+    os.makedirs(gallery_dir)
+    (width, height) = GALLERY_SIZE
+    snippet = np.zeros((24, 96, 3), dtype='uint8')
+    snippet[4:20, 4:92] = glyph_sheet(rng, 88, 16)[:, :, None] * 16
+    Image.fromarray(snippet).save(os.path.join(out_dir, 'snippet.png'))
+    patch = np.zeros((32, 160, 4), dtype='uint8')
+    patch[:, :, :3] = 255
+    patch[:, :, 3] = (glyph_sheet(rng, 160, 32) > 0) * 255
+    Image.fromarray(patch, 'RGBA').save(os.path.join(out_dir, 'patch.png'))
+    for num in range(scale['gallery']):
+        pixels = picture(rng, width, height)
+        if num % 2 == 0:
+            (x, y) = rng.integers(0, width - 96), rng.integers(0, height - 24)
+            pixels[y:y + 24, x:x + 96] = snippet
+        Image.fromarray(pixels).save(os.path.join(gallery_dir, f"gallery_{num:02}.png"))
+    manifest = {'source_dir': 'gallery', 'output_dir': 'out',
+                'images': [{'glob': '*.png', 'patches': [{'patch': 'patch.png', 'x': PATCH_POS[0], 'y': PATCH_POS[1]}]},
+                           {'image': 'gallery_00.png', 'patches': [{'patch': 'snippet.png', 'x': 8, 'y': 8}]}]}
+    with open(os.path.join(out_dir, 'gallery.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+
+@click.group()
+def cli():
+    """Offline performance benchmark of Einhander translation tools.
+    """
+    pass
+
+
+@cli.command(name='generate', short_help='generate synthetic assets')
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option('--scale', '-s', type=click.Choice(list(SCALES)), default='full', help='Asset counts and sizes.')
+@click.option('--seed', type=int, default=2000, help='Random seed, same seed gives same assets.')
+def generate(out_dir, scale, seed):
+    """\b
+    Generate synthetic game-like assets in OUT_DIR (removed first, if it exists):
+    VFS with BININDEX.BIN and BINPACK{n}.BIN, pseudo VAB with ADPCM samples,
+    4bpp/8bpp/16bpp bitmaps with CLUTs, lzss packed font sheet and gallery png images.
+    Assets are deterministic for given scale and seed.
+    """
+    import numpy as np
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    rng = np.random.default_rng(seed)
+    start_time = time.perf_counter()
+    params = SCALES[scale]
+    generate_vfs(out_dir, rng, params)
+    generate_vab(out_dir, rng, params)
+    generate_bitmaps(out_dir, rng, params)
+    lzss = generate_lzss(out_dir, rng, params)
+    generate_gallery(out_dir, rng, params)
+    with open(os.path.join(out_dir, 'assets.json'), 'w') as info_file:
+        json.dump({'scale': scale, 'seed': seed, 'lzss': lzss}, info_file, indent=1)
+    click.echo(f"Generated {scale} assets in {out_dir} in {time.perf_counter() - start_time:.2f} s.")
+
+
+def copy_inputs(assets, work_dir, names):
+    for name in names:
+        source = os.path.join(assets, name)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(work_dir, name))
+        else:
+            shutil.copy(source, work_dir)
+
+
+def rebase_manifest(assets, work_dir, name):
+    """
+    Copy manifest to work dir, pointing inputs to assets folder
+    """
+    with open(os.path.join(assets, name)) as manifest_file:
+        manifest = json.load(manifest_file)
+    if name == 'gallery.json':
+        manifest['source_dir'] = os.path.join(assets, manifest['source_dir'])
+        for entry in manifest['images']:
+            for patch in entry['patches']:
+                patch['patch'] = os.path.join(assets, patch['patch'])
+    else:
+        for entry in manifest:
+            for key in ('bitmap', 'palette', 'image'):
+                if key in entry and not entry[key].startswith('out/'):
+                    entry[key] = os.path.join(assets, entry[key])
+        os.makedirs(os.path.join(work_dir, 'out'))
+    with open(os.path.join(work_dir, name), 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def benchmark_cases(assets, info, jobs):
+    """
+    Benchmark cases: name, tool script, arguments and setup of work folder.
+    Work folder is a fresh temporary folder, tools run with it as current folder.
+    """
+    lzss = info['lzss']
+    lzss_args = [hex(LZSS_BASE), hex(LZSS_PTR_TABLE), hex(lzss['block_start']),
+                 hex(LZSS_CHUNK_SIZE), hex(lzss['target_size'])]
+    jobs_args = [] if jobs is None else ['-j', str(jobs)]
+    vfs_files = ['BININDEX.BIN'] + sorted(name for name in os.listdir(os.path.join(assets, 'vfs'))
+                                          if name.startswith('BINPACK'))
+    dir_names = ' '.join(sorted(os.listdir(os.path.join(assets, 'pack')), key=int))
+    bitmap_sizes = {'4bpp': (256, 256), '8bpp': (256, 256), '16bpp': (320, 240)}
+
+    def pack_dirs(work_dir):
+        copy_inputs(os.path.join(assets, 'pack'), work_dir, dir_names.split())
+
+    def unpacked_vab(work_dir):
+        copy_inputs(assets, work_dir, ['voice.bin'])
+        subprocess.run([sys.executable, os.path.join(TOOLS_DIR, 'einvab', 'einvab.py'), 'unpack',
+                        'voice.bin', hex(VAB_TABLE_OFFS)], cwd=work_dir, check=True, capture_output=True)
+
+    cases = [
+        ('einpack unpack', 'einpack/einpack.py', ['unpack'],
+         lambda work_dir: copy_inputs(os.path.join(assets, 'vfs'), work_dir, vfs_files)),
+        ('einpack pack', 'einpack/einpack.py', ['pack', dir_names],
+         pack_dirs),
+        ('einvab unpack', 'einvab/einvab.py', ['unpack', 'voice.bin', hex(VAB_TABLE_OFFS)],
+         lambda work_dir: copy_inputs(assets, work_dir, ['voice.bin'])),
+        ('einvab pack', 'einvab/einvab.py', ['pack', 'voice', hex(VAB_TABLE_OFFS)], unpacked_vab),
+    ]
+    for (mode, (width, height)) in bitmap_sizes.items():
+        cases.append((f"psx_bitmap_converter decode {mode}", 'psx_bitmap_converter/psx_bitmap_converter.py',
+                      ['decode', mode, os.path.join(assets, f"bitmap_{mode}.bin"),
+                       '-p', os.path.join(assets, f"clut_{mode}.bin"), str(width), str(height), '-o', 'image.png'],
+                      None))
+        cases.append((f"psx_bitmap_converter encode {mode}", 'psx_bitmap_converter/psx_bitmap_converter.py',
+                      ['encode', os.path.join(assets, f"image_{mode}.png"), mode], None))
+    cases += [
+        ('psx_bitmap_converter batch', 'psx_bitmap_converter/psx_bitmap_converter.py',
+         ['batch', 'bitmaps.json'] + jobs_args, lambda work_dir: rebase_manifest(assets, work_dir, 'bitmaps.json')),
+        ('einlzss unpack', 'einlzss/einlzss.py',
+         ['unpack', os.path.join(assets, 'lzss_packed.bin'), hex(LZSS_BASE), hex(LZSS_PTR_TABLE), hex(lzss['count'])],
+         None),
+        ('einlzss pack', 'einlzss/einlzss.py',
+         ['pack', os.path.join(assets, 'lzss_plain.bin')] + lzss_args + ['-o', 'lzss_packed.bin'],
+         lambda work_dir: copy_inputs(assets, work_dir, ['lzss_packed.bin'])),
+        ('einlzss repack', 'einlzss/einlzss.py',
+         ['repack', os.path.join(assets, 'lzss_edited.bin')] + lzss_args + ['-o', 'lzss_packed.bin'],
+         lambda work_dir: copy_inputs(assets, work_dir, ['lzss_packed.bin'])),
+        ('image_patcher batch', 'image_patcher/image_patcher.py',
+         ['batch', os.path.join(assets, 'gallery'), os.path.join(assets, 'patch.png'), 'out',
+          '-c', str(PATCH_POS[0]), str(PATCH_POS[1])] + jobs_args, None),
+        ('image_patcher manifest', 'image_patcher/image_patcher.py',
+         ['manifest', 'gallery.json', '-f'] + jobs_args,
+         lambda work_dir: rebase_manifest(assets, work_dir, 'gallery.json')),
+        ('image_patcher locate', 'image_patcher/image_patcher.py',
+         ['locate', os.path.join(assets, 'gallery'), os.path.join(assets, 'snippet.png'),
+          os.path.join(assets, 'patch.png'), 'out'] + jobs_args, None),
+    ]
+    return cases
+
+
+def run_case(script, args, setup, repeat, scratch_dir):
+    """
+    Run tool command repeat times, each in fresh work folder.
+
+    Returns
+    -------
+    result : dict
+        command line, list of wall times in ms, min and median of them,
+        median stage times in ms (from tool trace) and error message or None
+
+    """
+    runs = []
+    stage_runs = {}
+    error = None
+    for _ in range(repeat):
+        work_dir = tempfile.mkdtemp(dir=scratch_dir)
+        try:
+            if setup is not None:
+                setup(work_dir)
+            trace_name = os.path.join(scratch_dir, 'trace.json')
+            command = [sys.executable, os.path.join(TOOLS_DIR, script), '--trace', trace_name] + args
+            start_time = time.perf_counter()
+            completed = subprocess.run(command, cwd=work_dir, capture_output=True, text=True)
+            elapsed = time.perf_counter() - start_time
+            if completed.returncode != 0:
+                lines = (completed.stderr or completed.stdout).strip().splitlines()
+                error = f"exit code {completed.returncode}: {lines[-1] if lines else ''}"
+                break
+            runs.append(elapsed * 1000)
+            with open(trace_name) as trace_file:
+                events = json.load(trace_file)['traceEvents']
+            for event in events[1:-1]:  # skip process name and whole run events
+                stage_runs.setdefault(event['name'], []).append(event['dur'] / 1000)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    result = {'command': [os.path.basename(script)] + args, 'runs_ms': [round(run, 3) for run in runs],
+              'error': error}
+    if runs:
+        result.update(min_ms=round(min(runs), 3), median_ms=round(statistics.median(runs), 3),
+                      stages_ms={name: round(statistics.median(times), 3) for (name, times) in stage_runs.items()})
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=TOOLS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Compare min wall times of cases with baseline.
+
+    Returns
+    -------
+    regressions : list of str
+        names of cases slower than baseline by more than tolerance (fraction)
+    failures : list of str
+        names of cases failed in results or missing there, while present in baseline
+
+    """
+    regressions = []
+    failures = []
+    click.echo(f"{'Case':<38} {'Baseline ms':>12} {'Current ms':>12} {'Change':>8}")
+    for (name, case) in results['cases'].items():
+        base_case = baseline['cases'].get(name)
+        if case.get('error') is not None:
+            failures.append(name)
+            click.echo(f"{name:<38} {(base_case or {}).get('min_ms', '-'):>12} {'FAILED':>12}")
+            continue
+        if base_case is None or 'min_ms' not in base_case or 'min_ms' not in case:
+            click.echo(f"{name:<38} {'-':>12} {case.get('min_ms', '-'):>12} {'n/a':>8}")
+            continue
+        change = case['min_ms'] / base_case['min_ms'] - 1
+        mark = ''
+        if change > tolerance:
+            regressions.append(name)
+            mark = '  REGRESSION'
+        click.echo(f"{name:<38} {base_case['min_ms']:>12.1f} {case['min_ms']:>12.1f} {change:>+8.1%}{mark}")
+        if mark:  # show which stages grew
+            for (stage, stage_ms) in case['stages_ms'].items():
+                base_ms = base_case.get('stages_ms', {}).get(stage)
+                if base_ms:
+                    click.echo(f"    {stage:<34} {base_ms:>12.1f} {stage_ms:>12.1f} {stage_ms / base_ms - 1:>+8.1%}")
+    for name in baseline['cases']:
+        if name not in results['cases']:
+            failures.append(name)
+            click.echo(f"{name:<38} missing in current results")
+    return (regressions, failures)
+
+
+@cli.command(name='run', short_help='time tools on generated assets')
+@click.argument('assets', type=click.Path(exists=True, file_okay=False))
+@click.option('--out_name', '-o', default='benchmark.json', help='Results JSON file name.')
+@click.option('--repeat', '-r', type=int, default=3, help='Runs of each case.')
+@click.option('--case', '-k', 'patterns', multiple=True, help='Run only cases, which names contain this text.')
+@click.option('--jobs', '-j', type=int, default=None, help='Worker processes for pooled tools. Defaults to CPU count.')
+@click.option('--baseline', '-b', type=click.Path(exists=True, dir_okay=False), help='Baseline JSON to compare with.')
+@click.option('--tolerance', '-t', type=float, default=DEFAULT_TOLERANCE, help='Allowed slowdown fraction vs baseline.')
+def run(assets, out_name, repeat, patterns, jobs, baseline, tolerance):
+    """\b
+    Run each tool command on ASSETS folder, made by generate, and save timings to JSON.
+    Each case runs REPEAT times as separate process in a fresh work folder,
+    so interpreter start and imports are included. Wall time of whole run and
+    per stage times from tool --trace are recorded.
+    With BASELINE, min wall times are compared and exit code is 1, if any case is
+    slower by more than TOLERANCE or has failed.
+    """
+    assets = os.path.abspath(assets)
+    with open(os.path.join(assets, 'assets.json')) as info_file:
+        info = json.load(info_file)
+    results = {'meta': {'date': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+                        'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpu_count': os.cpu_count(), 'jobs': jobs, 'repeat': repeat,
+                        'scale': info['scale'], 'seed': info['seed']},
+               'cases': {}}
+    failed = 0
+    scratch_dir = tempfile.mkdtemp(prefix='bench_', dir=assets)
+    try:
+        for (name, script, args, setup) in benchmark_cases(assets, info, jobs):
+            if patterns and not any(pattern in name for pattern in patterns):
+                continue
+            result = run_case(script, args, setup, repeat, scratch_dir)
+            results['cases'][name] = result
+            if result['error'] is not None:
+                failed += 1
+                click.echo(f"{name}: FAILED: {result['error']}", err=True)
+                continue
+            slowest = max(result['stages_ms'].items(), key=lambda item: item[1], default=('-', 0))
+            click.echo(f"{name}: min {result['min_ms']:.1f} ms, median {result['median_ms']:.1f} ms, "
+                       f"slowest stage '{slowest[0]}' {slowest[1]:.1f} ms")
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+    with open(out_name, 'w') as out_file:
+        json.dump(results, out_file, indent=1)
+    click.echo(f"Results saved to {out_name}")
+    (regressions, failures) = ([], [])
+    if baseline is not None:
+        with open(baseline) as baseline_file:
+            baseline_results = json.load(baseline_file)
+        if patterns:  # don't report filtered out cases as missing
+            baseline_results['cases'] = {name: case for (name, case) in baseline_results['cases'].items()
+                                         if any(pattern in name for pattern in patterns)}
+        (regressions, failures) = compare_results(results, baseline_results, tolerance)
+    if failed or regressions or failures:
+        raise SystemExit(1)
+
+
+@cli.command(name='compare', short_help='compare results with baseline')
+@click.argument('results_name', type=click.Path(exists=True, dir_okay=False))
+@click.argument('baseline_name', type=click.Path(exists=True, dir_okay=False))
+@click.option('--tolerance', '-t', type=float, default=DEFAULT_TOLERANCE, help='Allowed slowdown fraction vs baseline.')
+def compare(results_name, baseline_name, tolerance):
+    """\b
+    Compare RESULTS_NAME with BASELINE_NAME, both saved by run.
+    Cases are compared by min wall time of runs; for regressed cases stage times are listed.
+    Exit code is 1, if any case is slower than baseline by more than TOLERANCE (0.10 is 10%),
+    has failed or is missing in RESULTS_NAME.
+    """
+    with open(results_name) as results_file, open(baseline_name) as baseline_file:
+        results = json.load(results_file)
+        baseline = json.load(baseline_file)
+    if results['meta'].get('scale') != baseline['meta'].get('scale'):
+        click.echo(f"Warning: results scale '{results['meta'].get('scale')}' differs from "
+                   f"baseline scale '{baseline['meta'].get('scale')}'", err=True)
+    (regressions, failures) = compare_results(results, baseline, tolerance)
+    click.echo(f"{len(regressions)} regressions." if regressions else "No regressions.")
+    if failures:
+        click.echo(f"{len(failures)} cases failed or missing: {', '.join(failures)}", err=True)
+    if regressions or failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
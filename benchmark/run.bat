@@ -0,0 +1,3 @@
+python benchmark.py generate "bench_assets"
+python benchmark.py run "bench_assets" -o "benchmark.json" -b "baseline.json"
+pause
\ No newline at end of file
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Extracts many CLUTs from VRAM dump in one pass and converts them to photoshop ACT format. Usage:
+# python bulkClut.py VRAM_DUMP_NAME CLUT_POS [CLUT_POS ...] [-l LIST_NAME] [-o OUT_DIR]
+# CLUT_POS - serialized CLUT poisition in VRAM, as it's stated in GPU packet command word
+# x is 6 lower bits, y is 10 higher bits. Append ':8' for 256 colors CLUT of 8bpp image, e.g. 0x7C49:8
+# For each CLUT raw binary {CLUT_POS}.bin and {CLUT_POS}.act files are written to OUT_DIR
+# (named {CLUT_POS}_8bpp for 256 colors CLUTs)
+
+import argparse
+import mmap
+import os
+import numpy as np
+
+VRAM_WIDTH = 1024  # in 16-bit words
+VRAM_SIZE = VRAM_WIDTH * 512 * 2
+ACT_COLORS = 256
+
+
+def parseClutPos(text):
+    pos, _, bpp = text.partition(':')
+    colors = 256 if bpp == '8' else 16
+    return (int(pos, base=16), colors)
+
+
+def clutIndices(clutPositions):
+    # word indices of each CLUT color in flat VRAM array, one row per CLUT
+    positions = np.array([pos for (pos, _) in clutPositions], dtype=np.int64)
+    x = (positions & 0x3F) * 16
+    y = positions >> 6
+    colors = clutPositions[0][1]
+    return (y * VRAM_WIDTH + x)[:, None] + np.arange(colors)
+
+
+def clutsToAct(cluts):
+    # 15bpp BGR colors to 24bpp RGB, padded with zero colors up to 256 ACT entries
+    rgb = np.zeros((cluts.shape[0], ACT_COLORS, 3), dtype=np.uint8)
+    colors = cluts.shape[1]
+    rgb[:, :colors, 0] = (cluts & 0x1F) << 3
+    rgb[:, :colors, 1] = ((cluts >> 5) & 0x1F) << 3
+    rgb[:, :colors, 2] = ((cluts >> 10) & 0x1F) << 3
+    return rgb
+
+
+def extractCluts(vramName, clutPositions, outDir):
+    with open(vramName, 'rb') as fvram, \
+            mmap.mmap(fvram.fileno(), VRAM_SIZE, access=mmap.ACCESS_READ) as vramMap:
+        words = np.frombuffer(vramMap, dtype='<u2')
+        # gather all CLUTs of the same size with one fancy index
+        for colors in sorted({colors for (_, colors) in clutPositions}):
+            group = [entry for entry in clutPositions if entry[1] == colors]
+            cluts = words[clutIndices(group)]
+            acts = clutsToAct(cluts)
+            for (pos, _), clut, act in zip(group, cluts, acts):
+                baseName = os.path.join(outDir, f"{pos:04X}" if colors == 16 else f"{pos:04X}_8bpp")
+                with open(baseName + ".bin", 'wb') as output_file:
+                    output_file.write(clut.astype('<u2').tobytes())
+                with open(baseName + ".act", 'wb') as output_file:
+                    output_file.write(act.tobytes())
+                print(f"CLUT {pos:04X}: {colors} colors, X = {(pos & 0x3F) * 16} Y = {pos >> 6}")
+            del cluts
+        del words  # release mmap buffer before closing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract CLUTs from VRAM dump to binary and ACT files in one pass.")
+    parser.add_argument("vram_name", help="VRAM dump file name.")
+    parser.add_argument("clut_pos", nargs='*', help="Serialized CLUT positions in hex, append ':8' for 256 colors CLUT.")
+    parser.add_argument("-l", "--list", help="Text file with one CLUT position per line.")
+    parser.add_argument("-o", "--out_dir", default=".", help="Output folder.")
+    args = parser.parse_args()
+
+    positions = list(args.clut_pos)
+    if args.list:
+        with open(args.list) as listFile:
+            positions += [line.strip() for line in listFile if line.strip()]
+    os.makedirs(args.out_dir, exist_ok=True)
+    extractCluts(args.vram_name, [parseClutPos(pos) for pos in positions], args.out_dir)
@@ -3,20 +3,19 @@
 # python clutToAct.py INPUT_NAME OUTPUT_NAME
 
 
+import os
 import sys
-import bitstruct
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander.binio import iter_u16le  # noqa: E402
 
 
 _, clutName, outName, *rest = sys.argv
 
 results = []
 with open(clutName, "rb") as f:
-    while True:
-        data = f.read(2)
-        if not data:
-            break
-        _, b, g, r = bitstruct.unpack(
-            "u1u5u5u5", bitstruct.byteswap('2', data))
+    for color in iter_u16le(f.read()):
+        r, g, b = color & 0x1F, (color >> 5) & 0x1F, (color >> 10) & 0x1F
         results.extend([r << 3, g << 3, b << 3])
 with open(outName, 'wb') as output:
     output.write(bytes(results))
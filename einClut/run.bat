@@ -1,2 +1,3 @@
 python extractClut.py "corevram.bin" 0x7C49 "demoMode.CLUT"
+REM python bulkClut.py "corevram.bin" 0x7C49 0x7C4A 0x7C49:8 -o "cluts"
 pause
\ No newline at end of file
@@ -0,0 +1,417 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+einbuild
+
+A build runner for translation of "Einhander" game for PSX: runs tool steps
+of a project file in dependency order, independent steps in parallel, and
+skips steps, which inputs, arguments and tool sources are unchanged.
+
+Version:   0.9
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import click
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_NAME = '.einbuild_cache.json'
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def norm_path(path):
+    """
+    Project relative path in one form for matching: forward slashes, no dots
+    """
+    return os.path.normpath(path).replace(os.sep, '/')
+
+
+class Step:
+    """
+    One build step of project file.
+
+    Fields of step in project file:
+    name - unique step name.
+    tool - tool folder name in this repository, e.g. 'einlzss' runs einlzss/einlzss.py,
+    or command - list of executable and its first arguments.
+    args - list of arguments, paths are relative to cwd.
+    cwd - step working folder, relative to project folder. Defaults to project folder.
+    inputs - list of files, folders or glob patterns, relative to project folder.
+    outputs - list of files or folders (ending with '/'), relative to project folder.
+    copy - list of [source, target] file pairs, relative to project folder, copied before
+        the tool is run in list order. For tools, which patch a file in place: sources are inputs
+        and targets are outputs of the step, so a step never changes its own inputs.
+        Folders (ending with '/') are copied with all files, replacing target folder.
+    after - list of step names to run before this one, besides ones found from files.
+    """
+
+    def __init__(self, entry):
+        self.name = entry['name']
+        self.tool = entry.get('tool')
+        self.command = entry.get('command')
+        if (self.tool is None) == (self.command is None):
+            raise ValueError(f"Step '{self.name}': exactly one of 'tool' or 'command' must be given")
+        self.args = [str(arg) for arg in entry.get('args', [])]
+        self.cwd = entry.get('cwd', '.')
+        self.inputs = [norm_path(path) for path in entry.get('inputs', [])]
+        self.outputs = [norm_path(path) + ('/' if path.endswith('/') else '') for path in entry.get('outputs', [])]
+        self.copy = [(norm_path(source), norm_path(target) + ('/' if source.endswith('/') else ''))
+                     for (source, target) in entry.get('copy', [])]
+        self.inputs += [source for (source, _) in self.copy]
+        self.outputs += [target for (_, target) in self.copy]
+        self.after = list(entry.get('after', []))
+        self.deps = set()
+        changed = set(self.inputs) & {output.rstrip('/') for output in self.outputs}
+        if changed:
+            raise ValueError(f"Step '{self.name}' changes its inputs {', '.join(sorted(changed))} in place, "
+                             f"copy them to new outputs with 'copy'")
+
+    def command_line(self):
+        if self.tool is not None:
+            return [sys.executable, os.path.join(TOOLS_DIR, self.tool, self.tool + '.py')] + self.args
+        return list(self.command) + self.args
+
+
+def produces(output, pattern):
+    """
+    Check if step output (file or folder ending with '/') provides input pattern of other step
+    """
+    if output.endswith('/'):
+        folder = output.rstrip('/')
+        return pattern == folder or pattern.startswith(folder + '/')
+    return fnmatch.fnmatchcase(output, pattern) or output.startswith(pattern + '/')
+
+
+def read_project(project_name):
+    """
+    Read steps of project file and link them by files: a step depends on each
+    step, which outputs match its inputs.
+
+    Returns
+    -------
+    steps : dict
+        Step by name, in project file order
+
+    """
+    with open(project_name) as project_file:
+        project = json.load(project_file)
+    steps = {}
+    for entry in project['steps']:
+        step = Step(entry)
+        if step.name in steps:
+            raise ValueError(f"Step name '{step.name}' is not unique")
+        steps[step.name] = step
+    producers = {}
+    for step in steps.values():
+        for output in step.outputs:
+            if output in producers:
+                raise ValueError(f"Output '{output}' of step '{step.name}' is also output of '{producers[output]}'")
+            producers[output] = step.name
+    for step in steps.values():
+        for name in step.after:
+            if name not in steps:
+                raise ValueError(f"Step '{step.name}' runs after unknown step '{name}'")
+            step.deps.add(name)
+        for pattern in step.inputs:
+            step.deps.update(producer for (output, producer) in producers.items()
+                             if producer != step.name and produces(output, pattern))
+    build_order(steps)  # check for cycles
+    return steps
+
+
+def load_steps(project_name):
+    try:
+        return read_project(project_name)
+    except (KeyError, ValueError) as e:
+        raise click.ClickException(f"Project {project_name} is not valid: {e}")
+
+
+def build_order(steps):
+    """
+    Topological order of steps, stable in project file order
+    """
+    order = []
+    state = {}
+
+    def visit(name, chain):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Steps dependency cycle: {' -> '.join(chain + [name])}")
+        state[name] = 'visiting'
+        for dep in sorted(steps[name].deps, key=list(steps).index):
+            visit(dep, chain + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in steps:
+        visit(name, [])
+    return order
+
+
+def select_steps(steps, targets):
+    """
+    Names of target steps with all steps they depend on. All steps, if no targets.
+    """
+    if not targets:
+        return set(steps)
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in steps:
+            raise click.BadParameter(f"unknown step '{name}'", param_hint='TARGETS')
+        if name not in selected:
+            selected.add(name)
+            pending.extend(steps[name].deps)
+    return selected
+
+
+class FileHashes:
+    """
+    SHA-1 of files, memoized by path, size and modification time, so large
+    unchanged archives are not read again between builds.
+    """
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        entry = self.known.get(path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as in_file:
+            for block in iter(lambda: in_file.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        self.known[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def paths_hashes(self, root, patterns):
+        """
+        Hashes of all files matched by patterns (files, folders, globs) under root.
+        Missing paths get None hash.
+        """
+        hashes = {}
+        for pattern in patterns:
+            full_pattern = os.path.join(root, pattern.rstrip('/'))
+            matches = sorted(glob.glob(full_pattern, recursive=True)) if glob.has_magic(pattern) else [full_pattern]
+            if not matches:
+                hashes[pattern] = None
+            for match in matches:
+                if os.path.isdir(match):
+                    files = sorted(os.path.join(folder, name) for (folder, _, names) in os.walk(match)
+                                   for name in names)
+                elif os.path.isfile(match):
+                    files = [match]
+                else:
+                    hashes[norm_path(os.path.relpath(match, root))] = None
+                    continue
+                for file_name in files:
+                    hashes[norm_path(os.path.relpath(file_name, root))] = self.file_hash(file_name)
+        return hashes
+
+
+_tool_hashes = {}
+
+
+def tool_hash(tool):
+    """
+    Version of tool: hash of its folder python sources and of shared einhander package
+    """
+    if tool not in _tool_hashes:
+        digest = hashlib.sha1()
+        for folder in (tool, 'einhander'):
+            for file_name in sorted(glob.glob(os.path.join(TOOLS_DIR, folder, '*.py'))):
+                with open(file_name, 'rb') as source_file:
+                    digest.update(os.path.basename(file_name).encode() + source_file.read())
+        _tool_hashes[tool] = digest.hexdigest()
+    return _tool_hashes[tool]
+
+
+def step_key(step, input_hashes):
+    """
+    Hash of everything step result depends on: command, cwd, tool sources and inputs
+    """
+    key = {'command': step.command_line()[1:] if step.tool else step.command_line(),
+           'cwd': norm_path(step.cwd), 'tool': tool_hash(step.tool) if step.tool else None,
+           'inputs': sorted(input_hashes.items(), key=lambda item: item[0])}
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+
+def run_step(step, root, hashes, record, force, dry_run):
+    """
+    Run step, if its key or outputs differ from recorded ones. Runs in worker thread.
+
+    Returns
+    -------
+    result : tuple
+        status ('run', 'skipped', 'failed' or 'dry'), new record or None,
+        elapsed seconds and tool output of run or failed step
+
+    """
+    start_time = time.perf_counter()
+    input_hashes = hashes.paths_hashes(root, step.inputs)
+    missing = [path for (path, digest) in input_hashes.items() if digest is None]
+    if missing and not dry_run:
+        return ('failed', None, 0.0, f"missing inputs: {', '.join(missing)}")
+    key = step_key(step, input_hashes)
+    if not force and record is not None and record['key'] == key:
+        if hashes.paths_hashes(root, step.outputs) == record['outputs']:
+            return ('skipped', record, time.perf_counter() - start_time, None)
+    if dry_run:
+        return ('dry', None, 0.0, None)
+    for output in step.outputs:  # tools don't create output folders
+        os.makedirs(os.path.dirname(os.path.join(root, output.rstrip('/'))), exist_ok=True)
+    for (source, target) in step.copy:
+        if target.endswith('/'):
+            shutil.rmtree(os.path.join(root, target), ignore_errors=True)
+            shutil.copytree(os.path.join(root, source), os.path.join(root, target))
+        else:
+            shutil.copyfile(os.path.join(root, source), os.path.join(root, target))
+    completed = subprocess.run(step.command_line(), cwd=os.path.join(root, step.cwd),
+                               capture_output=True, text=True)
+    elapsed = time.perf_counter() - start_time
+    if completed.returncode != 0:
+        return ('failed', None, elapsed, (completed.stdout + completed.stderr).strip())
+    output_hashes = hashes.paths_hashes(root, step.outputs)
+    missing = [path for (path, digest) in output_hashes.items() if digest is None]
+    if missing:
+        return ('failed', None, elapsed, f"outputs not created: {', '.join(missing)}")
+    return ('run', {'key': key, 'outputs': output_hashes}, elapsed, (completed.stdout + completed.stderr).strip())
+
+
+def load_cache(cache_name):
+    try:
+        with open(cache_name) as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {'files': {}, 'steps': {}}
+
+
+def save_cache(cache_name, cache):
+    temp_name = cache_name + '.tmp'
+    with open(temp_name, 'w') as cache_file:
+        json.dump(cache, cache_file, indent=1, sort_keys=True)
+    os.replace(temp_name, cache_name)
+
+
+@click.group()
+def cli():
+    """A build runner for Einhander translation tools.
+    """
+    pass
+
+
+@cli.command(name='build', short_help='run changed steps of project')
+@click.argument('project', type=click.Path(exists=True, dir_okay=False))
+@click.argument('targets', nargs=-1)
+@click.option('--jobs', '-j', type=int, default=None, help='Steps to run at once. Defaults to CPU count.')
+@click.option('--force', '-f', is_flag=True, help='Run all selected steps, ignoring cache.')
+@click.option('--dry_run', '-n', is_flag=True, help='Only show steps, which would run.')
+@click.option('--verbose', '-v', is_flag=True, help='Show output of each tool.')
+def build(project, targets, jobs, force, dry_run, verbose):
+    """\b
+    Run steps of PROJECT file in dependency order, independent steps in parallel.
+    A step is skipped, if hashes of its inputs, its arguments and tool sources
+    are the same as on last successful run and its outputs are untouched.
+    So a step, which output did not change, does not trigger its dependents.
+    TARGETS - names of steps to build with their dependencies, all if not given.
+    Steps of a failed step's chain are not run, exit code is 1.
+    """
+    root = os.path.dirname(os.path.abspath(project))
+    steps = load_steps(project)
+    selected = select_steps(steps, targets)
+    cache_name = os.path.join(root, CACHE_NAME)
+    cache = load_cache(cache_name)
+    hashes = FileHashes(cache.get('files'))
+    records = cache.get('steps', {})
+
+    pending = [name for name in build_order(steps) if name in selected]
+    finished = {}  # name -> status
+    counts = {'run': 0, 'skipped': 0, 'failed': 0, 'dry': 0, 'blocked': 0}
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        running = {}
+        try:
+            while pending or running:
+                for name in list(pending):
+                    deps = steps[name].deps & selected
+                    if any(finished.get(dep) in ('failed', 'blocked') for dep in deps):
+                        pending.remove(name)
+                        finished[name] = 'blocked'
+                        counts['blocked'] += 1
+                        click.echo(f"{name}: not run, dependency failed", err=True)
+                    elif dry_run and any(finished.get(dep) == 'dry' for dep in deps):
+                        pending.remove(name)  # inputs will change, when dependencies run
+                        finished[name] = 'dry'
+                        counts['dry'] += 1
+                        click.echo(f"{name}: would run after dependencies")
+                    elif all(dep in finished for dep in deps):
+                        pending.remove(name)
+                        running[executor.submit(run_step, steps[name], root, hashes, records.get(name),
+                                                force, dry_run)] = name
+                if not running:
+                    continue
+                (done, _) = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    (status, record, elapsed, output) = future.result()
+                    finished[name] = status
+                    counts[status] += 1
+                    if status == 'failed':
+                        records.pop(name, None)
+                        click.echo(f"{name}: FAILED in {elapsed:.2f} s", err=True)
+                        if output:
+                            click.echo(output, err=True)
+                        continue
+                    if status == 'run':
+                        records[name] = record
+                        click.echo(f"{name}: done in {elapsed:.2f} s")
+                        if verbose:
+                            click.echo(' '.join(steps[name].command_line()))
+                            if output:
+                                click.echo(output)
+                    elif status == 'dry':
+                        click.echo(f"{name}: would run: {' '.join(steps[name].command_line())}")
+                    elif verbose:
+                        click.echo(f"{name}: up to date")
+        finally:
+            # steps still running on Ctrl-C or error write into hashes, let them end before saving
+            executor.shutdown(wait=True, cancel_futures=True)
+            if not dry_run:
+                known = {path: entry for (path, entry) in hashes.known.items() if os.path.exists(path)}
+                cache = {'files': known, 'steps': records}
+                save_cache(cache_name, cache)
+    click.echo(f"Steps: {counts['run']} run, {counts['skipped']} up to date, {counts['failed']} failed, "
+               f"{counts['blocked']} not run" + (f", {counts['dry']} to run" if dry_run else '') +
+               f" in {time.perf_counter() - start_time:.2f} s.")
+    if counts['failed'] or counts['blocked']:
+        raise SystemExit(1)
+
+
+@cli.command(name='graph', short_help='show steps order and dependencies')
+@click.argument('project', type=click.Path(exists=True, dir_okay=False))
+def graph(project):
+    """\b
+    Show steps of PROJECT file in build order with steps each depends on.
+    """
+    steps = load_steps(project)
+    for name in build_order(steps):
+        deps = ', '.join(sorted(steps[name].deps, key=list(steps).index))
+        click.echo(f"{name}" + (f" <- {deps}" if deps else ''))
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,2 @@
+python einbuild.py build "project.json" -j 4
+pause
\ No newline at end of file
@@ -0,0 +1,11 @@
+'''
+einhander
+
+Shared code of the tools for translation of "Einhander" game for PSX: codecs
+of game formats working on bytes in memory (lzss, vfs, vab, bitmap, widths),
+binary I/O and profiling. Tools are command line front ends for it.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
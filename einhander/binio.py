@@ -0,0 +1,275 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+binio
+
+Small binary I/O core over bytes, memoryview and mmap: MSB-first bit reader
+and writer for compressed streams and byte aligned integer helpers. A long
+running process can keep files mapped between reads with keep_files_mapped.
+Files are copied into preallocated output files with copy_file_data, in
+kernel where the OS can.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import errno
+import mmap
+import os
+import struct
+
+U16LE = struct.Struct('<H')
+U16BE = struct.Struct('>H')
+U32LE = struct.Struct('<I')
+MAPPED_FILES_LIMIT = 64
+COPY_CHUNK_SIZE = 0x100000
+# copy_file_range is not supported for these files, copy through user space
+COPY_FALLBACK_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF)
+
+
+def read_u16le(data, offset):
+    return U16LE.unpack_from(data, offset)[0]
+
+
+def read_u16be(data, offset):
+    return U16BE.unpack_from(data, offset)[0]
+
+
+def read_u32le(data, offset):
+    return U32LE.unpack_from(data, offset)[0]
+
+
+def write_u16le(data, offset, value):
+    U16LE.pack_into(data, offset, value)
+
+
+def write_u32le(data, offset, value):
+    U32LE.pack_into(data, offset, value)
+
+
+def iter_u16le(data):
+    """
+    Iterate over all little endian 16-bit words of data
+    """
+    return (value for (value,) in U16LE.iter_unpack(data))
+
+
+def map_file(file_name):
+    """
+    Map whole file to read only memory buffer. Returns mmap object, or empty bytes
+    for empty file (which can't be mapped).
+    """
+    with open(file_name, 'rb') as in_file:
+        try:
+            return mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return b''
+
+
+def _close_mapping(mapping):
+    if isinstance(mapping, mmap.mmap):
+        try:
+            mapping.close()
+        except BufferError:  # still viewed by a reader, freed with it
+            pass
+
+
+class MappedFiles:
+    """
+    Read only mappings of files, kept open between reads of the same files.
+    A mapping is dropped and made again, when its file was replaced or
+    changed size or modification time. Least recently read mappings are
+    closed above limit.
+    """
+
+    def __init__(self, limit=MAPPED_FILES_LIMIT):
+        self.limit = limit
+        self.mappings = {}  # absolute path -> (stat key, mmap), least recently read first
+
+    def get(self, file_name):
+        path = os.path.abspath(file_name)
+        stat = os.stat(path)
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        entry = self.mappings.pop(path, None)
+        if entry is not None and entry[0] != key:
+            _close_mapping(entry[1])
+            entry = None
+        if entry is None:
+            entry = (key, map_file(path))
+        self.mappings[path] = entry
+        while len(self.mappings) > self.limit:
+            _close_mapping(self.mappings.pop(next(iter(self.mappings)))[1])
+        return entry[1]
+
+    def size(self):
+        return sum(len(mapping) for (_, mapping) in self.mappings.values())
+
+    def clear(self):
+        for (_, mapping) in self.mappings.values():
+            _close_mapping(mapping)
+        self.mappings.clear()
+
+    def __len__(self):
+        return len(self.mappings)
+
+
+_mapped_files = None
+
+
+def keep_files_mapped(limit=MAPPED_FILES_LIMIT):
+    """
+    Keep files read with read_file mapped for the rest of the process life, so
+    repeated reads of the same BINPACK files cost no I/O. Returns MappedFiles.
+    Mapped files can't be overwritten on Windows, use it on POSIX only there.
+    """
+    global _mapped_files
+    if _mapped_files is None:
+        _mapped_files = MappedFiles(limit)
+    return _mapped_files
+
+
+def read_file(file_name):
+    """
+    Read whole file to memory mapped buffer. Returns mmap object, or empty bytes
+    for empty file (which can't be mapped). Mapping is closed with its last
+    reference, or kept open, if enabled with keep_files_mapped.
+    """
+    if _mapped_files is not None:
+        return _mapped_files.get(file_name)
+    return map_file(file_name)
+
+
+def preallocate(out_file, size):
+    """
+    Set size of file open for writing and reserve its disk space up front,
+    where the OS supports it, so it's not grown and fragmented write by write
+    """
+    out_file.truncate(size)
+    if hasattr(os, 'posix_fallocate') and size:
+        try:
+            os.posix_fallocate(out_file.fileno(), 0, size)
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+                raise
+
+
+def copy_file_data(file_name, out_file, offset, size):
+    """
+    Copy size bytes of file to given offset of binary file open for writing,
+    with os.copy_file_range where available (in kernel, without reading data
+    to memory), with chunked reads and writes otherwise.
+    Raises ValueError, if file is shorter than size.
+    """
+    copied = 0
+    with open(file_name, 'rb') as in_file:
+        if hasattr(os, 'copy_file_range'):
+            out_file.flush()
+            try:
+                while copied < size:
+                    count = os.copy_file_range(in_file.fileno(), out_file.fileno(), size - copied,
+                                               copied, offset + copied)
+                    if count == 0:
+                        break
+                    copied += count
+            except OSError as e:
+                if e.errno not in COPY_FALLBACK_ERRORS or copied:
+                    raise
+        if copied < size:
+            in_file.seek(copied)
+            out_file.seek(offset + copied)
+            while copied < size:
+                chunk = in_file.read(min(COPY_CHUNK_SIZE, size - copied))
+                if not chunk:
+                    break
+                out_file.write(chunk)
+                copied += len(chunk)
+    if copied < size:
+        raise ValueError(f"{file_name} is {copied} bytes, not {size}, changed while copying?")
+
+
+class BitReader:
+    """
+    MSB-first bit reader over bytes-like data.
+    pos is position in bits, bytepos in bytes.
+    """
+
+    def __init__(self, data, pos=0):
+        self.data = memoryview(data).cast('B') if not isinstance(data, bytes) else data
+        self.pos = pos
+
+    @property
+    def bytepos(self):
+        return self.pos >> 3
+
+    @bytepos.setter
+    def bytepos(self, value):
+        self.pos = value << 3
+
+    def __len__(self):
+        return len(self.data) * 8
+
+    def read(self, count):
+        """
+        Read count bits as unsigned big endian int
+        """
+        start = self.pos >> 3
+        end = (self.pos + count + 7) >> 3
+        if start < 0 or end > len(self.data):
+            raise ValueError(f"Cannot read {count} bits at position {self.pos}, end of data")
+        window = int.from_bytes(self.data[start:end], 'big')
+        tail = (end << 3) - self.pos - count
+        self.pos += count
+        return (window >> tail) & ((1 << count) - 1)
+
+    def read_bool(self):
+        byte = self.data[self.pos >> 3]
+        bit = (byte >> (7 - (self.pos & 7))) & 1
+        self.pos += 1
+        return bool(bit)
+
+    def read_uintle(self, count):
+        """
+        Read byte aligned count bits as unsigned little endian int
+        """
+        assert self.pos & 7 == 0 and count & 7 == 0, "Little endian read is not byte aligned!"
+        start = self.pos >> 3
+        end = start + (count >> 3)
+        if start < 0 or end > len(self.data):
+            raise ValueError(f"Cannot read {count} bits at position {self.pos}, end of data")
+        self.pos += count
+        return int.from_bytes(self.data[start:end], 'little')
+
+
+class BitWriter:
+    """
+    MSB-first bit writer. tobytes pads last byte with zero bits.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.acc = 0
+        self.acc_len = 0
+
+    def __len__(self):
+        return len(self.buffer) * 8 + self.acc_len
+
+    def write(self, value, count):
+        """
+        Append count lower bits of value
+        """
+        self.acc = (self.acc << count) | (value & ((1 << count) - 1))
+        self.acc_len += count
+        if self.acc_len >= 8:
+            full = self.acc_len >> 3
+            rest = self.acc_len & 7
+            self.buffer += (self.acc >> rest).to_bytes(full, 'big')
+            self.acc &= (1 << rest) - 1
+            self.acc_len = rest
+
+    def write_bool(self, value):
+        self.write(1 if value else 0, 1)
+
+    def tobytes(self):
+        if self.acc_len:
+            return bytes(self.buffer) + bytes([(self.acc << (8 - self.acc_len)) & 0xFF])
+        return bytes(self.buffer)
@@ -0,0 +1,375 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+bitmap
+
+PlayStation bitmaps and palettes: raw 4bpp, 8bpp and 16bpp bitmap data with
+15 bit CLUTs to PIL images and back. psx_bitmap_converter tool is a command
+line front end for it. PIL is imported only by image functions.
+
+Images, which don't fit 4bpp or 8bpp as they are, are quantized in 15 bit
+color space (the only colors PSX has) to a new palette or to a given game
+CLUT. Pixels are mapped with a lookup table of nearest palette color for each
+of 32K colors, cached per palette, so encoding many images with the same
+palette is one table lookup per image. Quantization needs numpy.
+
+Sheets with more than 16 colors can stay 4bpp with tiles: image is split into
+tiles, tiles are clustered into a few shared 16 color CLUTs, and a tile map
+with one CLUT number per tile is kept next to the bitmap and the CLUT set.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+from functools import lru_cache
+
+PALETTE_SIZES = {'4bpp': 16, '8bpp': 256}
+COLOR_COUNT = 0x8000  # 15 bit colors
+KMEANS_ITERATIONS = 8
+LUT_CACHE_SIZE = 16
+NEAREST_CHUNK = 4096  # colors per distances matrix chunk
+TILE_CLUT_SIZE = 16  # 4bpp tiles
+MAX_TILE_CLUTS = 0x100  # CLUT number is a byte of tile map
+
+
+def decode(mode, bitmap_data, palette_data, width, height):
+    """
+    Build PIL image from raw PSX bitmap data and raw 15 bit palette data.
+    palette_data is ignored for '16bpp' mode.
+    """
+    colors = pal15To24(palette_data) if mode != '16bpp' else None
+    return buildImage(mode, bitmap_data, colors, width, height)
+
+
+def buildImage(mode, bitmap_data, colors, width, height):
+    """
+    Build PIL image from raw PSX bitmap data.
+    colors is a list of 24bpp RGB ints, as returned by pal15To24. Ignored for '16bpp' mode.
+    """
+    from PIL import Image
+    if mode == '16bpp':
+        return Image.frombytes("RGB", (width, height), bitmap_data, "raw", "RGB;15", 0, 1)
+    if mode == '8bpp':
+        image = Image.frombytes('P', (width, height), bitmap_data, 'raw', 'P')
+    elif mode == '4bpp':
+        swapped_bitmap_data = swapNybbles(bitmap_data)
+        image = Image.frombytes('P', (width, height), swapped_bitmap_data, 'raw', 'P;4')
+    image.putpalette(colors)
+    return image
+
+
+def splitImage(original_image, mode, palette_data=None):
+    """
+    Split PIL image to raw PSX bitmap and palette data.
+    Returns tuple of bitmap bytes and palette bytes. Palette is None for '16bpp' mode.
+    Indexed images, which use only first 16 (4bpp) or 256 (8bpp) palette entries, keep
+    their indices and palette. Other images are quantized, see quantize.
+    palette_data is raw 15 bit CLUT to map colors to instead, it's returned as is.
+    """
+    if mode == '16bpp':
+        bitmap_data = original_image.tobytes("raw")
+        return (pal24To15(bitmap_data), None)
+    max_colors = PALETTE_SIZES[mode]
+    if palette_data is not None or original_image.mode != 'P' or original_image.getextrema()[1] >= max_colors:
+        return quantize(original_image, mode, palette_data)
+
+    if mode == '4bpp':
+        bitmap_data = original_image.tobytes('raw', 'P;4')
+        palette_data = original_image.getpalette()
+        cropped_palette_data = palette_data[:max_colors * 3]
+        return (swapNybbles(bitmap_data), pal24To15(cropped_palette_data))
+    elif mode == '8bpp':
+        return (original_image.tobytes(), pal24To15(original_image.getpalette()))
+
+
+def quantize(image, mode, palette_data=None):
+    """
+    Quantize PIL image to 16 ('4bpp') or 256 ('8bpp') colors in 15 bit color space.
+    If image has no more colors, palette is exactly its colors in order of appearance,
+    otherwise it's made with median cut, refined with k-means.
+    palette_data is raw 15 bit CLUT to map colors to instead (e.g. an original game CLUT),
+    its first 16 or 256 entries are used and returned as is.
+
+    Returns
+    -------
+    (bitmap_data, palette_data) : tuple of bytes
+
+    """
+    import numpy as np
+    max_colors = PALETTE_SIZES[mode]
+    codes = image_colors(image)
+    if palette_data is None:
+        palette = make_palette(codes, max_colors)
+        palette_data = np.pad(palette, (0, max_colors - len(palette))).astype('<u2').tobytes()
+    else:
+        palette = np.frombuffer(palette_data, dtype='<u2', count=min(len(palette_data) // 2, max_colors)) & 0x7FFF
+        palette_data = bytes(palette_data[:max_colors * 2])
+    indices = nearest_lut(palette.astype('<u2').tobytes())[codes]
+    if mode == '8bpp':
+        return (indices.tobytes(), palette_data)
+    return (pack4bpp(indices), palette_data)
+
+
+def pack4bpp(indices):
+    """
+    4bpp bitmap bytes of 2D array of color indices, low nybble is left pixel
+    """
+    import numpy as np
+    indices = np.asarray(indices, dtype=np.uint8)
+    if indices.shape[1] % 2:  # rows are byte aligned
+        indices = np.pad(indices, ((0, 0), (0, 1)))
+    return (indices[:, 0::2] | (indices[:, 1::2] << 4)).tobytes()
+
+
+def unpack4bpp(bitmap_data, width, height):
+    """
+    2D array of color indices of 4bpp bitmap bytes
+    """
+    import numpy as np
+    row_size = (width + 1) // 2
+    packed = np.frombuffer(bitmap_data, dtype=np.uint8, count=row_size * height).reshape(height, row_size)
+    indices = np.empty((height, row_size * 2), dtype=np.uint8)
+    indices[:, 0::2] = packed & 0xF
+    indices[:, 1::2] = packed >> 4
+    return indices[:, :width]
+
+
+def tile_numbers(width, height, tile_width, tile_height):
+    """
+    2D array of tile number of each pixel, tiles go in rows from top left corner.
+    Last column and row of tiles are cut, if size is not multiple of tile size.
+    Returns tuple of it and tiles count.
+    """
+    import numpy as np
+    columns = -(-width // tile_width)
+    rows = -(-height // tile_height)
+    numbers = (np.arange(height) // tile_height)[:, None] * columns + (np.arange(width) // tile_width)[None, :]
+    return (numbers, columns * rows)
+
+
+def split_tiles(image, tile_width, tile_height, clut_count, palette_data=None):
+    """
+    Encode PIL image to 4bpp bitmap with a 16 color CLUT per tile, chosen from
+    clut_count shared CLUTs.
+    Tiles are first grouped by their average color, then each group gets its
+    palette (see make_palette) and each tile moves to the CLUT, which gives it
+    least squared error, as in k-means with CLUTs as centers.
+    palette_data is raw CLUT set (16 colors per CLUT) to map tiles to instead,
+    it's returned as is.
+
+    Returns
+    -------
+    (bitmap_data, palette_data, tile_map) : tuple of bytes
+        4bpp bitmap, CLUT set of clut_count CLUTs and CLUT number of each tile
+
+    """
+    import numpy as np
+    codes = image_colors(image)
+    (tiles, tile_count) = tile_numbers(image.width, image.height, tile_width, tile_height)
+    if palette_data is not None:
+        palettes = [palette & 0x7FFF for palette in
+                    np.frombuffer(palette_data, dtype='<u2', count=len(palette_data) // 2).reshape(-1, TILE_CLUT_SIZE)]
+        labels = assign_tiles(codes, tiles, tile_count, palettes)
+    else:
+        if not 0 < clut_count <= MAX_TILE_CLUTS:
+            raise ValueError(f"CLUTs count should be 1 to {MAX_TILE_CLUTS}, not {clut_count}")
+        labels = group_tiles(codes, tiles, tile_count, clut_count)
+        group_count = labels.max() + 1
+        palettes = [None] * group_count
+        for _ in range(KMEANS_ITERATIONS):
+            pixel_labels = labels[tiles]
+            palettes = [make_palette(codes[pixel_labels == group], TILE_CLUT_SIZE) if (labels == group).any()
+                        else palettes[group] for group in range(group_count)]  # emptied group keeps its CLUT
+            new_labels = assign_tiles(codes, tiles, tile_count, palettes)
+            if np.array_equal(new_labels, labels):
+                break
+            labels = new_labels
+        palette_data = b''.join(np.pad(palette, (0, TILE_CLUT_SIZE - len(palette))).astype('<u2').tobytes()
+                                for palette in palettes)
+        palette_data += bytes(2 * TILE_CLUT_SIZE * (clut_count - len(palettes)))
+    luts = np.stack([nearest_lut(np.asarray(palette, dtype='<u2').tobytes()) for palette in palettes])
+    indices = luts[labels[tiles], codes]
+    return (pack4bpp(indices), palette_data, labels.astype(np.uint8).tobytes())
+
+
+def group_tiles(codes, tiles, tile_count, count):
+    """
+    Initial group number of each tile: up to count groups of tiles with close average colors
+    """
+    import numpy as np
+    rgb = code_rgb(codes.ravel()).astype(np.float64)
+    pixels = np.bincount(tiles.ravel(), minlength=tile_count).astype(np.float64)
+    means = np.stack([np.bincount(tiles.ravel(), weights=rgb[:, channel], minlength=tile_count)
+                      for channel in range(3)], axis=1) / pixels[:, None]
+    (_, labels) = kmeans(means, pixels, median_cut(means, pixels, count))
+    (_, labels) = np.unique(labels, return_inverse=True)  # drop empty groups
+    return labels
+
+
+def assign_tiles(codes, tiles, tile_count, palettes):
+    """
+    Number of palette with least sum of squared errors of pixels for each tile
+    """
+    import numpy as np
+    all_colors = code_rgb(np.arange(COLOR_COUNT))
+    errors = np.empty((len(palettes), tile_count))
+    for (num, palette) in enumerate(palettes):
+        palette = np.asarray(palette, dtype='<u2')
+        color_errors = ((all_colors - code_rgb(palette)[nearest_lut(palette.tobytes())]) ** 2).sum(axis=1)
+        errors[num] = np.bincount(tiles.ravel(), weights=color_errors[codes.ravel()], minlength=tile_count)
+    return errors.argmin(axis=0)
+
+
+def decode_tiles(bitmap_data, palette_data, tile_map, width, height, tile_width, tile_height):
+    """
+    Build RGB PIL image from raw 4bpp bitmap with a CLUT per tile, as made by split_tiles.
+    palette_data is raw CLUT set (16 colors per CLUT), tile_map is CLUT number of each tile.
+    """
+    import numpy as np
+    from PIL import Image
+    palettes = np.frombuffer(palette_data, dtype='<u2', count=len(palette_data) // 2).reshape(-1, TILE_CLUT_SIZE)
+    (tiles, tile_count) = tile_numbers(width, height, tile_width, tile_height)
+    labels = np.frombuffer(tile_map, dtype=np.uint8, count=tile_count)
+    colors = palettes[labels[tiles], unpack4bpp(bitmap_data, width, height)]
+    return Image.fromarray((code_rgb(colors) << 3).astype(np.uint8), 'RGB')
+
+
+def image_colors(image):
+    """
+    2D numpy array of 15 bit color codes of PIL image pixels
+    """
+    import numpy as np
+    rgb = np.asarray(image.convert('RGB'), dtype=np.uint16) >> 3
+    return rgb[:, :, 0] | (rgb[:, :, 1] << 5) | (rgb[:, :, 2] << 10)
+
+
+def code_rgb(codes):
+    """
+    5 bit R, G, B columns of 15 bit color codes
+    """
+    import numpy as np
+    codes = np.asarray(codes, dtype=np.int32)
+    return np.stack([codes & 0x1F, (codes >> 5) & 0x1F, (codes >> 10) & 0x1F], axis=-1)
+
+
+def rgb_code(rgb):
+    import numpy as np
+    rgb = np.clip(np.rint(rgb), 0, 0x1F).astype(np.uint16)
+    return rgb[:, 0] | (rgb[:, 1] << 5) | (rgb[:, 2] << 10)
+
+
+def nearest(points, centers):
+    """
+    Index of nearest (squared euclidean) center for each point, first one on ties.
+    Distances are computed in chunks to bound memory.
+    """
+    import numpy as np
+    points = np.asarray(points, dtype=np.float32)
+    centers = np.asarray(centers, dtype=np.float32)
+    center_norms = (centers ** 2).sum(axis=1)
+    result = np.empty(len(points), dtype=np.intp)
+    for start in range(0, len(points), NEAREST_CHUNK):
+        chunk = points[start:start + NEAREST_CHUNK]
+        distances = center_norms[None, :] - 2 * chunk @ centers.T  # point norm doesn't change argmin
+        result[start:start + NEAREST_CHUNK] = distances.argmin(axis=1)
+    return result
+
+
+def kmeans(points, weights, centers, iterations=KMEANS_ITERATIONS):
+    """
+    Weighted k-means refinement of given initial centers. Centers, which lost
+    all their points, are kept. Returns centers and index of center for each point.
+    """
+    import numpy as np
+    centers = np.array(centers, dtype=np.float64)
+    for _ in range(iterations):
+        labels = nearest(points, centers)
+        totals = np.bincount(labels, weights=weights, minlength=len(centers))
+        used = totals > 0
+        new_centers = centers.copy()
+        for channel in range(points.shape[1]):
+            sums = np.bincount(labels, weights=weights * points[:, channel], minlength=len(centers))
+            new_centers[used, channel] = sums[used] / totals[used]
+        if np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+    return (centers, nearest(points, centers))
+
+
+def median_cut(points, weights, count):
+    """
+    Split weighted points to up to count boxes, each time halving by weight the box
+    with the widest channel range. Returns weighted means of boxes.
+    """
+    import numpy as np
+    boxes = [np.arange(len(points))]
+    while len(boxes) < count:
+        ranges = [np.ptp(points[box], axis=0) if len(box) > 1 else np.zeros(points.shape[1]) for box in boxes]
+        widest = max(range(len(boxes)), key=lambda num: ranges[num].max())
+        if ranges[widest].max() == 0:
+            break
+        box = boxes[widest]
+        order = box[np.argsort(points[box, ranges[widest].argmax()], kind='stable')]
+        cumulative = np.cumsum(weights[order])
+        split = int(np.clip(np.searchsorted(cumulative, cumulative[-1] / 2), 1, len(order) - 1))
+        boxes[widest:widest + 1] = [order[:split], order[split:]]
+    return np.array([(points[box] * weights[box, None]).sum(axis=0) / weights[box].sum() for box in boxes])
+
+
+def make_palette(codes, count):
+    """
+    Palette of up to count 15 bit colors for 2D array of color codes
+    """
+    import numpy as np
+    (unique, first, counts) = np.unique(codes.ravel(), return_index=True, return_counts=True)
+    if len(unique) <= count:
+        return unique[np.argsort(first)].astype(np.uint16)
+    points = code_rgb(unique).astype(np.float64)
+    weights = counts.astype(np.float64)
+    (centers, _) = kmeans(points, weights, median_cut(points, weights, count))
+    return rgb_code(centers)
+
+
+@lru_cache(maxsize=LUT_CACHE_SIZE)
+def nearest_lut(palette_codes):
+    """
+    Lookup table of index of nearest palette color for each 15 bit color.
+    palette_codes is bytes of little endian 15 bit colors, so tables are cached by palette.
+    """
+    import numpy as np
+    palette = np.frombuffer(palette_codes, dtype='<u2')
+    lut = nearest(code_rgb(np.arange(COLOR_COUNT)), code_rgb(palette)).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+def chunker(seq, size):
+    return (seq[pos:pos + size] for pos in range(0, len(seq), size))   
+    
+# Convert array of 24bpp RGB pixels to 15bpp BGR Little Endian pixels bytes
+def pal24To15(colors):
+    palBytes = []
+    for group in chunker(colors, 3):
+        r = group[0] >> 3
+        g = group[1] >> 3
+        b = group[2] >> 3
+        colorRgb15 = ((b << 10) + (g << 5) + r).to_bytes(2, 'little')
+        palBytes += colorRgb15
+    return bytes(palBytes)
+# Convert 15bpp BGR Little Endian pixels bytes to 24bpp RGB array of int colors
+def pal15To24(palBytes):
+    colors = []
+    for group in chunker (palBytes, 2):
+        color = int.from_bytes(group, "little")
+        b = ((color >> 10) & 0x1F) << 3
+        g = ((color >> 5) & 0x1F) << 3
+        r = (color  & 0x1F) << 3
+        colors.append(r)
+        colors.append(g)
+        colors.append(b)
+
+    return colors
+
+def swapNybbles(data):      
+    swappedArray = map(lambda x: ((x & 0xF) << 4) | ((x >> 4) & 0xF), data)
+    return bytes(swappedArray)
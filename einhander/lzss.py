@@ -0,0 +1,657 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+lzss
+
+LZSS codec of "Einhander" game for PSX: compressed line chunks of graphics
+with pointer table. Works on bytes in memory, einlzss tool is a command line
+front end for it.
+
+Usage:
+    plain = lzss.decompress(packed, 0x800ae000, 0x35f9c, 0x20)
+    patched = lzss.pack(packed, plain, 0x800ae000, 0x35f9c, 0x32964, 0x400, 0x362c)
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from typing import NamedTuple
+from math import ceil
+from contextlib import nullcontext
+
+from einhander import profiling
+from einhander.binio import BitReader, BitWriter, read_u32le, write_u32le
+
+# compression commands: raw or lz:
+class RawEntry(NamedTuple):
+    value: int  # just raw byte
+
+
+class LzEntry(NamedTuple):
+    distance: int  # offset back in unpacked buffer, 12 bits
+    length: int  # copy count, 4 bits
+
+
+
+MAX_OFFSET = 0xFFE  # lz offset is encoded with 12 bits, 1-starting
+MAX_LEN = 0x11  # lz length is encoded with 8 bits
+POOL_CHUNKSIZE = 4  # line chunks per worker task
+
+
+class SilentBar:
+    """
+    Stand-in for click progress bar, when no progress output is wanted
+    (e.g. in worker processes)
+    """
+    def __init__(self, iterable=None):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def update(self, n_steps):
+        pass
+
+
+def progressbar(iterable=None, length=None, label=None, show=True):
+    if show:
+        import click
+        return click.progressbar(iterable, length=length, label=label)
+    return nullcontext(SilentBar(iterable))
+
+
+def deserialize(stream):
+    '''
+    Deserialize given bits stream to list of compress commands entries
+    starts with w16: size of compressed block and then lzss data
+    Parameters
+    ----------
+    stream : BitReader
+        input bits stream, read from compressed file
+
+    Returns
+    -------
+    entries : list of RawEntries or LzEntries
+    '''
+    stream_size = (stream.read(16)) * 8
+    assert stream_size > 0, "Compressed size is found zero, aborted!"
+    entries = []
+
+    while stream_size > 0: #read until size bytes are read
+        plain = stream.read_bool()
+        stream_size -= 1
+        if plain:
+            stream_size -= 8
+            if stream_size < 0:
+                break #not enough bits to read raw
+            entries.append(RawEntry(value=stream.read(8)))
+            
+        else:
+            stream_size -= 12
+            if stream_size < 0:
+                break #not enough bits to read dist
+            dist = stream.read(12) - 1            
+            if dist < 0: #signal for the end of stream
+                break
+            stream_size -= 4
+            if stream_size < 0:
+              break #not enough bits to read len         
+            count = stream.read(4) + 2            
+            entries.append(LzEntry(dist, count))
+    return entries
+
+
+def decode(entries):
+    '''
+    Decode given list of compression commands to plain bytes
+    Parameters
+    ----------
+    entries : list of RawEntries or LzEntries
+
+    Returns
+    -------
+    buffer : list of ints
+        plain buffer of decompressed bytes
+
+    '''
+    buffer = []
+    for ent in entries:
+        if isinstance(ent, RawEntry):
+            buffer.append(ent.value)
+        else:  # lz compression
+            # cycle buffer to decompress out from buffer bounds
+            cyclic_buffer = buffer[ent.distance:] * ent.length
+            buffer += cyclic_buffer[:ent.length]
+    return buffer
+
+def unpack_line_block (stream, base, start_offs, count):
+    """
+    unpacks block of lines (usually 8 pixels in height)
+    each line: is deserialized and then decoded, whole block is saved as separate file
+    usually its line with 8 pixels height
+
+    Parameters
+    ----------
+    stream : BitReader
+        input bits stream, read from compressed file 
+    base : int
+        RAM address, where file is loaded
+    start_offs: int
+        start of ptr table for lines
+    count: int
+        number of lines in ptr table
+
+    Returns
+    -------
+    buffer: list
+        List of bytes of unpacked buffer
+
+    """
+    ptrs = []
+    block_buffer = []
+    for n in range(count):
+        stream.pos = (start_offs + n* 0x20) * 8 #each line struct is 0x20 bytes
+        ptrs.append (stream.read_uintle(32) - base) #read appropriate ptr
+    for ptr in ptrs:
+        stream.pos = ptr*8
+        entries = deserialize(stream)
+        block_buffer.extend(decode(entries))#decode next line
+    return block_buffer
+
+def find_lz(lst, pos):
+    '''
+    find best lz match for given position and haystack list
+
+    Parameters
+    ----------
+    lst : list of ints
+        full plain file
+    pos : int
+        position in plain file to search an lz match
+
+    Returns
+    -------
+    LzEntry or None
+        found best lz entry for this position, if not found, return None
+
+    '''
+    def common_start_len(lst, hay_start, pos):
+        count = 0
+        while count < MAX_LEN and pos < len(lst) and lst[hay_start] == lst[pos]:
+            hay_start += 1
+            pos += 1
+            count += 1
+        return count
+
+    assert lst and pos < len(
+        lst), "find_lz: position out of bounds or empty list!"
+    candidates = []
+    # max offset back is 0xFF, haystack start from pos-0xFF, trimmed by 0
+    for hay_start in range(0, min (MAX_OFFSET, pos)):
+        common_len = common_start_len(lst, hay_start, pos)
+        if common_len >= 2:  # minimal efficient entry is 2 bytes long lz
+            candidates.append(
+                LzEntry(distance=hay_start, length=common_len))
+    # compare candidates first by length, next by earliest occurence
+    best = max(candidates, key=lambda ent: (ent.length, -ent.distance),
+               default=None)
+
+    return best
+
+
+def encode(lst, progress=False):
+    '''
+    encode given plain file to list of compression commands
+
+    Parameters
+    ----------
+    lst : list of ints
+        plain file to encode
+    progress : bool
+        show progress bar
+
+    Returns
+    -------
+    encoded: list of RawEntries or LzEntries
+
+    '''
+    pos = 0
+    encoded = []
+    with progressbar(length=len(lst),
+                     label='Encoding (1/2)', show=progress) as bar:
+        while pos < len(lst):
+            entry = find_lz(lst, pos)
+            if entry is None:  # no lz matches found, emit raw
+                encoded.append(RawEntry(lst[pos]))
+                pos += 1
+                bar.update(1)
+
+            else:  # lz match found, check if lazy parsing is more efficient:
+                skip_entry = find_lz(lst, pos + 1)
+                if isinstance(skip_entry, LzEntry) and skip_entry.length > entry.length:
+                    # dump raw + skip entry match
+                    encoded.append(RawEntry(lst[pos]))
+                    encoded.append(skip_entry)
+                    pos += skip_entry.length + 1
+                    bar.update(skip_entry.length + 1)
+                else:  # current lz match is most efficient, emit it
+                    encoded.append(entry)
+                    pos += entry.length
+                    bar.update(entry.length)
+    return encoded 
+
+
+def serialize(commands, progress=False):
+    '''
+    serialize given compression commands to bitstream
+
+    Parameters
+    ----------
+    commands : list of RawEntries or LzEntries
+    progress : bool
+        show progress bar
+
+    Returns
+    -------
+    bytes
+        compressed stream
+
+    '''
+    stream = BitWriter()
+    with progressbar(commands,
+                     label='Serializing (2/2)',
+                     length=len(commands), show=progress) as bar:
+        for command in bar:
+            if isinstance(command, RawEntry):  # serialize raw
+                stream.write_bool(True)
+                stream.write(command.value, 8)
+            else:  # serialize lz
+                stream.write_bool(False)
+                stream.write(command.distance + 1, 12)
+                stream.write(command.length - 2, 4)
+    size = ceil(len(stream)/8)
+    return size.to_bytes(2, 'big') + stream.tobytes() #prepend packed stream with size word
+
+def pack_line_block (plain, chunk_size, progress=False):
+    """
+    packs given file of merged lines in merged lzss blocks,
+    split by chunk_size. And return offsets to each line table.
+
+    Parameters
+    ----------
+    plain : list of ints
+        Merged plain lines pixel data.
+    chunk_size : int
+        Size of each line chunk in bytes
+    progress : bool
+        show progress bars
+
+    Returns
+    -------
+    Tuple: offsets, packed_block_bytes
+
+    """
+    def split_chunks(lst, n):
+        """
+        Yield successive n-sized chunks from lst.
+
+        """
+        for i in range(0, len(lst), n):
+            yield lst[i:i + n]
+            
+    chunks = split_chunks (plain, chunk_size)
+    block_bytes = bytes()
+    offsets = []
+    for chunk in chunks:
+        encoded = encode(chunk, progress)
+        serialized = serialize(encoded, progress)
+        offsets.append (len(block_bytes))
+        block_bytes += serialized
+    return (offsets, block_bytes)
+
+
+def encode_chunk(chunk):
+    """
+    Compress one plain line chunk to stream with size word. Worker function of pack_blocks.
+    """
+    return serialize(encode(list(chunk)))
+
+
+def pack_blocks(packed, blocks, jobs=None, progress=False):
+    """
+    Compress several blocks into one packed file buffer. Line chunks of all
+    blocks are encoded in one pool of worker processes, then all blocks are
+    checked to fit their space and only then patched, so a failed block leaves
+    buffer untouched.
+
+    Parameters
+    ----------
+    packed : bytearray or writable mmap
+        Packed file contents, patched in place
+    blocks : list of dicts
+        Each with plain (bytes) and base, ptr_table, block_start, chunk_size,
+        target_size ints, as arguments of pack_line_block and patch_line_block
+    jobs : int or None
+        Number of worker processes, None for CPU count, 1 to encode in this process
+    progress : bool
+        show progress bar of encoded chunks
+
+    Returns
+    -------
+    reports : list of dicts
+        count of chunks, packed_size and free bytes left of each block
+
+    """
+    counts = [ceil(len(block['plain']) / block['chunk_size']) for block in blocks]
+    spans = []  # (start, end, name) of all patched regions: block data and each pointer of tables
+    for (block, count) in zip(blocks, counts):
+        spans.append((block['block_start'], block['block_start'] + block['target_size'],
+                      f"block at 0x{block['block_start']:x}"))
+        spans += [(pos, pos + 4, f"pointer table at 0x{block['ptr_table']:x}")
+                  for pos in range(block['ptr_table'], block['ptr_table'] + 0x20 * count, 0x20)]
+    spans.sort()
+    for (span, next_span) in zip(spans, spans[1:]):
+        assert span[1] <= next_span[0], f"{span[2].capitalize()} and {next_span[2]} overlap, aborted!"
+    chunks = [block['plain'][pos:pos + block['chunk_size']]
+              for block in blocks for pos in range(0, len(block['plain']), block['chunk_size'])]
+    with profiling.stage('encode chunks', count=len(chunks)) as st:
+        with progressbar(length=len(chunks), label='Encoding chunks', show=progress) as bar:
+            if jobs == 1:
+                encoded = []
+                for chunk in chunks:
+                    encoded.append(encode_chunk(chunk))
+                    bar.update(1)
+            else:
+                with ProcessPoolExecutor(max_workers=jobs) as executor:
+                    encoded = []
+                    for data in executor.map(encode_chunk, chunks, chunksize=POOL_CHUNKSIZE):
+                        encoded.append(data)
+                        bar.update(1)
+        st.set(packed_size=sum(len(data) for data in encoded))
+
+    packed_blocks = []
+    first = 0
+    for (block, count) in zip(blocks, counts):
+        block_chunks = encoded[first:first + count]
+        first += count
+        offsets = list(accumulate((len(data) for data in block_chunks[:-1]), initial=0))[:count]
+        block_bytes = b''.join(block_chunks)
+        tail_len = block['target_size'] - len(block_bytes)
+        assert tail_len >= 0, f"Compressed block at 0x{block['block_start']:x} is larger, " \
+                              f"than block space by 0x{abs(tail_len):x}  bytes, aborted!"
+        packed_blocks.append((offsets, block_bytes))
+    with profiling.stage('patch', blocks=len(blocks)) as st:
+        for (block, (offsets, block_bytes)) in zip(blocks, packed_blocks):
+            patch_line_block(packed, block['base'], block['ptr_table'], block['block_start'],
+                             offsets, block_bytes, block['target_size'])
+            st.add_written(block['target_size'] + 4 * len(offsets))
+    return [{'count': len(offsets), 'packed_size': len(block_bytes), 'free': block['target_size'] - len(block_bytes)}
+            for (block, (offsets, block_bytes)) in zip(blocks, packed_blocks)]
+
+
+def patch_line_block(packed, base, ptr_table_offset, block_start_offset, offsets, block_bytes, target_size):
+    """
+    Patch packed file buffer with compressed block and its pointer table.
+    Free space up to target_size is zero filled.
+
+    Parameters
+    ----------
+    packed : bytearray
+        Packed file contents, patched in place
+    base : int
+        RAM address, where file is loaded
+    ptr_table_offset : int
+        file offset of first pointer in table
+    block_start_offset : int
+        file offset of first block to place to
+    offsets : list of ints
+        offsets of each line chunk in block, as returned by pack_line_block
+    block_bytes : bytes
+        compressed block
+    target_size : int
+        original size for compressed chunks, which patched block must fit in
+
+    Returns
+    -------
+    None.
+
+    """
+    packed_size = len (block_bytes)
+    tail_len = target_size - packed_size
+    assert tail_len >= 0, f"Compressed block is larger, than block space by 0x{abs(tail_len):x}  bytes, aborted!"
+    tail_bytes = bytes([0]*tail_len)
+
+    ptrs = [base + block_start_offset + offset for offset in offsets] #calc RAM pointers
+    for num, ptr in enumerate (ptrs): #patch pointer table
+        pos = ptr_table_offset + 0x20*num
+        write_u32le(packed, pos, ptr)
+    packed[block_start_offset:block_start_offset + target_size] = block_bytes + tail_bytes
+
+
+def read_line_chunks(packed, base, ptr_table_offset, count):
+    """
+    Locate and decode each compressed line chunk of packed file.
+
+    Parameters
+    ----------
+    packed : bytes
+        Packed file contents
+    base : int
+        RAM address, where file is loaded
+    ptr_table_offset : int
+        file offset of first pointer in table
+    count : int
+        number of lines in ptr table
+
+    Returns
+    -------
+    chunks : list of tuples
+        (file offset, compressed size with size word, plain bytes) for each line chunk
+
+    """
+    stream = BitReader(packed)
+    chunks = []
+    for n in range(count):
+        offset = read_u32le(packed, ptr_table_offset + n * 0x20) - base
+        stream.pos = offset * 8
+        plain = bytes(decode(deserialize(stream)))
+        packed_len = 2 + int.from_bytes(packed[offset:offset + 2], 'big')
+        chunks.append((offset, packed_len, plain))
+    return chunks
+
+
+def allocate(free, size):
+    """
+    First fit allocation of size bytes in free list of (start, end) gaps.
+    Returns start offset or None, free list is updated in place.
+    """
+    for num, (start, end) in enumerate(free):
+        if end - start >= size:
+            free[num] = (start + size, end)
+            return start
+    return None
+
+
+def release(free, start, end):
+    """
+    Return (start, end) gap to sorted free list, merging adjacent gaps.
+    """
+    free.append((start, end))
+    free.sort()
+    merged = []
+    for (gap_start, gap_end) in free:
+        if merged and gap_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], gap_end))
+        elif gap_end > gap_start:
+            merged.append((gap_start, gap_end))
+    free[:] = merged
+
+
+def repack_line_block(packed, plain, base, ptr_table_offset, block_start_offset, chunk_size, target_size,
+                      count=None):
+    """
+    Re-encode only changed line chunks of packed file in place.
+    Changed chunks, which fit their old place, are written there.
+    Grown chunks are moved to first free gap of the block (chunk tails, block tail),
+    only their pointers are updated. If there is no suitable gap, the whole block is
+    laid out again, with unchanged chunks copied verbatim.
+
+    Parameters
+    ----------
+    packed : bytearray
+        Packed file contents, patched in place
+    plain : bytes
+        New merged plain lines pixel data
+    base : int
+        RAM address, where file is mapped to
+    ptr_table_offset : int
+        file offset of first pointer in table
+    block_start_offset : int
+        file offset of first block
+    chunk_size : int
+        Size of each line chunk in bytes
+    target_size : int
+        original size for compressed chunks, which patched block must fit in
+    count : int or None
+        number of pointers in table. If given, plain data must have as many chunks.
+        Otherwise it's taken from plain data size, and decoded old chunks must have
+        the same size as plain data
+
+    Returns
+    -------
+    report : dict
+        dirty chunk numbers, moved chunk numbers, encode time in seconds,
+        free bytes left in block and list of (start, end) patched file regions
+
+    """
+    block_end = block_start_offset + target_size
+    plain_count = ceil(len(plain) / chunk_size)
+    assert count is None or count == plain_count, \
+        f"Plain data has {plain_count} chunks, but pointer table has {count}, aborted!"
+    count = plain_count
+    with profiling.stage('decode chunks', count=count):
+        chunks = read_line_chunks(packed, base, ptr_table_offset, count)
+        old_size = sum(len(old_plain) for (_, _, old_plain) in chunks)
+        assert old_size == len(plain), \
+            f"Plain data is 0x{len(plain):x} bytes, but packed chunks are 0x{old_size:x} bytes, aborted!"
+        dirty = [num for (num, (_, _, old_plain)) in enumerate(chunks)
+                 if old_plain != plain[num * chunk_size:(num + 1) * chunk_size]]
+
+    start_time = time.perf_counter()
+    with profiling.stage('encode chunks', count=len(dirty)) as st:
+        encoded = {num: serialize(encode(list(plain[num * chunk_size:(num + 1) * chunk_size]), False), False)
+                   for num in dirty}
+        st.set(packed_size=sum(len(data) for data in encoded.values()))
+    encode_time = time.perf_counter() - start_time
+
+    # free gaps: from each chunk end to next chunk start, and block tail
+    order = sorted(range(count), key=lambda num: chunks[num][0])
+    free = []
+    for (cur, nxt) in zip(order, order[1:] + [None]):
+        slot_end = chunks[nxt][0] if nxt is not None else block_end
+        release(free, chunks[cur][0] + chunks[cur][1], slot_end)
+
+    placement = {num: chunks[num][0] for num in range(count)}
+    regions = []
+    tail = None
+    grown = []
+    for num in dirty:
+        (offset, packed_len, _) = chunks[num]
+        if len(encoded[num]) <= packed_len:
+            release(free, offset + len(encoded[num]), offset + packed_len)
+        else:
+            grown.append(num)
+    moved = []
+    for num in grown:  # free old places first, so grown chunks can swap places
+        release(free, chunks[num][0], chunks[num][0] + chunks[num][1])
+    for num in grown:
+        placement[num] = allocate(free, len(encoded[num]))
+        moved.append(num)
+    if None in placement.values():  # no gap fits: lay out whole block again
+        cursor = block_start_offset
+        moved = []
+        for num in order:
+            placement[num] = cursor
+            if cursor != chunks[num][0]:
+                moved.append(num)
+            cursor += len(encoded[num]) if num in encoded else chunks[num][1]
+        tail_len = block_end - cursor
+        assert tail_len >= 0, f"Compressed block is larger, than block space by 0x{abs(tail_len):x}  bytes, aborted!"
+        free = [(cursor, block_end)]
+        tail = (cursor, block_end)
+
+    old_bytes = {num: bytes(packed[offset:offset + packed_len]) for (num, (offset, packed_len, _)) in enumerate(chunks)}
+    for num in sorted(set(dirty) | set(moved), key=lambda num: placement[num]):
+        data = encoded.get(num, old_bytes[num])
+        packed[placement[num]:placement[num] + len(data)] = data
+        regions.append((placement[num], placement[num] + len(data)))
+        if placement[num] != chunks[num][0]:
+            pos = ptr_table_offset + 0x20 * num
+            packed[pos:pos + 4] = (base + placement[num]).to_bytes(4, 'little')
+            regions.append((pos, pos + 4))
+    if tail is not None:  # block was laid out again: zero fill free space, as pack leaves it
+        packed[tail[0]:tail[1]] = bytes(tail[1] - tail[0])
+        regions.append(tail)
+    return {'dirty': dirty, 'moved': sorted(moved), 'encode_time': encode_time,
+            'free': sum(end - start for (start, end) in free), 'regions': sorted(regions)}
+
+
+def decompress(packed, base, ptr_table_offset, count):
+    """
+    Decompress line chunks of packed file and merge them.
+
+    Parameters
+    ----------
+    packed : bytes-like
+        Packed file contents
+    base : int
+        RAM address, where file is loaded
+    ptr_table_offset : int
+        file offset of first pointer in table
+    count : int
+        number of lines in ptr table
+
+    Returns
+    -------
+    bytes
+        merged plain chunks
+
+    """
+    return bytes(unpack_line_block(BitReader(packed), base, ptr_table_offset, count))
+
+
+def pack(packed, plain, base, ptr_table_offset, block_start_offset, chunk_size, target_size, progress=False):
+    """
+    Compress plain data in chunks into copy of packed file.
+    Arguments are as for pack_line_block and patch_line_block.
+
+    Returns
+    -------
+    bytes
+        patched packed file contents
+
+    """
+    (offsets, block_bytes) = pack_line_block(plain, chunk_size, progress)
+    patched = bytearray(packed)
+    patch_line_block(patched, base, ptr_table_offset, block_start_offset, offsets, block_bytes, target_size)
+    return bytes(patched)
+
+
+def repack(packed, plain, base, ptr_table_offset, block_start_offset, chunk_size, target_size, count=None):
+    """
+    Compress only changed chunks of plain data into copy of packed file.
+    Arguments are as for repack_line_block.
+
+    Returns
+    -------
+    (bytes, dict)
+        patched packed file contents and report of repack_line_block
+
+    """
+    patched = bytearray(packed)
+    report = repack_line_block(patched, plain, base, ptr_table_offset, block_start_offset, chunk_size, target_size,
+                               count)
+    return (bytes(patched), report)
@@ -0,0 +1,290 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+profiling
+
+Per stage wall and CPU time, bytes read and written and peak RSS of tool runs.
+Stages are saved as Chrome trace JSON (open in chrome://tracing or
+https://ui.perfetto.dev) and/or printed as a summary with cProfile list of the
+hottest functions. When profiling is not enabled, stages cost next to nothing.
+
+Usage in tool:
+    with profiling.stage('encode') as st:
+        ...
+        st.add_read(len(plain))
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TOP_FUNCTIONS = 20
+
+
+def _windows_peak_rss():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t)]
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    get_process = ctypes.windll.kernel32.GetCurrentProcess
+    get_process.restype = wintypes.HANDLE
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(get_process(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def peak_rss():
+    """
+    Peak resident set size in bytes of this process and of its finished child
+    processes (pool workers). Unknown values are None.
+    """
+    if resource is None:
+        try:
+            return (_windows_peak_rss(), None)
+        except (ImportError, AttributeError, OSError):
+            return (None, None)
+    scale = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in KiB on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def files_size(paths):
+    """
+    Total size of existing files in paths
+    """
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+class Stage:
+    """
+    Counters of one running stage. Tool code reports bytes and extra values to it.
+    """
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def add_read(self, count):
+        self.bytes_read += count
+
+    def add_written(self, count):
+        self.bytes_written += count
+
+    def add_read_files(self, paths):
+        self.bytes_read += files_size(paths)
+
+    def add_written_files(self, paths):
+        self.bytes_written += files_size(paths)
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+class NullStage(Stage):
+    """
+    Stage of disabled profiler: all reports are ignored, files are not even stat'ed.
+    """
+
+    def __init__(self):
+        super().__init__(None, {})
+
+    def add_read(self, count):
+        pass
+
+    def add_written(self, count):
+        pass
+
+    def add_read_files(self, paths):
+        pass
+
+    def add_written_files(self, paths):
+        pass
+
+    def set(self, **args):
+        pass
+
+
+NULL_STAGE = NullStage()
+
+
+class Profiler:
+    """
+    Collects stages of one tool run.
+
+    Parameters
+    ----------
+    name : str
+        Name of the run, e.g. tool and command
+    trace_name : str or None
+        Chrome trace JSON file name to save stages to
+    profile : bool
+        print stages summary and run cProfile to list the hottest functions.
+        With trace_name, cProfile stats are also dumped to trace_name + '.prof'
+    """
+
+    def __init__(self, name, trace_name=None, profile=False):
+        self.name = name
+        self.trace_name = trace_name
+        self.events = []
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.cpu_origin = time.process_time()
+        self.cprofile = None
+        if profile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def timestamp(self, moment):
+        return (moment - self.origin) * 1e6  # trace times are in microseconds
+
+    @contextmanager
+    def stage(self, name, **args):
+        current = Stage(name, args)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield current
+        finally:
+            self.add_event(current, wall_start, time.perf_counter() - wall_start,
+                           time.process_time() - cpu_start)
+
+    def add_event(self, current, wall_start, wall, cpu):
+        (rss, children_rss) = peak_rss()
+        args = dict(current.args)
+        args.update(cpu_ms=round(cpu * 1000, 3), bytes_read=current.bytes_read,
+                    bytes_written=current.bytes_written, peak_rss=rss)
+        if children_rss:
+            args['children_peak_rss'] = children_rss
+        self.events.append({'name': current.name, 'cat': 'stage', 'ph': 'X',
+                            'ts': round(self.timestamp(wall_start), 3), 'dur': round(wall * 1e6, 3),
+                            'pid': self.pid, 'tid': 0, 'args': args})
+
+    def finish(self):
+        """
+        Stop profiling, save trace and print summary
+        """
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        total = Stage(self.name, {'argv': sys.argv[1:]})
+        for event in self.events:
+            total.add_read(event['args']['bytes_read'])
+            total.add_written(event['args']['bytes_written'])
+        self.add_event(total, self.origin, time.perf_counter() - self.origin,
+                       time.process_time() - self.cpu_origin)
+        if self.trace_name:
+            self.save_trace()
+            print(f"Trace saved to {self.trace_name}", file=sys.stderr)
+        if self.cprofile is not None:
+            self.print_summary()
+            self.print_functions()
+
+    def save_trace(self):
+        meta = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0, 'args': {'name': self.name}}]
+        with open(self.trace_name, 'w') as trace_file:
+            json.dump({'traceEvents': meta + self.events, 'displayTimeUnit': 'ms'}, trace_file, indent=1)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(self.trace_name + '.prof')
+
+    def print_summary(self, out=sys.stderr):
+        print(f"{'Stage':<32} {'Wall ms':>10} {'CPU ms':>10} {'Read':>10} {'Written':>10} {'Peak RSS':>10}",
+              file=out)
+        for event in self.events:
+            args = event['args']
+            rss = args['peak_rss']
+            rss_text = f"{rss / 2**20:.1f} MiB" if rss else '-'
+            print(f"{event['name'][:32]:<32} {event['dur'] / 1000:>10.1f} {args['cpu_ms']:>10.1f} "
+                  f"{args['bytes_read']:>10} {args['bytes_written']:>10} {rss_text:>10}", file=out)
+
+    def print_functions(self, out=sys.stderr, count=TOP_FUNCTIONS):
+        import pstats
+        print(f"\nTop {count} functions by own time:", file=out)
+        pstats.Stats(self.cprofile, stream=out).sort_stats('tottime').print_stats(count)
+
+
+_active = None
+
+
+def enable(name=None, trace_name=None, profile=False):
+    """
+    Start profiling of this run. Returns profiler, call its finish() at the end of the run.
+    """
+    global _active
+    if name is None:
+        name = os.path.basename(sys.argv[0])
+    _active = Profiler(name, trace_name, profile)
+    return _active
+
+
+def disable():
+    """
+    Drop active profiler, so following stages are not timed. For processes,
+    which run many tool commands one after another.
+    """
+    global _active
+    _active = None
+
+
+def stage(name, **args):
+    """
+    Context manager timing a stage of active profiler, yields Stage to report bytes to.
+    With no active profiler, does nothing.
+    """
+    if _active is None:
+        return nullcontext(NULL_STAGE)
+    return _active.stage(name, **args)
+
+
+def click_options(command):
+    """
+    Decorator adding --profile and --trace options to click group or command.
+    Decorated callback must accept 'profile' and 'trace' arguments and pass them to
+    setup_click.
+    """
+    import click
+    command = click.option('--trace', type=click.Path(dir_okay=False), default=None,
+                           help='Save per stage timings, bytes and peak RSS to Chrome trace JSON file.')(command)
+    return click.option('--profile', is_flag=True,
+                        help='Print per stage summary and the hottest functions (cProfile).')(command)
+
+
+def setup_click(profile, trace):
+    """
+    Enable profiling for current click context, if requested. Profiler is finished
+    when the command completes, even on errors.
+    """
+    if profile or trace:
+        import click
+        ctx = click.get_current_context()
+        name = ' '.join(filter(None, [ctx.info_name, ctx.invoked_subcommand]))
+        ctx.call_on_close(enable(name, trace, profile).finish)
@@ -0,0 +1,116 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+vab
+
+Pseudo VAB files of "Einhander" game for PSX: 0x2000 bytes header with table
+of ADPCM bodies sizes, bodies and last sector. Works on bytes in memory,
+einvab tool is a command line front end for it.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import math
+
+from einhander.binio import read_u16le, write_u16le
+
+SECTOR_SIZE = 0x800
+HEADER_SIZE = 0x2000
+MAX_ADPCM_SIZE = 0x39000  # SPU memory for bodies
+
+
+def get_offsets(data, tbl_offs):
+    """
+    Get start of VAGs and each file sizes from header in VAB
+
+    Parameters
+    ----------
+    data : bytes-like
+        VAB file contents
+    tbl_offs : int
+        Offset of size table in VAG's header
+
+    Returns
+    -------
+    start : int
+        Start of first VAG
+    sizes : list of ints
+        List of sizes for each of VAG file
+
+    """
+    sizes = []
+    # HEADER_SIZE header size
+    start = HEADER_SIZE + read_u16le(data, tbl_offs) * 8
+    pos = tbl_offs + 2
+    while True:
+        size = read_u16le(data, pos) * 8
+        pos += 2
+        if size == 0:
+            return (start, sizes)
+        sizes.append(size)
+
+
+def split(data, tbl_offs):
+    """
+    Split VAB file contents to header, ADPCM bodies and last sector
+
+    Parameters
+    ----------
+    data : bytes-like
+        VAB file contents
+    tbl_offs : int
+        Offset of size table in VAG's header
+
+    Returns
+    -------
+    (header, bodies, last_sector) : tuple
+        bytes, list of bytes and bytes
+
+    """
+    (start, sizes) = get_offsets(data, tbl_offs)
+    bodies = []
+    for size in sizes:
+        bodies.append(bytes(data[start:start + size]))
+        start += size
+    return (bytes(data[:HEADER_SIZE]), bodies, bytes(data[len(data) - SECTOR_SIZE:]))
+
+
+def merge(header, bodies, last_sector, tbl_offs):
+    """
+    Build VAB file contents from header, ADPCM bodies and last sector.
+    Bodies sizes and sectors count are patched in header, bodies are
+    aligned to sector before last sector.
+
+    Parameters
+    ----------
+    header : bytes-like
+        Original header
+    bodies : list of bytes-like
+        ADPCM bodies in packing order
+    last_sector : bytes-like
+        Original last sector
+    tbl_offs : int
+        Offset of size table in VAG's header
+
+    Returns
+    -------
+    bytes
+        VAB file contents
+
+    """
+    hdr_data = bytearray(header)
+    pos = tbl_offs
+    write_u16le(hdr_data, pos, 0)  # start with zero offset
+    for body in bodies:
+        assert len(body) >> 3 <= 0xFFFF, "Size overflows 16 bits!"
+        pos += 2
+        write_u16le(hdr_data, pos, len(body) >> 3)
+    adpcm_size = sum(len(body) for body in bodies)
+    # check if vab will fit SPU memory:
+    assert adpcm_size <= MAX_ADPCM_SIZE, f"Max ADPCM size exceeded: 0x{adpcm_size - MAX_ADPCM_SIZE:x}!"
+    # end of header - 4 bytes of sector-size
+    write_u16le(hdr_data, 0x1FFC, math.ceil(adpcm_size / SECTOR_SIZE))
+    out_size = len(hdr_data) + adpcm_size  # align up to sector size
+    align_size = SECTOR_SIZE - (out_size % SECTOR_SIZE)
+    return b''.join([hdr_data] + list(bodies) + [bytes(align_size), last_sector])
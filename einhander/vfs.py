@@ -0,0 +1,177 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+vfs
+
+BININDEX and BINPACK virtual file system of "Einhander" game for PSX: one
+BININDEX sector of offset-size pairs per folder, each folder is one BINPACK
+file of sector aligned members. Works on bytes in memory, einpack tool is
+a command line front end for it. Folders of member files are packed to
+BINPACK files on disk with pack_files, copying members without reading them.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import os
+import re
+from einhander.binio import copy_file_data, preallocate, read_u16le, write_u16le
+
+SECTOR_SIZE = 0x800
+SECTOR_SIZE_BITCOUNT = 11  # 1 << 11 = 0x800
+MAX_SECTOR_ENTRIES = 0x800/4  # 2 16-bit words per entry
+
+
+def deserialize_binindex(data, dir_num):
+    """
+    Process BININDEX.BIN file and collect offset-size tuples for given folder number
+
+    Parameters
+    ----------
+    data : bytes-like
+        Input file contents
+    dir_num : Int
+        Number of folder to process tuples
+
+    Returns
+    -------
+    result : list
+        Offset-Size tuples (in sectors)
+
+    """
+    result = []
+    pos = dir_num * SECTOR_SIZE
+    while True:
+        offs = read_u16le(data, pos)
+        size = read_u16le(data, pos + 2)
+        pos += 4
+        # no more files or full sector read
+        if size == 0 or len(result) >= MAX_SECTOR_ENTRIES:
+            return result
+        result.append((offs, size))
+
+
+def read_index(data):
+    """
+    Offset-size tuples (in sectors) of all folders of BININDEX.BIN contents, 1 sector per folder
+    """
+    return [deserialize_binindex(data, num) for num in range(len(data) // SECTOR_SIZE)]
+
+
+def unpack_members(pack_data, tuples):
+    """
+    Split BINPACK{n}.BIN contents to member files.
+
+    Parameters
+    ----------
+    pack_data : bytes-like
+        BINPACK file contents
+    tuples : list
+        Offset-Size tuples of its folder (in sectors)
+
+    Returns
+    -------
+    members : list of bytes
+
+    """
+    return [bytes(pack_data[offs * SECTOR_SIZE:(offs + size) * SECTOR_SIZE]) for (offs, size) in tuples]
+
+
+def pack_members(members):
+    """
+    Join member files to new BINPACK{n}.BIN contents.
+
+    Parameters
+    ----------
+    members : list of bytes-like
+        Sector aligned files of folder in packing order
+
+    Returns
+    -------
+    (pack_data, tuples) : tuple
+        BINPACK file contents and its offset-size tuples (in bytes)
+
+    """
+    tuples = []
+    offs = 0
+    for data in members:
+        size = len(data)
+        assert size & (SECTOR_SIZE - 1) == 0, "File size not sector aligned, aborted!"
+        tuples.append((offs, size))
+        offs = offs + size
+    return (b''.join(members), tuples)
+
+
+def serialize_binindex(tuples):
+    """
+    Build new BININDEX.BIN contents with offset-size tuples per each sector
+
+    Parameters
+    ----------
+    tuples : list of list
+        Each folder offset-size tuples (in bytes)
+
+    Returns
+    -------
+    bytes
+        BININDEX file contents
+
+    """
+    idx_data = bytearray()
+    for dir_tuples in tuples:
+        sector = bytearray(4 * len(dir_tuples))
+        for (num, (offs, size)) in enumerate(dir_tuples):
+            write_u16le(sector, num * 4, offs >> SECTOR_SIZE_BITCOUNT)
+            write_u16le(sector, num * 4 + 2, size >> SECTOR_SIZE_BITCOUNT)
+        idx_data += sector
+        idx_data += bytes(SECTOR_SIZE - (len(idx_data) % SECTOR_SIZE))
+    return bytes(idx_data)
+
+
+def member_order(file_name):
+    """
+    Sort key of member file name: numbers in name are compared as numbers,
+    so unpacked 100.bin goes after 99.bin, the rest is compared as text
+    """
+    return [(int(part), part) if part.isdigit() else (-1, part) for part in re.split(r'(\d+)', file_name)]
+
+
+def list_members(dir_name):
+    """
+    Member files of folder in packing order, see member_order
+    """
+    names = [name for name in os.listdir(dir_name) if os.path.isfile(os.path.join(dir_name, name))]
+    return [os.path.join(dir_name, name) for name in sorted(names, key=member_order)]
+
+
+def pack_files(file_names, pack_name):
+    """
+    Write new BINPACK{n}.BIN file of given member files. All sizes are checked
+    before writing, output file is preallocated and members are copied to
+    their offsets without reading them to memory.
+
+    Parameters
+    ----------
+    file_names : list of str
+        Sector aligned files of folder in packing order
+    pack_name : str
+        BINPACK file name
+
+    Returns
+    -------
+    tuples : list
+        Offset-size tuples (in bytes)
+
+    """
+    tuples = []
+    offs = 0
+    for file_name in file_names:
+        size = os.path.getsize(file_name)
+        assert size & (SECTOR_SIZE - 1) == 0, f"File {file_name} size not sector aligned, aborted!"
+        tuples.append((offs, size))
+        offs = offs + size
+    with open(pack_name, 'wb') as pack_file:
+        preallocate(pack_file, offs)
+        for (file_name, (offs, size)) in zip(file_names, tuples):
+            copy_file_data(file_name, pack_file, offs, size)
+    return tuples
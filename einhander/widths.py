@@ -0,0 +1,98 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+widths
+
+Width tables of fonts of "Einhander" game for PSX: binary and JSON codecs
+for glyph records. width_table tool and its GUI are front ends for it.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import json
+import numpy as np
+
+FIELD_SCHEMA = {
+    "name": "",
+    "x": 0,
+    "y": 0,
+    "w": 1,
+    "h": 1,
+    "leftMargin": 0,
+    "topMargin": 0,
+    "rightMargin": 0,
+    "unknown1": 0,
+    "trimLeft": 0,
+    "trimRight": 0,
+    "unknown2": 0,
+    "unknown3": 0
+}
+
+# 12 bytes binary record; w and h are stored decremented by 1
+RECORD_FIELDS = ["x", "y", "w", "h", "leftMargin", "topMargin", "rightMargin",
+                 "unknown1", "trimLeft", "trimRight", "unknown2", "unknown3"]
+RECORD_DTYPE = np.dtype([(field, 'u1') for field in RECORD_FIELDS])
+FIRST_CODE = 0x20  # first glyph in table is space
+LINE_BREAK = '\\n'  # line break sequence in script dumps
+
+
+def decode_table(data):
+    """
+    Decode binary width table to structured array, w and h are returned as stored (decremented)
+    """
+    if len(data) % RECORD_DTYPE.itemsize != 0:
+        raise ValueError("Invalid file size")
+    return np.frombuffer(data, dtype=RECORD_DTYPE)
+
+
+def encode_table(records):
+    """
+    Encode structured array of records to binary width table
+    """
+    return np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes()
+
+
+def records_to_rects(records, first_code=FIRST_CODE):
+    """
+    Convert structured records array to list of glyph dicts in FIELD_SCHEMA order,
+    named by their codes.
+    """
+    columns = {field: records[field].astype(int) for field in RECORD_FIELDS}
+    columns["w"] += 1
+    columns["h"] += 1
+    columns = {field: values.tolist() for field, values in columns.items()}
+    return [{k: (f"glyph_{first_code + i:X}" if k == "name" else columns[k][i]) for k in FIELD_SCHEMA}
+            for i in range(len(records))]
+
+
+def rects_to_records(rects):
+    """
+    Convert list of glyph dicts to structured records array. Missing fields are zero.
+    """
+    values = np.array([[r.get(k, 0) for k in RECORD_FIELDS] for r in rects], dtype=np.int64).reshape(-1, len(RECORD_FIELDS))
+    values[:, 2:4] = np.maximum(0, values[:, 2:4] - 1)
+    if values.size and (values.min() < 0 or values.max() > 0xFF):
+        raise ValueError("Field value does not fit in a byte")
+    records = np.empty(len(values), dtype=RECORD_DTYPE)
+    for num, field in enumerate(RECORD_FIELDS):
+        records[field] = values[:, num]
+    return records
+
+
+def rects_from_binary(data):
+    return records_to_rects(decode_table(data))
+
+
+def rects_to_binary(rects):
+    return encode_table(rects_to_records(rects))
+
+
+def rects_from_json(text):
+    return [{k: (int(str(v), 16) if isinstance(FIELD_SCHEMA[k], int) else v) for k, v in entry.items()}
+            for entry in json.loads(text)]
+
+
+def rects_to_json(rects):
+    return json.dumps([{k: (f"0x{int(v):X}" if isinstance(FIELD_SCHEMA[k], int) else v) for k, v in r.items()}
+                       for r in rects], indent=2)
@@ -10,49 +10,23 @@ License:   MIT License https://opensource.org/licenses/mit-license.php
 '''
 
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from shutil import rmtree
 import click
-from bitstring import ConstBitStream, Bits
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander import profiling, vfs  # noqa: E402
+from einhander.binio import read_file  # noqa: E402
+from einhander.vfs import SECTOR_SIZE  # noqa: E402
 
 
 @click.group()
-def cli():
+@profiling.click_options
+def cli(profile, trace):
     """A tool to unpack and pack BININDEX and BINPACK VFS files for PSX game 'Einhander'
     """
-    pass
-
-
-SECTOR_SIZE = 0x800
-SECTOR_SIZE_BITCOUNT = 11  # 1 << 11 = 0x800
-MAX_SECTOR_ENTRIES = 0x800/4  # 2 16-bit words per entry
-
-
-def deserialize_binindex(stream, dir_num):
-    """
-    Process BININDEX.BIN file and collect offset-size tuples for given folder number
-
-    Parameters
-    ----------
-    stream : bitstring
-        Input file stream
-    dir_num : Int
-        Number of folder to process tuples
-
-    Returns
-    -------
-    result : list
-        Offset-Size tuples (in sectors)
-
-    """
-    result = []
-    stream.bytepos = dir_num * SECTOR_SIZE
-    while True:
-        offs = stream.read('uintle:16')
-        size = stream.read('uintle:16')
-        # no more files or full sector read
-        if size == 0 or len(result) >= MAX_SECTOR_ENTRIES:
-            return result
-        result.append((offs, size))
+    profiling.setup_click(profile, trace)
 
 
 def unpack_dir(dir_num, tuples):
@@ -75,12 +49,10 @@ def unpack_dir(dir_num, tuples):
     if os.path.exists(dir_name):
         rmtree(dir_name)
     os.mkdir(dir_name)
-    file_num = 0
-    with open(f"BINPACK{dir_num}.BIN", "rb") as pack_file:
-        for (file_num, (offs, size)) in enumerate(tuples):
-            pack_file.seek(offs * SECTOR_SIZE)
-            with open(dir_name + f"\\{file_num:02}.bin", "wb") as end_file:
-                end_file.write(pack_file.read(size * SECTOR_SIZE))
+    members = vfs.unpack_members(read_file(f"BINPACK{dir_num}.BIN"), tuples)
+    for (file_num, data) in enumerate(members):
+        with open(dir_name + f"\\{file_num:02}.bin", "wb") as end_file:
+            end_file.write(data)
 
 
 @cli.command(name='unpack', short_help='unpack binindex and binpacks to folders')
@@ -90,12 +62,16 @@ def unpack_index():
     corresponding folders. Files in each folder will be named
     in continuous numbering.
     """
-    idx_stream = ConstBitStream(filename="BININDEX.BIN")
-    # 1 sector per dir. 800 bytes per sector, 8 bits per byte.
-    dir_count = len(idx_stream) >> 14
-    for num in range(dir_count):
-        tuples = deserialize_binindex(idx_stream, num)
-        unpack_dir(num, tuples)
+    with profiling.stage('read index') as st:
+        idx_data = read_file("BININDEX.BIN")
+        st.add_read(len(idx_data))
+        dir_tuples = vfs.read_index(idx_data)
+    for (num, tuples) in enumerate(dir_tuples):
+        with profiling.stage(f'unpack dir {num}', files=len(tuples)) as st:
+            unpack_dir(num, tuples)
+            size = sum(size for (_, size) in tuples) * SECTOR_SIZE
+            st.add_read(size)
+            st.add_written(size)
 
 
 def pack_dir(dir_name):
@@ -115,22 +91,7 @@ def pack_dir(dir_name):
         Collected offset-size tuples (in bytes)
 
     """
-
-    tuples = []
-    offs = 0
-    with open(f"BINPACK{dir_name}.BIN", "wb") as pack_file:
-        for file in os.listdir(dir_name):
-            current_name = os.path.join(dir_name, file)
-            if os.path.isfile(current_name):
-                with open(current_name, "rb") as end_file:
-                    data = end_file.read()
-                    size = len(data)
-                    assert size & (
-                        SECTOR_SIZE - 1) == 0, "File size not sector aligned, aborted!"
-                    tuples.append((offs, size))
-                    offs = offs + size
-                    pack_file.write(data)
-    return tuples
+    return vfs.pack_files(vfs.list_members(dir_name), f"BINPACK{dir_name}.BIN")
 
 
 def serialize_binindex(tuples):
@@ -147,30 +108,32 @@ def serialize_binindex(tuples):
     None.
 
     """
-    idx_data = Bits()
-    for dir_tuples in tuples:
-        for (offs, size) in dir_tuples:
-            idx_data += Bits(uintle=offs >> SECTOR_SIZE_BITCOUNT, length=16) + \
-                Bits(uintle=size >> SECTOR_SIZE_BITCOUNT, length=16)
-        align_block_len = SECTOR_SIZE*8 - (len(idx_data) % (SECTOR_SIZE*8))
-        idx_data += Bits(uint=0, length=align_block_len)
-
     with open("BININDEX.BIN", 'wb') as index_file:
-        idx_data.tofile(index_file)
+        index_file.write(vfs.serialize_binindex(tuples))
 
 
 @cli.command(name='pack', short_help='pack folders to binindex and binpacks')
 @click.argument('dir_names')
-def pack_index(dir_names):
+@click.option('--jobs', '-j', type=int, default=None, help='Number of folders packed at once. Defaults to CPU count.')
+def pack_index(dir_names, jobs):
     """
     Pack given DIR_NAMES in corresponding BINPACK{n}.BIN, assemble new BININDEX.BIN
 
-    DIR_NAMES: Space-separated string of folders names to pack in sequental order. Files in each folder are packed in alphabetical order
+    DIR_NAMES: Space-separated string of folders names to pack in sequental order. Files in each folder are packed in order of names, with numbers in names compared as numbers (00.bin, 01.bin, ..., 99.bin, 100.bin).
+    Folders are packed concurrently, member files are copied to preallocated BINPACK files without reading them to memory.
     """
     dir_names_list = dir_names.split()
     # pack and get offs-size for dir
-    tuples = [pack_dir(dir_name) for dir_name in dir_names_list]
-    serialize_binindex(tuples)
+    with profiling.stage('pack dirs', dirs=len(dir_names_list)) as st, \
+            ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        tuples = list(executor.map(pack_dir, dir_names_list))
+        size = sum(size for dir_tuples in tuples for (_, size) in dir_tuples)
+        st.set(files=sum(len(dir_tuples) for dir_tuples in tuples))
+        st.add_read(size)
+        st.add_written(size)
+    with profiling.stage('write index') as st:
+        serialize_binindex(tuples)
+        st.add_written(len(tuples) * SECTOR_SIZE)
 
 
 if __name__ == '__main__':
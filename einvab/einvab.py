@@ -10,62 +10,32 @@ License:   MIT License https://opensource.org/licenses/mit-license.php
 '''
 
 import os
+import sys
 import glob
-import math
 from shutil import rmtree
 import click
-from bitstring import ConstBitStream, BitStream
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander import profiling, vab  # noqa: E402
+from einhander.binio import read_file  # noqa: E402
 
 
 @click.group()
-def cli():
+@profiling.click_options
+def cli(profile, trace):
     """A tool to unpack and pack pseudo VAB files for PSX game 'Einhander'
     """
-    pass
-
-
-SECTOR_SIZE = 0x800
-HEADER_SIZE = 0x2000
+    profiling.setup_click(profile, trace)
 
 
-def get_offsets(stream, tbl_offs):
-    """
-    Get start of VAGs and each file sizes from header in VAB
-
-    Parameters
-    ----------
-    stream : bitstream
-        VAB file stream
-    tbl_offs : int
-        Offset of size table in VAG's header
-
-    Returns
-    -------
-    start : int
-        Start of first VAG
-    sizes : list of ints
-        List of sizes for each of VAG file
-
-    """
-    sizes = []
-    stream.bytepos = tbl_offs
-    # HEADER_SIZE header size
-    start = HEADER_SIZE + stream.read('uintle:16') * 8
-    while True:
-        size = stream.read('uintle:16') * 8
-        if size == 0:
-            return (start, sizes)
-        sizes.append(size)
-
-
-def split_vab(sizes_tuple, vab_name):
+def split_vab(parts, vab_name):
     """
     Save header, vag files and last sector to given folder
 
     Parameters
     ----------
-    sizes_tuple : tuple(int, [int])
-        Start and sizes list
+    parts : tuple(bytes, [bytes], bytes)
+        Header, ADPCM bodies and last sector, as returned by vab.split
     vab_name : string
         VAB file name to unpack
 
@@ -79,21 +49,14 @@ def split_vab(sizes_tuple, vab_name):
     if os.path.exists(dir_name):
         rmtree(dir_name)
     os.mkdir(dir_name)
-    file_num = 0
-    with open(vab_name, "rb") as vab_file:
-        with open(dir_name + "\\header.bin", "wb") as hdr_file:
-            hdr_file.write(vab_file.read(HEADER_SIZE))
-        (start, sizes) = sizes_tuple
-        vab_file.seek(start)
-        for (file_num, size) in enumerate(sizes):
-            with open(dir_name + f"\\{file_num:02}.adpcm", "wb") as end_file:
-                end_file.write(vab_file.read(size))
-        vab_file.seek(0, os.SEEK_END)  # then last sector for rebuild
-        vab_filesize = vab_file.tell()
-        last_sector_start = vab_filesize - SECTOR_SIZE
-        vab_file.seek(last_sector_start)
-        with open(dir_name + "\\last_sector.bin", "wb") as last_file:
-            last_file.write(vab_file.read(SECTOR_SIZE))
+    (header, bodies, last_sector) = parts
+    with open(dir_name + "\\header.bin", "wb") as hdr_file:
+        hdr_file.write(header)
+    for (file_num, body) in enumerate(bodies):
+        with open(dir_name + f"\\{file_num:02}.adpcm", "wb") as end_file:
+            end_file.write(body)
+    with open(dir_name + "\\last_sector.bin", "wb") as last_file:  # last sector for rebuild
+        last_file.write(last_sector)
 
 
 @cli.command(name='unpack', short_help='unpack vab file to given folder')
@@ -105,9 +68,13 @@ def unpack(vab_name, table_offs):
     Need to provide offset to VAGs sizes table.
     Files in each folder will be named in continuous numbering.
     """
-    vab_stream = ConstBitStream(filename=vab_name)
-    sizes_tuple = get_offsets(vab_stream, int(table_offs, 16))
-    split_vab(sizes_tuple, vab_name)
+    with profiling.stage('read') as st:
+        vab_data = read_file(vab_name)
+        parts = vab.split(vab_data, int(table_offs, 16))
+        st.add_read(len(vab_data))
+    with profiling.stage('split', files=len(parts[1])) as st:
+        split_vab(parts, vab_name)
+        st.add_written(len(parts[0]) + sum(len(body) for body in parts[1]) + len(parts[2]))
 
 
 @cli.command(name='pack', short_help='pack folder to vab file')
@@ -119,35 +86,22 @@ def merge_vab(dir_name, table_offs):
     Need to provide offset to VAGs sizes table.
     Files in folder are packed in alphabetical order. Sizes and last sector number are patched.
     """
-    with open(dir_name+"_patched.bin", "wb") as merged_file:
-        adpcm_names = glob.glob(dir_name+"\\*.adpcm")
-        sizes = [os.path.getsize(file_name) for file_name in adpcm_names]
-        # first write header
-        hdr_stream = BitStream(filename=dir_name+"\\header.bin")
-        hdr_stream.bytepos = int(table_offs, 16)
-        hdr_stream.overwrite(BitStream(uintle=0, length=16)
-                             )  # start with zero offset
-        for size in sizes:
-            assert size >> 3 <= 0xFFFF, "Size overflows 16 bits!"
-            hdr_stream.overwrite(BitStream(uintle=size >> 3, length=16))
-        adpcm_size = sum(sizes)
-        vab_sector_size = math.ceil(adpcm_size / SECTOR_SIZE)
-        # check if vab will fit SPU memory:
-        assert adpcm_size <= 0x39000, f"Max ADPCM size exceeded: 0x{adpcm_size-0x39000:x}!"
-        hdr_stream.bytepos = 0x1FFC  # end of header - 4 bytes of sector-size
-        hdr_stream.overwrite(BitStream(uintle=vab_sector_size, length=16))
-        merged_file.write(hdr_stream.tobytes())
-
-        for file_name in adpcm_names:  # then append adpcm bodies
+    with profiling.stage('read') as st:
+        with open(dir_name+"\\header.bin", "rb") as hdr_file:
+            header = hdr_file.read()
+        bodies = []
+        for file_name in glob.glob(dir_name+"\\*.adpcm"):
             with open(file_name, "rb") as adpcm_file:
-                merged_file.write(adpcm_file.read())
-
-        out_file_size = merged_file.tell()  # align up to sector size
-        align_size = SECTOR_SIZE - (out_file_size % SECTOR_SIZE)
-        merged_file.write(bytes([0]*align_size))
-
+                bodies.append(adpcm_file.read())
         with open(dir_name+"\\last_sector.bin", "rb") as last_file:
-            merged_file.write(last_file.read())
+            last_sector = last_file.read()
+        st.set(files=len(bodies))
+        st.add_read(len(header) + sum(len(body) for body in bodies) + len(last_sector))
+    with profiling.stage('merge'):
+        vab_data = vab.merge(header, bodies, last_sector, int(table_offs, 16))
+    with profiling.stage('write') as st, open(dir_name+"_patched.bin", "wb") as merged_file:
+        merged_file.write(vab_data)
+        st.add_written(len(vab_data))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+einvram
+
+A tool to browse textures and CLUTs in PSX VRAM dumps of "Einhander" game:
+any VRAM rectangle is decoded lazily as 4bpp, 8bpp or 16bpp image.
+
+Version:   0.9
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import mmap
+import os
+from collections import OrderedDict
+import click
+import numpy as np
+from PIL import Image
+
+
+VRAM_WIDTH = 1024  # in 16-bit words
+VRAM_HEIGHT = 512
+VRAM_SIZE = VRAM_WIDTH * VRAM_HEIGHT * 2
+PIXELS_PER_WORD = {'4bpp': 4, '8bpp': 2, '16bpp': 1}
+CLUT_COLORS = {'4bpp': 16, '8bpp': 256}
+
+
+def clut_position(clut_pos):
+    """
+    Unpack serialized CLUT position, as it's stated in GPU packet command word:
+    x is 6 lower bits in 16 words units, y is 10 higher bits
+
+    Parameters
+    ----------
+    clut_pos : int
+        Packed CLUT position
+
+    Returns
+    -------
+    (x, y) : tuple of ints
+        CLUT position in VRAM words
+
+    """
+    return ((clut_pos & 0x3F) * 16, clut_pos >> 6)
+
+
+def colors15_to_rgb(colors):
+    """
+    Convert array of 15bpp BGR PSX colors to array of 24bpp RGB triplets.
+    Alpha (semi-transparency) bit is ignored.
+    """
+    colors = np.asarray(colors, dtype=np.uint16)
+    rgb = np.empty(colors.shape + (3,), dtype=np.uint8)
+    rgb[..., 0] = (colors & 0x1F) << 3
+    rgb[..., 1] = ((colors >> 5) & 0x1F) << 3
+    rgb[..., 2] = ((colors >> 10) & 0x1F) << 3
+    return rgb
+
+
+class Vram:
+    """
+    Memory mapped VRAM dump. Nothing is read from disk until some region
+    is decoded, decoded regions are kept in LRU cache of cache_size entries.
+    """
+
+    def __init__(self, file_name, cache_size=64):
+        self._file = open(file_name, 'rb')
+        try:
+            assert os.fstat(self._file.fileno()).st_size >= VRAM_SIZE, \
+                f"VRAM dump is smaller than 0x{VRAM_SIZE:x} bytes, aborted!"
+            self._mmap = mmap.mmap(self._file.fileno(), VRAM_SIZE, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._file.close()
+            raise
+        self.words = np.frombuffer(self._mmap, dtype='<u2').reshape(VRAM_HEIGHT, VRAM_WIDTH)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._palettes = {}
+
+    def close(self):
+        self._cache.clear()
+        self._palettes.clear()
+        del self.words  # release buffer export before closing mmap
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def clut(self, clut_pos, colors=16):
+        """
+        Return raw 15bpp colors of CLUT at packed clut_pos as array of uint16.
+        """
+        (x, y) = clut_position(clut_pos)
+        assert x + colors <= VRAM_WIDTH, f"CLUT 0x{clut_pos:04X} crosses VRAM line end, aborted!"
+        return self.words[y, x:x + colors]
+
+    def palette(self, clut_pos, colors=16):
+        """
+        Return CLUT at packed clut_pos as flat list of RGB ints, ready for PIL putpalette.
+        """
+        key = (clut_pos, colors)
+        if key not in self._palettes:
+            self._palettes[key] = colors15_to_rgb(self.clut(clut_pos, colors)).ravel().tolist()
+        return self._palettes[key]
+
+    def decode(self, x, y, width, height, mode, clut_pos=None):
+        """
+        Decode VRAM rectangle to image. Decoded images are cached, a copy
+        is returned, so callers can edit it.
+
+        Parameters
+        ----------
+        x, y : int
+            Top left corner of rectangle in VRAM words
+        width, height : int
+            Image size in pixels of given mode
+        mode : str
+            '4bpp', '8bpp' or '16bpp'
+        clut_pos : int
+            Packed CLUT position, as in GPU packet. Ignored for '16bpp'.
+
+        Returns
+        -------
+        image : PIL.Image
+            'P' image for indexed modes, 'RGB' image for '16bpp'
+
+        """
+        if mode == '16bpp':
+            clut_pos = None
+        key = (x, y, width, height, mode, clut_pos)
+        image = self._cache.get(key)
+        if image is not None:
+            self._cache.move_to_end(key)
+            return image.copy()
+        image = self._decode(x, y, width, height, mode, clut_pos)
+        self._cache[key] = image
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return image.copy()
+
+    def _decode(self, x, y, width, height, mode, clut_pos):
+        per_word = PIXELS_PER_WORD[mode]
+        word_count = -(-width // per_word)
+        assert x + word_count <= VRAM_WIDTH and y + height <= VRAM_HEIGHT, \
+            f"Region {width}x{height} at ({x}, {y}) is out of VRAM bounds, aborted!"
+        words = self.words[y:y + height, x:x + word_count]
+        if mode == '16bpp':
+            return Image.fromarray(colors15_to_rgb(words), 'RGB')
+        assert clut_pos is not None, f"CLUT position is required for {mode} mode, aborted!"
+        pixels = words.view(np.uint8)  # little endian: low byte first
+        if mode == '4bpp':  # low nybble is the leftmost pixel
+            pixels = np.stack((pixels & 0xF, pixels >> 4), axis=-1).reshape(height, -1)
+        image = Image.fromarray(np.array(pixels[:, :width], copy=True), 'P')  # never alias the mapping
+        image.putpalette(self.palette(clut_pos, CLUT_COLORS[mode]))
+        return image
+
+
+def parse_region(region):
+    """
+    Parse region string 'X,Y,WIDTH,HEIGHT,MODE[,CLUT]' to decode arguments.
+    """
+    fields = region.split(',')
+    if len(fields) not in (5, 6):
+        raise click.BadParameter(f"'{region}' is not X,Y,WIDTH,HEIGHT,MODE[,CLUT]")
+    (x, y, width, height) = [int(value, 0) for value in fields[:4]]
+    mode = fields[4].strip()
+    if mode not in PIXELS_PER_WORD:
+        raise click.BadParameter(f"unknown mode '{mode}' in '{region}'")
+    clut_pos = int(fields[5], 0) if len(fields) == 6 else None
+    return (x, y, width, height, mode, clut_pos)
+
+
+@click.group()
+def cli():
+    """A tool to browse textures and CLUTs in VRAM dumps of Einhander game.
+    """
+    pass
+
+
+@cli.command(name='render', short_help='render VRAM regions to images')
+@click.argument('vram_name', type=click.Path(exists=True))
+@click.argument('regions', nargs=-1)
+@click.option('--list', '-l', 'list_name', type=click.File('r'), help='Text file with one region per line.')
+@click.option('--out_dir', '-d', type=click.Path(file_okay=False), default='.', help='Output images folder.')
+def render(vram_name, regions, list_name, out_dir):
+    """\b
+    Render given REGIONS of VRAM_NAME dump to png images.
+    Each region is 'X,Y,WIDTH,HEIGHT,MODE[,CLUT]':
+    X, Y - top left corner in VRAM 16-bit words.
+    WIDTH, HEIGHT - image size in pixels.
+    MODE - '4bpp', '8bpp' or '16bpp'.
+    CLUT - serialized CLUT position, as it's stated in GPU packet command word.
+    Regions can also be listed in a text file, one per line.
+    Images are named after region, e.g. '340_100_256x256_4bpp_7C49.png'.
+    """
+    region_list = list(regions)
+    if list_name:
+        region_list += [line.strip() for line in list_name if line.strip() and not line.startswith('#')]
+    os.makedirs(out_dir, exist_ok=True)
+    with Vram(vram_name) as vram:
+        for region in region_list:
+            (x, y, width, height, mode, clut_pos) = parse_region(region)
+            name = f"{x:03X}_{y:03X}_{width}x{height}_{mode}"
+            if clut_pos is not None and mode != '16bpp':
+                name += f"_{clut_pos:04X}"
+            vram.decode(x, y, width, height, mode, clut_pos).save(os.path.join(out_dir, name + '.png'))
+            click.echo(f"Rendered {name}.png")
+
+
+if __name__ == '__main__':
+    cli()
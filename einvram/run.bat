@@ -0,0 +1,2 @@
+python einvram.py render "corevram.bin" 0x140,0x100,256,256,4bpp,0x7C49 0x200,0,64,256,16bpp -d "vram_view"
+pause
\ No newline at end of file
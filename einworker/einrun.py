@@ -0,0 +1,169 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+einrun
+
+Thin client of einworker daemon: runs a tool command of this repository in
+the daemon, as if the tool was run here, e.g.
+    python einrun.py einlzss unpack 12.bin 0x800ae000 0x35f9c 0x20
+Tool output and exit code are passed through. If daemon is not running, the
+tool is run in a new python process. Imports only standard modules, so the
+client itself starts fast.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import getpass
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# tool name -> script, relative to TOOLS_DIR
+TOOLS = {
+    'einlzss': 'einlzss/einlzss.py',
+    'einpack': 'einpack/einpack.py',
+    'einvab': 'einvab/einvab.py',
+    'einvram': 'einvram/einvram.py',
+    'psx_bitmap_converter': 'psx_bitmap_converter/psx_bitmap_converter.py',
+    'gfx_pipeline': 'gfx_pipeline/gfx_pipeline.py',
+    'image_patcher': 'image_patcher/image_patcher.py',
+    'width_table': 'width_table_tool/width_table.py',
+    'bulkClut': 'einClut/bulkClut.py',
+    'extractClut': 'einClut/extractClut.py',
+    'clutToAct': 'einClut/clutToAct.py',
+}
+ADDRESS_VARIABLE = 'EINWORKER_ADDRESS'
+DEFAULT_PORT = 47150
+
+
+def default_address():
+    """
+    Daemon address: EINWORKER_ADDRESS variable, or Unix socket in temp folder,
+    or TCP port on localhost, where Unix sockets are not available (Windows)
+    """
+    if os.environ.get(ADDRESS_VARIABLE):
+        return os.environ[ADDRESS_VARIABLE]
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(tempfile.gettempdir(), f"einworker-{getpass.getuser()}.sock")
+    return str(DEFAULT_PORT)
+
+
+def parse_address(address):
+    """
+    Socket family and address: a number is TCP port on localhost,
+    anything else is Unix socket file name
+    """
+    if address.isdigit():
+        return (socket.AF_INET, ('127.0.0.1', int(address)))
+    return (socket.AF_UNIX, address)
+
+
+def token_file(address):
+    """
+    File with shared secret of TCP worker at address, in temp folder of current
+    user, so only that user can read it
+    """
+    return os.path.join(tempfile.gettempdir(), f"einworker-{getpass.getuser()}-{address}.token")
+
+
+def read_token(address):
+    """
+    Shared secret of TCP worker at address, None for Unix socket or if it's not readable
+    """
+    if parse_address(address)[0] != socket.AF_INET:
+        return None
+    try:
+        with open(token_file(address)) as in_file:
+            return in_file.read().strip()
+    except OSError:
+        return None
+
+
+def authorized(address, message):
+    """
+    Message with shared secret of TCP worker at address added. Unix socket
+    is accessible to its owner only and needs no secret.
+    """
+    token = read_token(address)
+    return dict(message, token=token) if token is not None else message
+
+
+def tool_script(tool):
+    return os.path.join(TOOLS_DIR, TOOLS[tool])
+
+
+def connect(address):
+    """
+    Connected socket to daemon, or None if it's not running
+    """
+    (family, socket_address) = parse_address(address)
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_address)
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+
+def send_message(stream, message):
+    stream.write(json.dumps(message).encode() + b'\n')
+    stream.flush()
+
+
+def receive_messages(stream):
+    for line in stream:
+        yield json.loads(line)
+
+
+def request(address, message):
+    """
+    Send one request to daemon and return list of its reply messages,
+    or None if daemon is not running
+    """
+    connection = connect(address)
+    if connection is None:
+        return None
+    with connection, connection.makefile('rwb') as stream:
+        send_message(stream, authorized(address, message))
+        return list(receive_messages(stream))
+
+
+def run_tool(tool, args, address=None):
+    """
+    Run tool command in daemon at address, or in new process if it's not running.
+    Tool output is printed as it comes. Returns tool exit code.
+    """
+    address = address or default_address()
+    connection = connect(address)
+    if connection is None:
+        print(f"einrun: einworker is not running, starting {tool} directly", file=sys.stderr)
+        return subprocess.call([sys.executable, tool_script(tool)] + list(args))
+    with connection, connection.makefile('rwb') as stream:
+        send_message(stream, authorized(address, {'command': 'run', 'tool': tool, 'args': list(args),
+                                                  'cwd': os.getcwd()}))
+        for message in receive_messages(stream):
+            if 'stream' in message:
+                out = sys.stdout if message['stream'] == 'out' else sys.stderr
+                out.write(message['text'])
+                out.flush()
+            elif 'exit' in message:
+                return message['exit']
+    print("einrun: connection to einworker lost", file=sys.stderr)
+    return 1
+
+
+def main(argv):
+    if len(argv) < 1 or argv[0] not in TOOLS:
+        print(f"Usage: einrun.py TOOL [ARGS]...\nTOOL is one of: {', '.join(TOOLS)}", file=sys.stderr)
+        return 2
+    return run_tool(argv[0], argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
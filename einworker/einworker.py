@@ -0,0 +1,314 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+einworker
+
+A long running worker for translation tools of "Einhander" game for PSX: runs
+tool commands sent by einrun client in one warm process. Python modules (click,
+PIL, numpy and tools themselves) are imported once, compiled tool scripts and
+mappings of read files (BINPACK and others) are kept between commands, so a
+batch of small commands costs their work, not interpreter startup.
+
+Version:   0.9
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import hmac
+import importlib
+import io
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import time
+import traceback
+import types
+from contextlib import redirect_stderr, redirect_stdout
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander import binio, profiling  # noqa: E402
+from einrun import TOOLS, default_address, parse_address, request, send_message, token_file, tool_script  # noqa: E402
+
+PRELOAD_MODULES = ('PIL.Image', 'PIL.PngImagePlugin', 'numpy')
+
+
+class ClientStream(io.TextIOBase):
+    """
+    Text stream, which sends everything written to client as messages of
+    given stream ('out' or 'err'). Stops sending, if client went away.
+    """
+
+    def __init__(self, client, name):
+        super().__init__()
+        self.client = client
+        self.name = name
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not isinstance(text, str):  # click probes streams with bytes to find binary ones
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        if text and self.client.connected:
+            try:
+                send_message(self.client.stream, {'stream': self.name, 'text': text})
+            except OSError:
+                self.client.connected = False
+        return len(text)
+
+
+class Client:
+    def __init__(self, stream):
+        self.stream = stream
+        self.connected = True
+        self.out = ClientStream(self, 'out')
+        self.err = ClientStream(self, 'err')
+
+    def send(self, message):
+        if self.connected:
+            try:
+                send_message(self.stream, message)
+            except OSError:
+                self.connected = False
+
+
+def exit_code(code, err):
+    """
+    Process exit code for SystemExit code, as python itself does
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=err)
+    return 1
+
+
+class Worker:
+    """
+    State of daemon: compiled tool scripts, mapped files and counters.
+    Commands are run one at a time, as each changes current folder, argv and
+    standard streams of the process.
+    """
+
+    def __init__(self, keep_mapped):
+        self.started = time.time()
+        self.jobs = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.scripts = {}  # script name -> (mtime, code object)
+        self.mapped_files = binio.keep_files_mapped() if keep_mapped else None
+        self.stopping = False
+
+    def script_code(self, script):
+        mtime = os.stat(script).st_mtime_ns
+        cached = self.scripts.get(script)
+        if cached is None or cached[0] != mtime:
+            with open(script, 'rb') as script_file:
+                cached = (mtime, compile(script_file.read(), script, 'exec'))
+            self.scripts[script] = cached
+        return cached[1]
+
+    def run(self, tool, args, cwd, client):
+        """
+        Run tool script as __main__ with given arguments in cwd, its output
+        goes to client. Returns exit code.
+        """
+        start_time = time.perf_counter()
+        script = tool_script(tool)
+        module = types.ModuleType('__main__')
+        module.__file__ = script
+        saved = (list(sys.argv), list(sys.path), sys.modules['__main__'], os.getcwd())
+        try:
+            with redirect_stdout(client.out), redirect_stderr(client.err):
+                try:
+                    os.chdir(cwd)
+                    sys.argv[:] = [script] + list(args)
+                    sys.modules['__main__'] = module  # worker processes find tool functions here
+                    exec(self.script_code(script), module.__dict__)
+                    code = 0
+                except SystemExit as e:
+                    code = exit_code(e.code, client.err)
+                except Exception as e:
+                    traceback.print_exception(type(e), e, e.__traceback__.tb_next)  # from tool frame
+                    code = 1
+        finally:
+            (sys.argv[:], sys.path[:], sys.modules['__main__']) = saved[:3]
+            os.chdir(saved[3])
+            profiling.disable()
+        self.jobs += 1
+        self.failed += code != 0
+        self.busy += time.perf_counter() - start_time
+        return code
+
+    def status(self):
+        status = {'pid': os.getpid(), 'uptime': round(time.time() - self.started, 1),
+                  'jobs': self.jobs, 'failed': self.failed, 'busy': round(self.busy, 3),
+                  'scripts': len(self.scripts), 'modules': len(sys.modules)}
+        if self.mapped_files is not None:
+            status.update(mapped_files=len(self.mapped_files), mapped_bytes=self.mapped_files.size())
+        return status
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    One client connection: a request message, then reply messages.
+    """
+
+    def handle(self):
+        worker = self.server.worker
+        client = Client(self.wfile)
+        line = self.rfile.readline()
+        if not line:
+            return
+        message = json.loads(line)
+        token = self.server.token
+        if token is not None and not hmac.compare_digest(str(message.get('token', '')).encode(), token.encode()):
+            client.err.write("einworker: request is not authorized, token does not match\n")
+            client.send({'exit': 2})
+            return
+        command = message.get('command')
+        if command == 'run':
+            if message.get('tool') not in TOOLS:
+                client.err.write(f"Unknown tool {message.get('tool')}\n")
+                client.send({'exit': 2})
+            else:
+                client.send({'exit': worker.run(message['tool'], message.get('args', []),
+                                                message.get('cwd', os.getcwd()), client)})
+        elif command == 'status':
+            client.send({'status': worker.status()})
+        elif command == 'stop':
+            worker.stopping = True
+            client.send({'stopping': True})
+
+
+def write_token(address):
+    """
+    Make new shared secret for TCP worker at address and save it to file
+    readable by current user only. Returns the secret.
+    """
+    token = secrets.token_hex(16)
+    file_name = token_file(address)
+    if os.path.exists(file_name):
+        os.unlink(file_name)  # new file gets owner only mode
+    with os.fdopen(os.open(file_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as out_file:
+        out_file.write(token)
+    return token
+
+
+def make_server(address):
+    """
+    Listening server at address. Unix socket is made accessible to current user only,
+    stale socket file of a killed daemon is removed. Any local user can connect to TCP
+    port, so its requests must carry a shared secret, which only current user can read.
+    """
+    (family, socket_address) = parse_address(address)
+    if family == socket.AF_INET:
+        server = socketserver.TCPServer(socket_address, RequestHandler)
+        server.token = write_token(address)
+        return server
+    if os.path.exists(socket_address):
+        if request(address, {'command': 'status'}) is not None:
+            raise click.ClickException(f"einworker is already running at {address}")
+        os.unlink(socket_address)
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(socket_address, RequestHandler)
+    finally:
+        os.umask(umask)
+    server.token = None
+    return server
+
+
+def preload_modules():
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+@click.group()
+@click.option('--address', '-a', default=default_address, show_default='EINWORKER_ADDRESS or temp socket',
+              help='Unix socket file name, or TCP port number on localhost.')
+@click.pass_context
+def cli(ctx, address):
+    """A long running worker, which runs tools commands sent by einrun without interpreter startup.
+    """
+    ctx.obj = address
+
+
+@cli.command(name='serve', short_help='run worker until stopped')
+@click.option('--idle_exit', '-i', type=float, default=0, help='Exit after given minutes without commands, 0 to never.')
+@click.option('--keep_mapped/--no_keep_mapped', default=os.name != 'nt',
+              help='Keep read files mapped between commands. Off by default on Windows, '
+                   'where mapped files can not be overwritten.')
+@click.pass_obj
+def serve(address, idle_exit, keep_mapped):
+    """\b
+    Run worker at ADDRESS and serve commands of einrun clients one at a time,
+    until stopped with 'stop' command or Ctrl+C.
+    Restart it after tools update: tools scripts are reloaded when changed,
+    but modules they import are not.
+
+    """
+    preload_modules()
+    worker = Worker(keep_mapped)
+    server = make_server(address)
+    server.worker = worker
+    server.timeout = idle_exit * 60 or None
+
+    def handle_timeout():
+        worker.stopping = True
+
+    server.handle_timeout = handle_timeout
+    click.echo(f"einworker {os.getpid()} serving at {address}")
+    try:
+        while not worker.stopping:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if parse_address(address)[0] != socket.AF_INET and os.path.exists(address):
+            os.unlink(address)
+        if server.token is not None and os.path.exists(token_file(address)):
+            os.unlink(token_file(address))
+        if worker.mapped_files is not None:
+            worker.mapped_files.clear()
+    click.echo(f"einworker stopped after {worker.jobs} commands, {worker.busy:.2f} s busy")
+
+
+@cli.command(name='status', short_help='show worker state')
+@click.pass_obj
+def status(address):
+    """
+    Show state of worker at ADDRESS: commands count and busy time, loaded modules and mapped files.
+    Exit code is 1, if worker is not running.
+    """
+    replies = request(address, {'command': 'status'})
+    if not replies:
+        click.echo(f"einworker is not running at {address}")
+        raise SystemExit(1)
+    for (key, value) in replies[0]['status'].items():
+        click.echo(f"{key}: {value}")
+
+
+@cli.command(name='stop', short_help='stop worker')
+@click.pass_obj
+def stop(address):
+    """
+    Stop worker at ADDRESS after its current command.
+    """
+    if request(address, {'command': 'stop'}) is None:
+        click.echo(f"einworker is not running at {address}")
+    else:
+        click.echo("einworker stopped")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,5 @@
+start "einworker" python einworker.py serve -i 30
+python einrun.py einpack unpack
+python einrun.py einlzss unpack "12.bin" 800ae000 35f9c 20 -o "full_text_font.pix"
+python einworker.py stop
+pause
\ No newline at end of file
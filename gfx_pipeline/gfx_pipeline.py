@@ -0,0 +1,239 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+gfx_pipeline
+
+A tool to convert lzss compressed graphics of "Einhander" game for PSX
+to png images and back in memory: BINPACK member -> pointer table decode ->
+bitmap decode -> png, without intermediate files.
+
+Version:   0.9
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander import bitmap, lzss, vfs  # noqa: E402
+from einhander.binio import read_file  # noqa: E402
+
+
+def read_manifest(manifest):
+    """
+    Read assets list from JSON manifest. Numeric fields are JSON integers or hex strings,
+    as in einlzss arguments. Relative paths are resolved from manifest folder.
+
+    Parameters
+    ----------
+    manifest : string
+        Manifest file name
+
+    Returns
+    -------
+    assets : list of dicts
+
+    """
+    with open(manifest) as manifest_file:
+        assets = json.load(manifest_file)
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    for asset in assets:
+        asset['root'] = base_dir
+        for key in ('file', 'palette', 'image'):
+            if key in asset:
+                asset[key] = os.path.join(base_dir, asset[key])
+        for key in ('base', 'ptr_table', 'count', 'width', 'height',
+                    'block_start', 'chunk_size', 'target_size'):
+            if isinstance(asset.get(key), str):
+                asset[key] = int(asset[key], 16)
+    return assets
+
+
+def member_location(asset):
+    """
+    Get file name, offset and size of packed data for given asset:
+    either standalone 'file' or 'member' of 'binpack' folder, located with BININDEX.BIN.
+
+    Returns
+    -------
+    (file_name, offset, size) : tuple
+        size is None for standalone file
+
+    """
+    if 'file' in asset:
+        return (asset['file'], 0, None)
+    dir_num = int(asset['binpack'])
+    idx_data = read_file(os.path.join(asset['root'], "BININDEX.BIN"))
+    (offs, size) = vfs.deserialize_binindex(idx_data, dir_num)[int(asset['member'])]
+    pack_name = os.path.join(asset['root'], f"BINPACK{dir_num}.BIN")
+    return (pack_name, offs * vfs.SECTOR_SIZE, size * vfs.SECTOR_SIZE)
+
+
+def read_member(asset):
+    """
+    Read packed data of given asset in memory.
+    """
+    (file_name, offset, size) = member_location(asset)
+    packed_data = read_file(file_name)
+    return packed_data[offset:] if size is None else packed_data[offset:offset + size]
+
+
+def read_palette(asset):
+    if asset['mode'] == '16bpp':
+        return None
+    with open(asset['palette'], 'rb') as palette_file:
+        return bitmap.pal15To24(palette_file.read())
+
+
+def decode_asset(packed, asset, colors):
+    """
+    Decode lzss compressed graphics from packed data to image.
+
+    Parameters
+    ----------
+    packed : bytes
+        Packed file (BINPACK member) data
+    asset : dict
+        Asset description from manifest
+    colors : list of ints or None
+        24bpp RGB palette, None for 16bpp mode
+
+    Returns
+    -------
+    image : PIL.Image
+
+    """
+    plain = lzss.decompress(packed, asset['base'], asset['ptr_table'], asset['count'])
+    return bitmap.buildImage(asset['mode'], plain, colors, asset['width'], asset['height'])
+
+
+def encode_asset(image, asset):
+    """
+    Encode image to lzss compressed graphics block.
+
+    Returns
+    -------
+    (offsets, block_bytes) : tuple
+        as returned by lzss.pack_line_block
+
+    """
+    (bitmap_data, _) = bitmap.splitImage(image, asset['mode'])
+    return lzss.pack_line_block(bitmap_data, asset['chunk_size'])
+
+
+def unpack_asset(asset):
+    """
+    Worker: decode asset to its png image.
+    Returns tuple of elapsed seconds and error message (None on success).
+    """
+    start_time = time.perf_counter()
+    try:
+        image = decode_asset(read_member(asset), asset, read_palette(asset))
+        image.save(asset['image'])
+    except Exception as e:
+        return (time.perf_counter() - start_time, f"{type(e).__name__}: {e}")
+    return (time.perf_counter() - start_time, None)
+
+
+def pack_asset(asset):
+    """
+    Worker: encode asset png image to compressed block.
+    Returns tuple of elapsed seconds, (offsets, block_bytes) and error message.
+    """
+    from PIL import Image
+    start_time = time.perf_counter()
+    try:
+        with Image.open(asset['image']) as image:
+            packed_block = encode_asset(image, asset)
+    except Exception as e:
+        return (time.perf_counter() - start_time, None, f"{type(e).__name__}: {e}")
+    return (time.perf_counter() - start_time, packed_block, None)
+
+
+def asset_name(asset):
+    if 'file' in asset:
+        return os.path.basename(asset['file'])
+    return f"{asset['binpack']}/{int(asset['member']):02}"
+
+
+@click.group()
+def cli():
+    """A tool to convert lzss compressed graphics of Einhander game to png images and back.
+    """
+    pass
+
+
+@cli.command(name='unpack', short_help='decode compressed graphics to png images')
+@click.argument('manifest', type=click.Path(exists=True))
+@click.option('--jobs', '-j', type=int, default=None, help='Number of worker processes. Defaults to CPU count.')
+def unpack(manifest, jobs):
+    """\b
+    Decode all assets of MANIFEST to png images in parallel.
+    MANIFEST is a JSON list of assets, each with fields:
+    binpack, member - BINPACK folder number and file number in it, or
+    file - standalone packed file name.
+    base, ptr_table, count - as in einlzss unpack.
+    mode, width, height, palette - as in psx_bitmap_converter decode.
+    image - png image name.
+    """
+    assets = read_manifest(manifest)
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for (asset, (elapsed, error)) in zip(assets, executor.map(unpack_asset, assets)):
+            if error is None:
+                click.echo(f"{asset_name(asset)} -> {os.path.basename(asset['image'])}: {elapsed * 1000:.1f} ms")
+            else:
+                failures += 1
+                click.echo(f"{asset_name(asset)}: FAILED: {error}", err=True)
+    if failures:
+        raise SystemExit(1)
+
+
+@cli.command(name='pack', short_help='encode png images to compressed graphics')
+@click.argument('manifest', type=click.Path(exists=True))
+@click.option('--jobs', '-j', type=int, default=None, help='Number of worker processes. Defaults to CPU count.')
+def pack(manifest, jobs):
+    """\b
+    Encode all assets images of MANIFEST and patch them in place into
+    their BINPACK members or standalone files. Run it on a patched copy of files.
+    Asset fields are the same as for unpack, and also:
+    block_start, chunk_size, target_size - as in einlzss pack.
+    Images are encoded in parallel, each packed file is patched and written once.
+    """
+    assets = read_manifest(manifest)
+    failures = 0
+    patched = {}  # (file name, offset) -> [size, patched data]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for (asset, (elapsed, packed_block, error)) in zip(assets, executor.map(pack_asset, assets)):
+            if error is None:
+                try:
+                    (file_name, offset, size) = member_location(asset)
+                    if (file_name, offset) not in patched:
+                        patched[(file_name, offset)] = [size, bytearray(read_member(asset))]
+                    (offsets, block_bytes) = packed_block
+                    lzss.patch_line_block(patched[(file_name, offset)][1], asset['base'], asset['ptr_table'],
+                                          asset['block_start'], offsets, block_bytes, asset['target_size'])
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+            if error is None:
+                click.echo(f"{os.path.basename(asset['image'])} -> {asset_name(asset)}: "
+                           f"0x{len(block_bytes):x} of 0x{asset['target_size']:x} bytes, {elapsed * 1000:.1f} ms")
+            else:
+                failures += 1
+                click.echo(f"{asset_name(asset)}: FAILED: {error}", err=True)
+    for ((file_name, offset), (size, data)) in patched.items():
+        assert size is None or len(data) == size, f"{file_name} member at 0x{offset:x} changed size, aborted!"
+        with open(file_name, 'r+b' if size is not None else 'wb') as packed_file:
+            packed_file.seek(offset)
+            packed_file.write(data)
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    cli()
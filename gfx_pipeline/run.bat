@@ -0,0 +1,3 @@
+python gfx_pipeline.py unpack "assets.json"
+REM python gfx_pipeline.py pack "assets.json"
+pause
\ No newline at end of file
@@ -1,7 +1,21 @@
+from __future__ import annotations
+
 import argparse
-from PIL import Image
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander import profiling  # noqa: E402
+
+DEFAULT_COMPRESS_LEVEL = 6  # PIL default for png
+
 def apply_patch(original_image_path: str, patch_image_path: str, x: int, y: int, output_path: str):
     """
     Pastes a patch image onto an original image at the given coordinates.
@@ -13,20 +27,87 @@ def apply_patch(original_image_path: str, patch_image_path: str, x: int, y: int,
         y (int): The y-coordinate for the top-left corner of the patch.
         output_path (str): Path to save the resulting image.
     """
+    from PIL import Image
     try:
-        with Image.open(original_image_path) as original, Image.open(patch_image_path) as patch:
+        with profiling.stage("patch") as st, Image.open(original_image_path) as original, Image.open(patch_image_path) as patch:
             original_copy = original.copy()            
             mask = patch if patch.mode == 'RGBA' else None            
             original_copy.paste(patch, (x, y), mask=mask)
             original_copy.save(output_path)
+            st.add_read_files([original_image_path, patch_image_path])
+            st.add_written_files([output_path])
     except FileNotFoundError as e:
         print(f"Error: Input file not found - {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
-def batch_patch(original_dir_path: str, patch_image_path: str, x: int, y: int, output_dir_path: str):
+def load_patch(patch_image_path: str):
+    """
+    Decodes a patch image once, so it can be shared with worker processes.
+
+    Args:
+        patch_image_path (str): Path to the patch image.
+
+    Returns:
+        tuple: Mode, size, raw pixel bytes and palette (or None) of the patch image.
+    """
+    from PIL import Image
+    with Image.open(patch_image_path) as patch:
+        palette = patch.getpalette() if patch.mode == 'P' else None
+        return (patch.mode, patch.size, patch.tobytes(), palette)
+
+def build_patch(patch_data):
+    """
+    Rebuilds a patch image and its mask from data returned by load_patch.
+
+    Returns:
+        tuple: Patch image and its mask (None if the patch has no alpha channel).
+    """
+    from PIL import Image
+    mode, size, data, palette = patch_data
+    patch = Image.frombytes(mode, size, data)
+    if palette is not None:
+        patch.putpalette(palette)
+    return (patch, patch if patch.mode == 'RGBA' else None)
+
+_worker_patch = None
+_worker_mask = None
+_worker_patches = {}
+
+def init_patch_worker(patch_data):
+    """
+    Pool initializer: rebuilds the shared patch image and its mask once per worker process.
+    """
+    global _worker_patch, _worker_mask
+    _worker_patch, _worker_mask = build_patch(patch_data)
+
+def patch_worker(job):
+    """
+    Patches one image with the preloaded patch in a worker process.
+
+    Args:
+        job (tuple): Original image path, output path, x, y and png compression level.
+
+    Returns:
+        tuple: Elapsed seconds and error message (None on success).
+    """
+    from PIL import Image
+    original_image_path, output_path, x, y, compress_level = job
+    start_time = time.perf_counter()
+    try:
+        with Image.open(original_image_path) as original:
+            original_copy = original.copy()
+        original_copy.paste(_worker_patch, (x, y), mask=_worker_mask)
+        original_copy.save(output_path, compress_level=compress_level)
+    except Exception as e:
+        return (time.perf_counter() - start_time, f"{type(e).__name__}: {e}")
+    return (time.perf_counter() - start_time, None)
+
+def batch_patch(original_dir_path: str, patch_image_path: str, x: int, y: int, output_dir_path: str,
+                jobs: int = None, compress_level: int = DEFAULT_COMPRESS_LEVEL) -> int:
     """
     Applies a patch to all .png images in a source directory and saves them to an output directory.
+    The patch is decoded once and shared with a pool of worker processes, which patch and encode images concurrently.
 
     Args:
         original_dir_path (str): Path to the directory with original .png images.
@@ -34,31 +115,396 @@ def batch_patch(original_dir_path: str, patch_image_path: str, x: int, y: int, o
         x (int): The x-coordinate for the top-left corner of the patch.
         y (int): The y-coordinate for the top-left corner of the patch.
         output_dir_path (str): Path to the directory to save patched images.
+        jobs (int): Number of worker processes, defaults to CPU count.
+        compress_level (int): PNG compression level of output images, 0-9.
+
+    Returns:
+        int: Number of failed images.
     """
     source_dir = Path(original_dir_path)
     output_dir = Path(output_dir_path)
 
     if not source_dir.is_dir():
         print(f"Error: Source directory not found at '{source_dir}'")
-        return
+        return 1
 
     output_dir.mkdir(parents=True, exist_ok=True)
-    png_files = list(source_dir.glob('*.png'))
+    png_files = sorted(source_dir.glob('*.png'))
     if not png_files:
         print(f"No .png files found in '{source_dir}'")
-        return
+        return 0
+
+    try:
+        with profiling.stage("load patch") as st:
+            patch_data = load_patch(patch_image_path)
+            st.add_read_files([patch_image_path])
+    except OSError as e:
+        print(f"Error: Patch image not read - {e}")
+        return len(png_files)
 
     print(f"Found {len(png_files)} .png files. Starting batch patch...")
-    for original_image_path in png_files:
-        output_path = output_dir / original_image_path.name
-        print(f"  - Patching '{original_image_path.name}'...")
-        apply_patch(str(original_image_path), patch_image_path, x, y, str(output_path)) 
+    start_time = time.perf_counter()
+    jobs_list = [(str(path), str(output_dir / path.name), x, y, compress_level) for path in png_files]
+    failures = []
+    work_time = 0.0
+    with profiling.stage("patch images", images=len(png_files)) as st, \
+            ProcessPoolExecutor(max_workers=jobs, initializer=init_patch_worker, initargs=(patch_data,)) as executor:
+        for path, job, (elapsed, error) in zip(png_files, jobs_list, executor.map(patch_worker, jobs_list, chunksize=4)):
+            work_time += elapsed
+            if error is not None:
+                failures.append((path.name, error))
+                continue
+            st.add_read_files([job[0]])
+            st.add_written_files([job[1]])
+        st.set(failed=len(failures), worker_ms=round(work_time * 1000, 3))
+    total_time = time.perf_counter() - start_time
+
+    print(f"Patched {len(png_files) - len(failures)} of {len(png_files)} images in {total_time:.2f} s "
+          f"({work_time / len(png_files) * 1000:.1f} ms per image in workers).")
+    for name, error in failures:
+        print(f"  - Failed '{name}': {error}")
+    return len(failures)
+
+RECORD_NAME = ".patch_record.json"
+
+def read_manifest(manifest_path: str):
+    """
+    Reads a multi-patch manifest and resolves it to a list of patch operations per image.
+
+    Manifest is a JSON object:
+        {
+          "source_dir": "original", "output_dir": "modified",
+          "images": [
+            {"glob": "*.png", "patches": [{"patch": "caption.png", "x": 50, "y": 50}]},
+            {"image": "gallery_03.png", "patches": [{"patch": "title.png", "x": 10, "y": 300}]}
+          ]
+        }
+    Paths are relative to the manifest directory. An image matched by several entries
+    gets all of their patches, in manifest order.
+
+    Args:
+        manifest_path (str): Path to the manifest file.
+
+    Returns:
+        tuple: Source directory, output directory and a dict of image name to list of (patch path, x, y).
+    """
+    manifest_file = Path(manifest_path)
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    base_dir = manifest_file.parent
+    source_dir = base_dir / manifest.get("source_dir", ".")
+    output_dir = base_dir / manifest["output_dir"]
+    operations = {}
+    for entry in manifest["images"]:
+        if "image" in entry:
+            names = [entry["image"]]
+        else:
+            names = sorted(path.name for path in source_dir.glob(entry["glob"]) if path.is_file())
+        ops = [(str(base_dir / op["patch"]), int(op["x"]), int(op["y"])) for op in entry["patches"]]
+        for name in names:
+            operations.setdefault(name, []).extend(ops)
+    return (source_dir, output_dir, operations)
+
+def init_manifest_worker(patches_data):
+    """
+    Pool initializer: rebuilds all shared patch images and masks once per worker process.
+    """
+    global _worker_patches
+    _worker_patches = {path: build_patch(patch_data) for path, patch_data in patches_data.items()}
+
+def manifest_worker(job):
+    """
+    Applies all patches of one image in a worker process: the image is decoded once and encoded once.
+    The image is skipped if the hash of its inputs matches the previous run's record.
+
+    Args:
+        job (tuple): Original image path, output path, list of (patch path, x, y),
+            hash of patch inputs, previously recorded hash and png compression level.
+
+    Returns:
+        tuple: New inputs hash, elapsed seconds, skipped flag and error message (None on success).
+    """
+    from PIL import Image
+    original_image_path, output_path, ops, ops_hash, previous_hash, compress_level = job
+    start_time = time.perf_counter()
+    try:
+        with open(original_image_path, "rb") as f:
+            original_data = f.read()
+        inputs_hash = hashlib.sha1(original_data + ops_hash.encode()).hexdigest()
+        if inputs_hash == previous_hash and Path(output_path).is_file():
+            return (inputs_hash, time.perf_counter() - start_time, True, None)
+        with Image.open(io.BytesIO(original_data)) as original:
+            original_copy = original.copy()
+        for patch_path, x, y in ops:
+            patch, mask = _worker_patches[patch_path]
+            original_copy.paste(patch, (x, y), mask=mask)
+        original_copy.save(output_path, compress_level=compress_level)
+    except Exception as e:
+        return (None, time.perf_counter() - start_time, False, f"{type(e).__name__}: {e}")
+    return (inputs_hash, time.perf_counter() - start_time, False, None)
+
+def manifest_patch(manifest_path: str, jobs: int = None, compress_level: int = DEFAULT_COMPRESS_LEVEL,
+                   force: bool = False) -> int:
+    """
+    Applies every patch operation of a manifest. Each image is decoded and encoded once.
+    Hashes of image inputs (source image, patches, coordinates, compression level) are recorded
+    in the output directory, and images with unchanged inputs are skipped on the next run.
+
+    Args:
+        manifest_path (str): Path to the manifest file, see read_manifest.
+        jobs (int): Number of worker processes, defaults to CPU count.
+        compress_level (int): PNG compression level of output images, 0-9.
+        force (bool): Ignore the previous run's record and patch all images.
+
+    Returns:
+        int: Number of failed images.
+    """
+    with profiling.stage("read manifest"):
+        source_dir, output_dir, operations = read_manifest(manifest_path)
+    if not operations:
+        print("No images matched by manifest")
+        return 0
+    output_dir.mkdir(parents=True, exist_ok=True)
+    record_path = output_dir / RECORD_NAME
+    record = {}
+    if record_path.is_file() and not force:
+        with open(record_path) as f:
+            record = json.load(f)
+
+    patches_data = {}
+    patch_hashes = {}
+    try:
+        with profiling.stage("load patches") as st:
+            for patch_path in sorted({op[0] for ops in operations.values() for op in ops}):
+                with open(patch_path, "rb") as f:
+                    patch_file_data = f.read()
+                patch_hashes[patch_path] = hashlib.sha1(patch_file_data).hexdigest()
+                patches_data[patch_path] = load_patch(patch_path)
+                st.add_read(len(patch_file_data))
+    except OSError as e:
+        print(f"Error: Patch image not read - {e}")
+        return len(operations)
+
+    jobs_list = []
+    for name, ops in operations.items():
+        ops_hash = json.dumps([[patch_hashes[path], x, y] for path, x, y in ops] + [compress_level])
+        jobs_list.append((str(source_dir / name), str(output_dir / name), ops, ops_hash, record.get(name), compress_level))
+
+    print(f"Found {len(operations)} images with {sum(len(ops) for ops in operations.values())} patches. Starting manifest patch...")
+    start_time = time.perf_counter()
+    failures = []
+    skipped = 0
+    new_record = {}
+    work_time = 0.0
+    with profiling.stage("patch images", images=len(operations)) as st, \
+            ProcessPoolExecutor(max_workers=jobs, initializer=init_manifest_worker, initargs=(patches_data,)) as executor:
+        for name, job, (inputs_hash, elapsed, was_skipped, error) in zip(operations, jobs_list, executor.map(manifest_worker, jobs_list)):
+            work_time += elapsed
+            if error is not None:
+                failures.append((name, error))
+                continue
+            new_record[name] = inputs_hash
+            skipped += was_skipped
+            st.add_read_files([job[0]])
+            if not was_skipped:
+                st.add_written_files([job[1]])
+        st.set(failed=len(failures), skipped=skipped, worker_ms=round(work_time * 1000, 3))
+    total_time = time.perf_counter() - start_time
+    with open(record_path, "w") as f:
+        json.dump(new_record, f, indent=2, sort_keys=True)
+
+    patched = len(operations) - len(failures) - skipped
+    print(f"Patched {patched}, skipped {skipped} unchanged, failed {len(failures)} of {len(operations)} images in {total_time:.2f} s.")
+    for name, error in failures:
+        print(f"  - Failed '{name}': {error}")
+    return len(failures)
+
+DEFAULT_THRESHOLD = 0.95
+
+def normalized_cross_correlation(image: np.ndarray, template: np.ndarray) -> np.ndarray:
+    """
+    Computes normalized cross-correlation of a template at every valid position of an image.
+    Correlation is done with FFT, local image statistics with integral images.
+
+    Args:
+        image (np.ndarray): 2D grayscale image, float.
+        template (np.ndarray): 2D grayscale template, float, not larger than the image.
+
+    Returns:
+        np.ndarray: Scores in [-1, 1] of shape (H - h + 1, W - w + 1), indexed by top-left corner.
+    """
+    import numpy as np
+    height, width = image.shape
+    t_height, t_width = template.shape
+    count = t_height * t_width
+    template = template - template.mean()
+    template_norm = np.sqrt((template ** 2).sum())
+
+    # circular correlation does not wrap for the valid positions
+    spectrum = np.fft.rfft2(image) * np.conj(np.fft.rfft2(template, s=(height, width)))
+    numerator = np.fft.irfft2(spectrum, s=(height, width))[:height - t_height + 1, :width - t_width + 1]
+
+    def window_sums(values):
+        integral = np.zeros((height + 1, width + 1))
+        integral[1:, 1:] = values.cumsum(0).cumsum(1)
+        return (integral[t_height:, t_width:] - integral[:-t_height, t_width:]
+                - integral[t_height:, :-t_width] + integral[:-t_height, :-t_width])
+
+    sums = window_sums(image)
+    variance = window_sums(image ** 2) - sums ** 2 / count
+    denominator = np.sqrt(np.maximum(variance, 0)) * template_norm
+    scores = np.zeros_like(numerator)
+    valid = denominator > 1e-6 * max(template_norm, 1.0)
+    scores[valid] = numerator[valid] / denominator[valid]
+    return scores
+
+def find_matches(scores: np.ndarray, size: tuple, threshold: float):
+    """
+    Picks match positions above the threshold, best first, suppressing overlapping matches.
+
+    Args:
+        scores (np.ndarray): Scores from normalized_cross_correlation.
+        size (tuple): Template width and height.
+        threshold (float): Minimal score of a match.
+
+    Returns:
+        list: (x, y, score) tuples.
+    """
+    import numpy as np
+    t_width, t_height = size
+    ys, xs = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[ys, xs], kind='stable')
+    matches = []
+    for y, x in zip(ys[order], xs[order]):
+        if all(abs(x - mx) >= t_width or abs(y - my) >= t_height for mx, my, _ in matches):
+            matches.append((int(x), int(y), float(scores[y, x])))
+    return matches
+
+def to_gray(image: Image.Image) -> np.ndarray:
+    import numpy as np
+    return np.asarray(image.convert('L'), dtype=np.float64)
+
+_worker_snippet = None
+
+def init_locate_worker(snippet_data, patch_data):
+    """
+    Pool initializer: rebuilds the shared search snippet and the patch once per worker process.
+    """
+    global _worker_snippet, _worker_patch, _worker_mask
+    snippet, _ = build_patch(snippet_data)
+    _worker_snippet = to_gray(snippet)
+    _worker_patch, _worker_mask = build_patch(patch_data)
+
+def locate_worker(job):
+    """
+    Searches one image for the snippet and pastes the patch at each match in a worker process.
+    Images without matches are copied unchanged.
+
+    Args:
+        job (tuple): Original image path, output path, threshold, patch offset (dx, dy) and png compression level.
+
+    Returns:
+        tuple: List of (x, y, score) matches, elapsed seconds and error message (None on success).
+    """
+    from PIL import Image
+    original_image_path, output_path, threshold, (dx, dy), compress_level = job
+    start_time = time.perf_counter()
+    try:
+        with Image.open(original_image_path) as original:
+            original_copy = original.copy()
+        gray = to_gray(original_copy)
+        t_height, t_width = _worker_snippet.shape
+        matches = []
+        if gray.shape[0] >= t_height and gray.shape[1] >= t_width:
+            scores = normalized_cross_correlation(gray, _worker_snippet)
+            matches = find_matches(scores, (t_width, t_height), threshold)
+        if matches:
+            for x, y, _ in matches:
+                original_copy.paste(_worker_patch, (x + dx, y + dy), mask=_worker_mask)
+            original_copy.save(output_path, compress_level=compress_level)
+        else:
+            shutil.copyfile(original_image_path, output_path)
+    except Exception as e:
+        return ([], time.perf_counter() - start_time, f"{type(e).__name__}: {e}")
+    return (matches, time.perf_counter() - start_time, None)
+
+def locate_patch(original_dir_path: str, snippet_image_path: str, patch_image_path: str, output_dir_path: str,
+                 threshold: float = DEFAULT_THRESHOLD, offset: tuple = (0, 0), jobs: int = None,
+                 compress_level: int = DEFAULT_COMPRESS_LEVEL) -> int:
+    """
+    Searches all .png images in a source directory for the original (untranslated) snippet
+    with normalized cross-correlation and pastes the translated patch at every match above the threshold.
+    Images are searched and patched in parallel.
+
+    Args:
+        original_dir_path (str): Path to the directory with original .png images.
+        snippet_image_path (str): Path to the original snippet image to search for.
+        patch_image_path (str): Path to the translated patch image.
+        output_dir_path (str): Path to the directory to save patched images.
+        threshold (float): Minimal correlation score of a match, up to 1.0.
+        offset (tuple): Patch position relative to the top-left corner of a match.
+        jobs (int): Number of worker processes, defaults to CPU count.
+        compress_level (int): PNG compression level of output images, 0-9.
+
+    Returns:
+        int: Number of failed images.
+    """
+    source_dir = Path(original_dir_path)
+    output_dir = Path(output_dir_path)
+
+    if not source_dir.is_dir():
+        print(f"Error: Source directory not found at '{source_dir}'")
+        return 1
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    png_files = sorted(source_dir.glob('*.png'))
+    if not png_files:
+        print(f"No .png files found in '{source_dir}'")
+        return 0
+
+    try:
+        with profiling.stage("load patch") as st:
+            snippet_data = load_patch(snippet_image_path)
+            patch_data = load_patch(patch_image_path)
+            st.add_read_files([snippet_image_path, patch_image_path])
+    except OSError as e:
+        print(f"Error: Snippet or patch image not read - {e}")
+        return len(png_files)
+
+    print(f"Found {len(png_files)} .png files. Locating snippet...")
+    start_time = time.perf_counter()
+    jobs_list = [(str(path), str(output_dir / path.name), threshold, tuple(offset), compress_level) for path in png_files]
+    failures = []
+    match_count = 0
+    work_time = 0.0
+    with profiling.stage("locate and patch", images=len(png_files)) as st, \
+            ProcessPoolExecutor(max_workers=jobs, initializer=init_locate_worker, initargs=(snippet_data, patch_data)) as executor:
+        for path, job, (matches, elapsed, error) in zip(png_files, jobs_list, executor.map(locate_worker, jobs_list)):
+            work_time += elapsed
+            if error is not None:
+                failures.append((path.name, error))
+                continue
+            match_count += len(matches)
+            if matches:
+                found = ", ".join(f"({x}, {y}) {score:.3f}" for x, y, score in matches)
+                print(f"  - '{path.name}': {found}")
+            st.add_read_files([job[0]])
+            st.add_written_files([job[1]])
+        st.set(failed=len(failures), matches=match_count, worker_ms=round(work_time * 1000, 3))
+    total_time = time.perf_counter() - start_time
+
+    print(f"Patched {match_count} matches in {len(png_files) - len(failures)} of {len(png_files)} images in {total_time:.2f} s.")
+    for name, error in failures:
+        print(f"  - Failed '{name}': {error}")
+    return len(failures)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="A tool to paste a patch image onto a single image or a batch of images.",
         formatter_class=argparse.RawTextHelpFormatter # Allows for newlines in help text
     )
+    parser.add_argument("--profile", action="store_true", help="Print per stage summary and the hottest functions (cProfile).")
+    parser.add_argument("--trace", metavar="FILE", help="Save per stage timings, bytes and peak RSS to Chrome trace JSON file.")
     subparsers = parser.add_subparsers(dest="mode", required=True, help="Available modes")
 
     # --- Single image mode ---
@@ -74,10 +520,44 @@ if __name__ == "__main__":
     parser_batch.add_argument("patch_image", help="Path to the patch image file.")
     parser_batch.add_argument("output_dir", help="Path to the directory for patched images.")
     parser_batch.add_argument("-c", "--coords", nargs=2, type=int, required=True, metavar=('X', 'Y'), help="X and Y coordinates to paste the patch.")
+    parser_batch.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes. Defaults to CPU count.")
+    parser_batch.add_argument("-z", "--compress-level", type=int, default=DEFAULT_COMPRESS_LEVEL, choices=range(10), metavar="0-9", help="PNG compression level of output images.")
+
+    # --- Manifest mode ---
+    parser_manifest = subparsers.add_parser("manifest", help="Apply many patches per image, listed in a JSON manifest.\nUnchanged images are skipped.\nUsage: image_patcher.py manifest patches.json")
+    parser_manifest.add_argument("manifest", help="Path to the JSON manifest file.")
+    parser_manifest.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes. Defaults to CPU count.")
+    parser_manifest.add_argument("-z", "--compress-level", type=int, default=DEFAULT_COMPRESS_LEVEL, choices=range(10), metavar="0-9", help="PNG compression level of output images.")
+    parser_manifest.add_argument("-f", "--force", action="store_true", help="Ignore the previous run's record and patch all images.")
+
+    # --- Locate mode ---
+    parser_locate = subparsers.add_parser("locate", help="Find original snippet in all .png images in a directory and paste patch over each match.\nUsage: image_patcher.py locate ./originals_dir snippet.png patch.png ./output_dir -t 0.95")
+    parser_locate.add_argument("original_dir", help="Path to the directory with original .png images.")
+    parser_locate.add_argument("snippet_image", help="Path to the original (untranslated) snippet image to search for.")
+    parser_locate.add_argument("patch_image", help="Path to the patch image file.")
+    parser_locate.add_argument("output_dir", help="Path to the directory for patched images.")
+    parser_locate.add_argument("-t", "--threshold", type=float, default=DEFAULT_THRESHOLD, help="Minimal normalized cross-correlation score of a match, up to 1.0.")
+    parser_locate.add_argument("-o", "--offset", nargs=2, type=int, default=(0, 0), metavar=('DX', 'DY'), help="Patch position relative to the top-left corner of a match.")
+    parser_locate.add_argument("-j", "--jobs", type=int, default=None, help="Number of worker processes. Defaults to CPU count.")
+    parser_locate.add_argument("-z", "--compress-level", type=int, default=DEFAULT_COMPRESS_LEVEL, choices=range(10), metavar="0-9", help="PNG compression level of output images.")
 
     args = parser.parse_args()
+    if args.profile or args.trace:
+        profiler = profiling.enable(f"image_patcher.py {args.mode}", args.trace, args.profile)
 
-    if args.mode == "single":
-        apply_patch(args.original_image, args.patch_image, args.coords[0], args.coords[1], args.output_image)
-    elif args.mode == "batch":
-        batch_patch(args.original_dir, args.patch_image, args.coords[0], args.coords[1], args.output_dir)
+    failed = 0
+    try:
+        if args.mode == "single":
+            apply_patch(args.original_image, args.patch_image, args.coords[0], args.coords[1], args.output_image)
+        elif args.mode == "batch":
+            failed = batch_patch(args.original_dir, args.patch_image, args.coords[0], args.coords[1], args.output_dir,
+                                 args.jobs, args.compress_level)
+        elif args.mode == "locate":
+            failed = locate_patch(args.original_dir, args.snippet_image, args.patch_image, args.output_dir,
+                                  args.threshold, args.offset, args.jobs, args.compress_level)
+        elif args.mode == "manifest":
+            failed = manifest_patch(args.manifest, args.jobs, args.compress_level, args.force)
+    finally:
+        if args.profile or args.trace:
+            profiler.finish()
+    sys.exit(1 if failed else 0)
@@ -1,3 +1,5 @@
 REM python image_patcher.py single original.png patch.png modified.png -c 200 350
-python image_patcher.py batch original patch.png modified -c 50 50
+REM python image_patcher.py manifest patches.json
+REM python image_patcher.py locate original snippet.png patch.png modified -t 0.95
+python image_patcher.py batch original patch.png modified -c 50 50 -z 6
 pause
\ No newline at end of file
@@ -12,15 +12,25 @@ License:   MIT License https://opensource.org/licenses/mit-license.php
 __version__ = "0.4"
 
 import click
+import csv
+import json
+import os
 import struct
-from PIL import Image
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander import profiling  # noqa: E402
+from einhander.bitmap import MAX_TILE_CLUTS, buildImage, decode_tiles, pal15To24, splitImage, split_tiles  # noqa: E402
 
 
 @click.group()
-def cli():
+@profiling.click_options
+def cli(profile, trace):
     """Bitmap image manipulation tool: convert from raw bitmap and palette to image and back.
     """
-    pass
+    profiling.setup_click(profile, trace)
 
 
 @cli.command(name='decode', short_help='build normal image file from raw PSX bitmap and palette')
@@ -41,22 +51,20 @@ def decode(mode, bitmap, palette, width, height, output):
     With '16bpp' it should be PSX direct mode 16 bit per pixel. Palette data is ignored.    
     
     """
-    bitmap_data = bitmap.read()
-    widthValue = int(width, 0)
-    heightValue = int(height, 0)
-    if mode == '16bpp':
-        image = Image.frombytes("RGB", (widthValue, heightValue), bitmap_data, "raw", "RGB;15", 0, 1)
-    else:
-        with open(palette, mode='rb') as palette_file: 
-            palette_data = palette_file.read()
-        if mode == '8bpp':
-            image = Image.frombytes('P', (widthValue, heightValue), bitmap_data, 'raw', 'P')
-        elif mode == '4bpp':
-            swapped_bitmap_data = swapNybbles(bitmap_data)
-            image = Image.frombytes('P', (widthValue, heightValue), swapped_bitmap_data, 'raw', 'P;4')
-        colors = pal15To24(palette_data)
-        image.putpalette(colors)
-    image.save(output)
+    with profiling.stage('read') as st:
+        bitmap_data = bitmap.read()
+        st.add_read(len(bitmap_data))
+        colors = None
+        if mode != '16bpp':
+            with open(palette, mode='rb') as palette_file: 
+                palette_data = palette_file.read()
+                colors = pal15To24(palette_data)
+            st.add_read(len(palette_data))
+    with profiling.stage('build'):
+        image = buildImage(mode, bitmap_data, colors, int(width, 0), int(height, 0))
+    with profiling.stage('save') as st:
+        image.save(output)
+        st.add_written_files([output])
 
 
 
@@ -65,72 +73,239 @@ def decode(mode, bitmap, palette, width, height, output):
 @click.argument('mode', type=click.Choice(['4bpp', '8bpp', '16bpp'], case_sensitive=True))
 @click.option('--bitmap', '-ob', type=click.File('wb'), default='bitmap.bin', help='Output extracted raw bitmap data name.')
 @click.option('--palette', '-op',type=click.File('wb'), default='clut.bin', help='Output extracted palette data name.')
-def split(image, mode, bitmap, palette):
+@click.option('--clut', '-c', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Existing 15 bit CLUT (e.g. original game one) to map colors to.')
+def split(image, mode, bitmap, palette, clut):
     """\b
     Encode IMAGE file to PSX format BITMAP and PALETTE files.
     Raw bitmap format is defined by MODE argument.
     With '8bpp' it will be 8 bit per pixel.
     With '4bpp' it will be in 4 bit ber pixel.
     Palette data will be in 15 bit per color, RGB format. Alpha channel bit will be omitted.
+    Indexed images, which use only first 16 (4bpp) or 256 (8bpp) colors, keep their palette.
+    Other images are quantized to 16 or 256 colors in 15 bit color space,
+    or mapped to nearest colors of CLUT file, which is then written as palette.
     With '16bpp' it will be in PSX direct mode 16 bit per pixel.
 
     """
-    with Image.open(image) as original_image:
-        if mode == '4bpp':
-            MAX_COLORS = 16
-            pal_image = original_image.convert('P')
-            color_count = pal_image.getcolors(maxcolors=MAX_COLORS + 1)
-            if color_count is None:
-                raise ValueError("ERROR: Image has more than 16 unique colors! Aborting.")
-                
-            bitmap_data = pal_image.tobytes('raw', 'P;4')
-            bitmap.write(swapNybbles(bitmap_data)) 
-            
-            palette_data = pal_image.getpalette()
-            cropped_palette_data = palette_data[:MAX_COLORS * 3]
-            palette.write(pal24To15(cropped_palette_data))
-
-        elif mode == '8bpp':
-            bitmap.write(bitmap_data)
-            palette_data = image.getpalette()
-            palette.write(pal24To15(palette_data))
-        elif mode == '16bpp':
-            bitmap_data = original_image.tobytes("raw")
-            bitmap_data_15bpp = pal24To15(bitmap_data)
-            bitmap.write(bitmap_data_15bpp)
-            
-        
-def chunker(seq, size):
-    return (seq[pos:pos + size] for pos in range(0, len(seq), size))   
-    
-# Convert array of 24bpp RGB pixels to 15bpp BGR Little Endian pixels bytes
-def pal24To15(colors):
-    palBytes = []
-    for group in chunker(colors, 3):
-        r = group[0] >> 3
-        g = group[1] >> 3
-        b = group[2] >> 3
-        colorRgb15 = ((b << 10) + (g << 5) + r).to_bytes(2, 'little')
-        palBytes += colorRgb15
-    return bytes(palBytes)
-# Convert 15bpp BGR Little Endian pixels bytes to 24bpp RGB array of int colors
-def pal15To24(palBytes):
-    colors = []
-    for group in chunker (palBytes, 2):
-        color = int.from_bytes(group, "little")
-        b = ((color >> 10) & 0x1F) << 3
-        g = ((color >> 5) & 0x1F) << 3
-        r = (color  & 0x1F) << 3
-        colors.append(r)
-        colors.append(g)
-        colors.append(b)
-
-    return colors
-
-def swapNybbles(data):      
-    swappedArray = map(lambda x: ((x & 0xF) << 4) | ((x >> 4) & 0xF), data)
-    return bytes(swappedArray) 
-        
+    from PIL import Image
+    with profiling.stage('load and split') as st:
+        clut_data = None
+        if clut is not None:
+            with open(clut, 'rb') as clut_file:
+                clut_data = clut_file.read()
+            st.add_read(len(clut_data))
+        with Image.open(image) as original_image:
+            bitmap_data, palette_data = splitImage(original_image, mode, clut_data)
+        st.add_read_files([image])
+    with profiling.stage('write') as st:
+        bitmap.write(bitmap_data)
+        st.add_written(len(bitmap_data))
+        if palette_data is not None:
+            palette.write(palette_data)
+            st.add_written(len(palette_data))
+
+
+@cli.command(name='decode_tiles', short_help='build image file from 4bpp bitmap with CLUT per tile')
+@click.argument('bitmap', type=click.File('rb'))
+@click.option('--palette', '-p', type=click.File('rb'), default='clut.bin', help='CLUT set, 16 colors per CLUT.')
+@click.option('--map', '-m', 'tile_map', type=click.File('rb'), default='tile_map.bin', help='CLUT number of each tile.')
+@click.argument('width')
+@click.argument('height')
+@click.option('--tile_width', '-tw', type=click.IntRange(1), default=16, show_default=True, help='Tile width in pixels.')
+@click.option('--tile_height', '-th', type=click.IntRange(1), default=16, show_default=True, help='Tile height in pixels.')
+@click.option('--output', '-o', type=click.Path(), default='image.png', help='Output built image file name.')
+def decodeTiles(bitmap, palette, tile_map, width, height, tile_width, tile_height, output):
+    """\b
+    Build RGB image file from raw 4bpp BITMAP, where each tile has its own CLUT,
+    as encoded by encode_tiles.
+    WIDTH and HEIGHT specify output image size.
+    PALETTE is a set of 15 bit CLUTs of 16 colors each.
+    MAP has one byte per tile: number of its CLUT in PALETTE. Tiles go in rows
+    from top left corner, last column and row are cut by image size.
+
+    """
+    with profiling.stage('read') as st:
+        bitmap_data = bitmap.read()
+        palette_data = palette.read()
+        tile_map_data = tile_map.read()
+        st.add_read(len(bitmap_data) + len(palette_data) + len(tile_map_data))
+    with profiling.stage('build'):
+        image = decode_tiles(bitmap_data, palette_data, tile_map_data, int(width, 0), int(height, 0),
+                             tile_width, tile_height)
+    with profiling.stage('save') as st:
+        image.save(output)
+        st.add_written_files([output])
+
+
+@cli.command(name='encode_tiles', short_help='encode image file to 4bpp bitmap with CLUT per tile')
+@click.argument('image')
+@click.option('--cluts', '-n', type=click.IntRange(1, MAX_TILE_CLUTS), default=4, show_default=True,
+              help='Number of 16 color CLUTs shared by tiles.')
+@click.option('--tile_width', '-tw', type=click.IntRange(1), default=16, show_default=True, help='Tile width in pixels.')
+@click.option('--tile_height', '-th', type=click.IntRange(1), default=16, show_default=True, help='Tile height in pixels.')
+@click.option('--bitmap', '-ob', type=click.File('wb'), default='bitmap.bin', help='Output raw 4bpp bitmap data name.')
+@click.option('--palette', '-op', type=click.File('wb'), default='clut.bin', help='Output CLUT set name.')
+@click.option('--map', '-om', 'tile_map', type=click.File('wb'), default='tile_map.bin', help='Output tile map name.')
+@click.option('--clut', '-c', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Existing CLUT set (e.g. original game one) to choose tiles CLUTs from.')
+def encodeTiles(image, cluts, tile_width, tile_height, bitmap, palette, tile_map, clut):
+    """\b
+    Encode IMAGE file with more than 16 colors to 4bpp BITMAP, keeping it half
+    the size of 8bpp one. Image is split to tiles, tiles are clustered to
+    CLUTS shared 16 color CLUTs, written to PALETTE one after another, and
+    each tile pixels are mapped to its CLUT colors.
+    MAP gets one byte per tile: number of its CLUT, see decode_tiles.
+    With CLUT set file, tiles get its CLUTs, which give least color error,
+    and it's written as PALETTE.
+
+    """
+    from PIL import Image
+    with profiling.stage('load and split') as st:
+        clut_data = None
+        if clut is not None:
+            with open(clut, 'rb') as clut_file:
+                clut_data = clut_file.read()
+            st.add_read(len(clut_data))
+        with Image.open(image) as original_image:
+            (bitmap_data, palette_data, tile_map_data) = split_tiles(original_image, tile_width, tile_height,
+                                                                     cluts, clut_data)
+        st.add_read_files([image])
+    with profiling.stage('write') as st:
+        bitmap.write(bitmap_data)
+        palette.write(palette_data)
+        tile_map.write(tile_map_data)
+        st.add_written(len(bitmap_data) + len(palette_data) + len(tile_map_data))
+
+
+@cli.command(name='batch', short_help='decode and encode many bitmaps listed in manifest')
+@click.argument('manifest', type=click.Path(exists=True))
+@click.option('--jobs', '-j', type=int, default=None, help='Number of worker processes. Defaults to CPU count.')
+def batch(manifest, jobs):
+    """\b
+    Convert every entry of MANIFEST file in a pool of worker processes.
+    MANIFEST is a JSON list of objects or a CSV file with header row.
+    Each entry has following fields:
+    action - 'decode' (default) or 'encode'.
+    mode - '4bpp', '8bpp' or '16bpp'.
+    For 'decode': bitmap, palette, width, height, output.
+    For 'encode': image, bitmap, palette (palette is not written for '16bpp'),
+    optional clut - CLUT to map colors to, as in encode.
+    Relative paths are resolved from MANIFEST folder.
+    Each palette file is read and converted only once and shared between workers.
+    Failed entries are reported and do not stop the batch.
+
+    """
+    with profiling.stage('palettes') as st:
+        entries = readManifest(manifest)
+        palettes = {}
+        for entry in entries:
+            palette_name = entry.get('palette')
+            if entry['action'] == 'decode' and entry.get('mode') != '16bpp' and palette_name \
+                    and palette_name not in palettes:
+                try:
+                    with open(palette_name, 'rb') as palette_file:
+                        palettes[palette_name] = pal15To24(palette_file.read())
+                except OSError as e:
+                    palettes[palette_name] = None
+                    click.echo(f"Palette {palette_name} not read: {e}", err=True)
+        st.add_read_files(name for name in palettes if palettes[name] is not None)
+
+    start_time = time.perf_counter()
+    failures = 0
+    work_time = 0.0
+    with profiling.stage('convert', entries=len(entries)) as st, \
+            ProcessPoolExecutor(max_workers=jobs, initializer=initBatchWorker, initargs=(palettes,)) as executor:
+        for (entry, (elapsed, error)) in zip(entries, executor.map(convertEntry, entries)):
+            target = entry.get('output') if entry['action'] == 'decode' else entry.get('bitmap')
+            work_time += elapsed
+            if error is None:
+                click.echo(f"{entry['action']} {target}: {elapsed * 1000:.1f} ms")
+                if entry['action'] == 'decode':
+                    st.add_read_files([entry['bitmap']])
+                    st.add_written_files([target])
+                else:
+                    st.add_read_files([entry['image']])
+                    st.add_written_files([target] + ([entry['palette']] if entry['mode'] != '16bpp' else []))
+            else:
+                failures += 1
+                click.echo(f"{entry['action']} {target}: FAILED: {error}", err=True)
+        st.set(failed=failures, worker_ms=round(work_time * 1000, 3))
+    total_time = time.perf_counter() - start_time
+    click.echo(f"Converted {len(entries) - failures} of {len(entries)} entries in {total_time:.2f} s, {failures} failed.")
+    if failures:
+        raise SystemExit(1)
+
+
+def readManifest(manifest):
+    """
+    Read batch manifest entries from JSON or CSV file.
+    Relative paths are joined with manifest folder, sizes are parsed to ints.
+    """
+    with open(manifest, newline='') as manifest_file:
+        if manifest.lower().endswith('.csv'):
+            entries = list(csv.DictReader(manifest_file))
+        else:
+            entries = json.load(manifest_file)
+    base_dir = os.path.dirname(os.path.abspath(manifest))
+    for entry in entries:
+        entry['action'] = entry.get('action') or 'decode'
+        for key in ('bitmap', 'palette', 'output', 'image', 'clut'):
+            if entry.get(key):
+                entry[key] = os.path.join(base_dir, entry[key])
+        for key in ('width', 'height'):
+            if isinstance(entry.get(key), str):
+                entry[key] = int(entry[key], 0)
+    return entries
+
+
+_batch_palettes = {}
+
+def initBatchWorker(palettes):
+    global _batch_palettes
+    _batch_palettes = palettes
+
+
+def convertEntry(entry):
+    """
+    Convert one manifest entry in worker process.
+    Returns tuple of elapsed seconds and error message (None on success).
+    """
+    start_time = time.perf_counter()
+    try:
+        mode = entry['mode']
+        if entry['action'] == 'decode':
+            colors = None
+            if mode != '16bpp':
+                if not entry.get('palette'):
+                    raise ValueError("palette is not given")
+                colors = _batch_palettes.get(entry['palette'])
+                if colors is None:
+                    raise ValueError(f"palette {entry.get('palette')} is not available")
+            with open(entry['bitmap'], 'rb') as bitmap_file:
+                bitmap_data = bitmap_file.read()
+            image = buildImage(mode, bitmap_data, colors, entry['width'], entry['height'])
+            image.save(entry['output'])
+        elif entry['action'] == 'encode':
+            from PIL import Image
+            clut_data = None
+            if entry.get('clut'):
+                with open(entry['clut'], 'rb') as clut_file:
+                    clut_data = clut_file.read()
+            with Image.open(entry['image']) as original_image:
+                bitmap_data, palette_data = splitImage(original_image, mode, clut_data)
+            with open(entry['bitmap'], 'wb') as bitmap_file:
+                bitmap_file.write(bitmap_data)
+            if palette_data is not None:
+                with open(entry['palette'], 'wb') as palette_file:
+                    palette_file.write(palette_data)
+        else:
+            raise ValueError(f"unknown action {entry['action']}")
+    except Exception as e:
+        return (time.perf_counter() - start_time, f"{type(e).__name__}: {e}")
+    return (time.perf_counter() - start_time, None)
+
+
 if __name__ == '__main__':
     cli()
     
\ No newline at end of file
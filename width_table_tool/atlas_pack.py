@@ -0,0 +1,122 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+atlas_pack
+
+Glyph atlas repacker: glyph rectangles of width table are packed into the
+smallest glyph sheet with skyline bottom-left bin packing.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+from PIL import Image
+
+MAX_SHEET_SIZE = 0x100  # x and y are stored in a byte
+
+
+def skyline_pack(sizes, width, max_height=MAX_SHEET_SIZE):
+    """
+    Pack (w, h) sizes into strip of given width with skyline bottom-left heuristic.
+    Sizes are placed in order given, each at the lowest (then leftmost) position.
+
+    Returns
+    -------
+    (positions, height) : list of (x, y) per size and used height,
+        or None if sizes do not fit in max_height
+
+    """
+    skyline = [[0, 0, width]]  # segments: x, y, width
+    positions = []
+    used_height = 0
+    for (w, h) in sizes:
+        best = None
+        for start in range(len(skyline)):
+            x = skyline[start][0]
+            if x + w > width:
+                break
+            # top of segments, which rectangle at x spans
+            y, covered, num = 0, 0, start
+            while covered < w:
+                y = max(y, skyline[num][1])
+                covered += skyline[num][2] - (x - skyline[num][0] if num == start else 0)
+                num += 1
+            if y + h <= max_height and (best is None or (y, x) < best[:2]):
+                best = (y, x, start)
+        if best is None:
+            return None
+        (y, x, start) = best
+        positions.append((x, y))
+        used_height = max(used_height, y + h)
+        # replace covered segments by new one, keep remainder of the last one
+        end = x + w
+        new = [x, y + h, w]
+        num = start
+        while num < len(skyline) and skyline[num][0] < end:
+            seg_end = skyline[num][0] + skyline[num][2]
+            if seg_end > end:
+                skyline[num] = [end, skyline[num][1], seg_end - end]
+                break
+            del skyline[num]
+        skyline.insert(start, new)
+        # merge neighbours of the same height
+        merged = [skyline[0]]
+        for seg in skyline[1:]:
+            if seg[1] == merged[-1][1]:
+                merged[-1] = [merged[-1][0], seg[1], merged[-1][2] + seg[2]]
+            else:
+                merged.append(seg)
+        skyline[:] = merged
+    return (positions, used_height)
+
+
+def pack_glyphs(rects, align=8, padding=0, max_width=MAX_SHEET_SIZE):
+    """
+    Find smallest sheet for glyph rectangles. Glyphs sharing one rectangle are packed once.
+    Sheet sides are multiples of align (e.g. 4 for 4bpp VRAM words).
+
+    Returns
+    -------
+    (boxes, placements, (width, height)) : tuple
+        boxes - unique source (x, y, w, h) rectangles,
+        placements - new (x, y) for each box, sheet size
+
+    """
+    boxes = list(dict.fromkeys((r["x"], r["y"], r["w"], r["h"]) for r in rects))
+    order = sorted(range(len(boxes)), key=lambda num: (-boxes[num][3], -boxes[num][2]))
+    sizes = [(boxes[num][2] + padding, boxes[num][3] + padding) for num in order]
+    widest = max((w for (w, _) in sizes), default=1)
+    best = None
+    for width in range(-(-widest // align) * align, max_width + 1, align):
+        packed = skyline_pack(sizes, width)
+        if packed is None:
+            continue
+        height = -(-max(packed[1], 1) // align) * align
+        if best is None or (width * height, height) < (best[1][0] * best[1][1], best[1][1]):
+            best = (packed[0], (width, height))
+    if best is None:
+        raise ValueError(f"Glyphs do not fit in {max_width}x{MAX_SHEET_SIZE} sheet")
+    placements = [None] * len(boxes)
+    for num, position in zip(order, best[0]):
+        placements[num] = position
+    return (boxes, placements, best[1])
+
+
+def repack_atlas(rects, sheet, align=8, padding=0, max_width=MAX_SHEET_SIZE):
+    """
+    Repack glyph sheet image. Returns new rects list with updated x and y, and new sheet image
+    of the same mode (and palette) as original, filled with its top left pixel.
+    """
+    (boxes, placements, size) = pack_glyphs(rects, align, padding, max_width)
+    packed = Image.new(sheet.mode, size, sheet.getpixel((0, 0)))
+    if sheet.mode == 'P':
+        packed.putpalette(sheet.getpalette())
+    moved = {}
+    for (x, y, w, h), (new_x, new_y) in zip(boxes, placements):
+        packed.paste(sheet.crop((x, y, x + w, y + h)), (new_x, new_y))
+        moved[(x, y, w, h)] = (new_x, new_y)
+    new_rects = []
+    for r in rects:
+        (new_x, new_y) = moved[(r["x"], r["y"], r["w"], r["h"])]
+        new_rects.append(dict(r, x=new_x, y=new_y))
+    return (new_rects, packed)
@@ -0,0 +1,175 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+glyph_detect
+
+Automatic glyph boxes detection on font glyph sheet: non-background pixels
+are labeled in connected regions, regions are merged into glyphs, boxes are
+snapped to grid and trims are computed from pixel column coverage.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import numpy as np
+from width_table import FIELD_SCHEMA, FIRST_CODE
+
+
+def foreground_mask(image, background=None):
+    """
+    Return boolean mask of non-background pixels of PIL image.
+    Background is given pixel value, or top left pixel value by default.
+    Fully transparent pixels are background as well.
+    """
+    pixels = np.asarray(image)
+    if background is None:
+        background = pixels[0, 0]
+    mask = pixels != np.asarray(background, dtype=pixels.dtype)
+    if mask.ndim == 3:
+        mask = mask.any(axis=2)
+        if image.mode in ('RGBA', 'LA'):
+            mask &= pixels[..., -1] > 0
+    return mask
+
+
+def label_components(mask):
+    """
+    Label 8-connected regions of mask. Each region gets the smallest flat index
+    of its pixels, background is -1. Labels are propagated with whole-array
+    minimum filters until stable.
+    """
+    height, width = mask.shape
+    big = height * width
+    labels = np.where(mask, np.arange(big).reshape(height, width), big)
+    padded = np.full((height + 2, width + 2), big, dtype=labels.dtype)
+    while True:
+        padded[1:-1, 1:-1] = labels
+        neighbours = padded[1:-1, 1:-1].copy()
+        for dy in (0, 1, 2):
+            for dx in (0, 1, 2):
+                np.minimum(neighbours, padded[dy:dy + height, dx:dx + width], out=neighbours)
+        neighbours[~mask] = big
+        # pointer jumping: follow label of the label to converge in fewer passes
+        flat = neighbours.ravel()
+        jumped = np.where(flat < big, np.minimum(flat, labels.ravel()[np.minimum(flat, big - 1)]), big)
+        jumped = jumped.reshape(height, width)
+        if np.array_equal(jumped, labels):
+            break
+        labels = jumped
+    return np.where(mask, labels, -1)
+
+
+def component_boxes(labels):
+    """
+    Return array of (x0, y0, x1, y1) inclusive bounding boxes, one per labeled region.
+    """
+    ys, xs = np.nonzero(labels >= 0)
+    _, inverse = np.unique(labels[ys, xs], return_inverse=True)
+    count = inverse.max() + 1 if inverse.size else 0
+    boxes = np.empty((count, 4), dtype=np.int64)
+    boxes[:, :2] = np.iinfo(np.int64).max
+    boxes[:, 2:] = -1
+    np.minimum.at(boxes[:, 0], inverse, xs)
+    np.minimum.at(boxes[:, 1], inverse, ys)
+    np.maximum.at(boxes[:, 2], inverse, xs)
+    np.maximum.at(boxes[:, 3], inverse, ys)
+    return boxes
+
+
+def merge_boxes(boxes, mask, grid=None):
+    """
+    Merge region boxes into glyph boxes.
+    With grid (cell width, cell height) all regions, whose center falls in one cell,
+    form one glyph, and dict of (column, row) cell key to glyph box is returned, so each
+    cell has one glyph. Without grid, regions in one text line (band of rows with
+    foreground pixels) form one glyph, if their columns overlap (e.g. dots of 'i' and 'j'),
+    and list of glyph boxes is returned.
+    """
+    merged = {}
+    if grid is not None:
+        (cell_w, cell_h) = grid
+        keys = zip((boxes[:, 0] + boxes[:, 2]) // 2 // cell_w, (boxes[:, 1] + boxes[:, 3]) // 2 // cell_h)
+        for key, box in zip(keys, boxes):
+            merged.setdefault((int(key[0]), int(key[1])), []).append(box)
+        return {key: np.concatenate((np.min(group, axis=0)[:2], np.max(group, axis=0)[2:]))
+                for (key, group) in merged.items()}
+
+    rows = np.concatenate(([False], mask.any(axis=1), [False]))
+    edges = np.flatnonzero(rows[1:] != rows[:-1])
+    band_of_row = np.zeros(mask.shape[0], dtype=np.int64)
+    for band, (start, end) in enumerate(zip(edges[::2], edges[1::2])):
+        band_of_row[start:end] = band
+    glyphs = []
+    for band in np.unique(band_of_row[boxes[:, 1]]) if len(boxes) else []:
+        band_boxes = boxes[band_of_row[boxes[:, 1]] == band]
+        band_boxes = band_boxes[np.argsort(band_boxes[:, 0], kind='stable')]
+        current = band_boxes[0].copy()
+        for box in band_boxes[1:]:
+            if box[0] <= current[2]:  # columns overlap
+                current[:2] = np.minimum(current[:2], box[:2])
+                current[2:] = np.maximum(current[2:], box[2:])
+            else:
+                glyphs.append(current)
+                current = box.copy()
+        glyphs.append(current)
+    return glyphs
+
+
+def detect_glyphs(image, grid=None, background=None, first_code=FIRST_CODE):
+    """
+    Detect glyph rectangles on glyph sheet image.
+
+    Parameters
+    ----------
+    image : PIL.Image
+        Glyph sheet
+    grid : tuple of ints or None
+        (cell width, cell height) to snap glyph boxes to. Boxes become whole cells,
+        glyph extents inside a cell go to trimLeft and trimRight. Each cell up to
+        the last one with ink is a glyph, blank cells get zero ink width.
+        Without grid boxes are tight.
+    background : pixel value or None
+        Background pixel value, top left pixel by default
+    first_code : int
+        Code of first glyph for names, glyphs are numbered in rows order
+        (grid cells, or text lines without grid)
+
+    Returns
+    -------
+    rects : list of dicts
+        Glyph rectangles in width table JSON schema
+
+    """
+    mask = foreground_mask(image, background)
+    boxes = component_boxes(label_components(mask))
+    glyphs = merge_boxes(boxes, mask, grid)
+    if grid is None:
+        glyphs = [(box, np.flatnonzero(mask[box[1]:box[3] + 1, box[0]:box[2] + 1].any(axis=0))) for box in glyphs]
+    else:
+        (cell_w, cell_h) = grid
+        per_row = -(-mask.shape[1] // cell_w)
+        # every cell up to the last one with ink is a glyph, so codes follow cell positions
+        last = max((row * per_row + column for (column, row) in glyphs), default=-1)
+        cells = []
+        for index in range(last + 1):
+            (row, column) = divmod(index, per_row)
+            cell = np.minimum([column * cell_w, row * cell_h, column * cell_w + cell_w - 1, row * cell_h + cell_h - 1],
+                              [mask.shape[1] - 1, mask.shape[0] - 1] * 2)
+            box = glyphs.get((column, row))
+            if box is None:  # blank cell, e.g. space
+                cells.append((cell, np.empty(0, dtype=np.int64)))
+                continue
+            # glyph ink clipped to its cell, without ink of neighbour glyphs reaching into it
+            (left, right) = (max(box[0], cell[0]), min(box[2], cell[2]))
+            columns = np.flatnonzero(mask[cell[1]:cell[3] + 1, left:right + 1].any(axis=0)) + (left - cell[0])
+            cells.append((cell, columns))
+        glyphs = cells
+    rects = []
+    for num, ((x0, y0, x1, y1), columns) in enumerate(glyphs):
+        r = dict(FIELD_SCHEMA)
+        r.update({"name": f"glyph_{first_code + num:X}", "x": int(x0), "y": int(y0),
+                  "w": int(x1 - x0 + 1), "h": int(y1 - y0 + 1),
+                  "trimLeft": int(columns[0]) if columns.size else 0,
+                  "trimRight": int(x1 - x0 - columns[-1]) if columns.size else int(x1 - x0 + 1)})
+        rects.append(r)
+    return rects
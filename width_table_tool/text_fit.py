@@ -0,0 +1,161 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+text_fit
+
+Text fit measurement over font width tables: rendered widths of many script
+lines are computed at once from glyph margins and trims, and lines which
+overflow their boxes are reported.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import numpy as np
+from width_table import FIRST_CODE, LINE_BREAK
+
+MARGIN_RULES = ('sum', 'max')
+
+
+def load_charmap(file_name):
+    """
+    Load character table in common romhacking .tbl format: 'XX=c' lines,
+    XX is hex glyph code. Returns dict of character to code.
+    """
+    charmap = {}
+    with open(file_name, encoding='utf-8') as tbl_file:
+        for line in tbl_file:
+            line = line.rstrip('\r\n')
+            if '=' not in line:
+                continue
+            (code, char) = line.split('=', 1)
+            if char:
+                charmap[char] = int(code, 16)
+    return charmap
+
+
+class TextMeasurer:
+    """
+    Measures rendered widths of strings in pixels. Width table is loaded once into
+    dense per-code arrays: glyph ink width (w - trimLeft - trimRight), leftMargin
+    and rightMargin.
+    Margin rule 'sum' adds both margins of each glyph. Rule 'max' is kerning-like:
+    margins of adjacent glyphs collapse into the larger one, outer margins of first
+    and last glyphs are kept.
+    Characters missing in charmap or table have zero width and are collected in
+    unknown set. Results are cached per string.
+    """
+
+    def __init__(self, rects, charmap=None, first_code=FIRST_CODE, margin_rule='sum'):
+        if margin_rule not in MARGIN_RULES:
+            raise ValueError(f"Unknown margin rule '{margin_rule}'")
+        size = first_code + len(rects) + 1  # last slot is zero width unknown glyph
+        self.first_code = first_code
+        self.unknown_code = size - 1
+        self.ink = np.zeros(size, dtype=np.int64)
+        self.left = np.zeros(size, dtype=np.int64)
+        self.right = np.zeros(size, dtype=np.int64)
+        fields = np.array([[r.get(k, 0) for k in ("w", "trimLeft", "trimRight", "leftMargin", "rightMargin")]
+                           for r in rects], dtype=np.int64).reshape(-1, 5)
+        codes = slice(first_code, first_code + len(rects))
+        self.ink[codes] = np.maximum(0, fields[:, 0] - fields[:, 1] - fields[:, 2])
+        self.left[codes] = fields[:, 3]
+        self.right[codes] = fields[:, 4]
+        if charmap is None:
+            charmap = {chr(code): code for code in range(first_code, first_code + len(rects))}
+        self.charmap = {char: code for char, code in charmap.items() if 0 <= code < self.unknown_code}
+        self.margin_rule = margin_rule
+        self.unknown = set()
+        self._cache = {}
+
+    def codes(self, text):
+        """
+        Convert string to array of glyph codes. Multi-character charmap entries are not used.
+        """
+        codes = [self.charmap.get(char, self.unknown_code) for char in text]
+        if self.unknown_code in codes:
+            self.unknown.update(char for char in text if char not in self.charmap)
+        return np.array(codes, dtype=np.int64)
+
+    def measure_many(self, texts):
+        """
+        Measure list of strings in one vectorized pass, return array of widths in pixels.
+        """
+        texts = list(texts)
+        todo = list(dict.fromkeys(text for text in texts if text not in self._cache))
+        if todo:
+            code_arrays = [self.codes(text) for text in todo]
+            lengths = np.array([len(codes) for codes in code_arrays], dtype=np.int64)
+            codes = np.concatenate(code_arrays) if code_arrays else np.zeros(0, dtype=np.int64)
+            ids = np.repeat(np.arange(len(todo)), lengths)
+            per_char = self.ink[codes].copy()
+            if self.margin_rule == 'sum':
+                per_char += self.left[codes] + self.right[codes]
+            else:
+                starts = np.ones(len(codes), dtype=bool)
+                starts[1:] = ids[1:] != ids[:-1]
+                ends = np.roll(starts, -1)
+                ends[-1:] = True
+                per_char += np.where(starts, self.left[codes], 0) + np.where(ends, self.right[codes], 0)
+                # gap between glyph and its right neighbour in the same string
+                inner = ~ends[:-1]
+                gaps = np.maximum(self.right[codes[:-1]], self.left[codes[1:]])
+                per_char[:-1] += np.where(inner, gaps, 0)
+            widths = np.bincount(ids, weights=per_char, minlength=len(todo)).astype(np.int64)
+            self._cache.update(zip(todo, widths.tolist()))
+        return np.array([self._cache[text] for text in texts], dtype=np.int64)
+
+    def measure(self, text):
+        return int(self.measure_many([text])[0])
+
+    def layout(self, text):
+        """
+        Lay out string with the same rules as measure.
+        Returns glyph codes and x position of each glyph ink, and the string width.
+        """
+        codes = self.codes(text)
+        if not len(codes):
+            return (codes, np.zeros(0, dtype=np.int64), 0)
+        ink, left, right = self.ink[codes], self.left[codes], self.right[codes]
+        if self.margin_rule == 'sum':
+            advance = left + ink + right
+            ink_x = np.concatenate(([0], np.cumsum(advance)[:-1])) + left
+        else:
+            steps = ink[:-1] + np.maximum(right[:-1], left[1:])
+            ink_x = left[0] + np.concatenate(([0], np.cumsum(steps)))
+        return (codes, ink_x, int(ink_x[-1] + ink[-1] + right[-1]))
+
+
+def read_script(file_name, line_break=LINE_BREAK):
+    """
+    Read script dump: one entry per line, 'BOX<TAB>text' or just text.
+    Entry text is split to rendered lines on line_break sequence.
+    Returns list of (line number, box name or None, list of rendered lines).
+    """
+    entries = []
+    with open(file_name, encoding='utf-8') as script_file:
+        for num, line in enumerate(script_file, 1):
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            (box, text) = line.split('\t', 1) if '\t' in line else (None, line)
+            entries.append((num, box, text.split(line_break) if line_break else [text]))
+    return entries
+
+
+def find_overflows(measurer, entries, limits, default_limit):
+    """
+    Measure all script entries and return list of (line number, box, text, width, limit)
+    for entries, which have a rendered line wider than their box limit.
+    """
+    lines = [text for (_, _, texts) in entries for text in texts]
+    widths = measurer.measure_many(lines)
+    overflows = []
+    pos = 0
+    for (num, box, texts) in entries:
+        width = int(widths[pos:pos + len(texts)].max()) if texts else 0
+        pos += len(texts)
+        limit = limits.get(box, default_limit)
+        if limit is not None and width > limit:
+            overflows.append((num, box, LINE_BREAK.join(texts), width, limit))
+    return overflows
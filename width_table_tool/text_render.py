@@ -0,0 +1,126 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+text_render
+
+QA rendering of script lines with font width table and glyph sheet: lines are
+laid out as by text_fit measurement and composed into contact sheet images.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw
+from glyph_detect import foreground_mask
+from text_fit import TextMeasurer
+
+LABEL_WIDTH = 48  # left column of contact sheet with line numbers
+ROW_PADDING = 2
+BACKGROUND = (32, 32, 48, 255)
+LIMIT_COLOR = (255, 64, 64, 255)
+LABEL_COLOR = (160, 160, 160, 255)
+
+
+class TextRenderer:
+    """
+    Renders strings with glyphs cut from glyph sheet. All glyph ink bitmaps are
+    cut once on creation, sheet background becomes transparent.
+    """
+
+    def __init__(self, rects, sheet, charmap=None, margin_rule='sum'):
+        self.measurer = TextMeasurer(rects, charmap, margin_rule=margin_rule)
+        rgba = sheet.convert('RGBA')
+        alpha = np.asarray(rgba)[..., 3] * foreground_mask(sheet)
+        rgba.putalpha(Image.fromarray(alpha.astype(np.uint8), 'L'))
+        self.glyphs = {}  # code -> (ink bitmap, top margin)
+        for num, r in enumerate(rects):
+            left = r.get("x", 0) + r.get("trimLeft", 0)
+            right = r.get("x", 0) + r.get("w", 1) - r.get("trimRight", 0)
+            if right > left:
+                bitmap = rgba.crop((left, r.get("y", 0), right, r.get("y", 0) + r.get("h", 1)))
+                self.glyphs[self.measurer.first_code + num] = (bitmap, r.get("topMargin", 0))
+        self.line_height = max((r.get("h", 1) + r.get("topMargin", 0) for r in rects), default=1)
+
+    def render(self, text):
+        """
+        Render one line to transparent RGBA image of its measured width.
+        """
+        (codes, ink_x, width) = self.measurer.layout(text)
+        image = Image.new('RGBA', (max(width, 1), self.line_height), (0, 0, 0, 0))
+        for code, x in zip(codes.tolist(), ink_x.tolist()):
+            glyph = self.glyphs.get(code)
+            if glyph is not None:
+                image.alpha_composite(glyph[0], (x, glyph[1]))
+        return image
+
+    def contact_sheet(self, entries, limits=None, default_limit=None, scale=1):
+        """
+        Render script entries (line number, box, list of rendered lines) one under another,
+        with line numbers and red marks at box limits.
+        """
+        limits = limits or {}
+        rows = [(num, limits.get(box, default_limit), [self.render(text) for text in texts])
+                for (num, box, texts) in entries]
+        width = max([max(img.width for img in images) for (_, _, images) in rows if images] +
+                    [limit or 0 for (_, limit, _) in rows] + [1])
+        row_heights = [len(images) * self.line_height + ROW_PADDING for (_, _, images) in rows]
+        sheet = Image.new('RGBA', (width + 2, sum(row_heights) + ROW_PADDING), BACKGROUND)
+        y = ROW_PADDING
+        for (num, limit, images), height in zip(rows, row_heights):
+            for line, image in enumerate(images):
+                sheet.alpha_composite(image, (1, y + line * self.line_height))
+            if limit is not None:
+                ImageDraw.Draw(sheet).line([(limit + 1, y), (limit + 1, y + height - ROW_PADDING - 1)], fill=LIMIT_COLOR)
+            y += height
+        if scale != 1:
+            sheet = sheet.resize((sheet.width * scale, sheet.height * scale), Image.NEAREST)
+        labeled = Image.new('RGBA', (sheet.width + LABEL_WIDTH, sheet.height), BACKGROUND)
+        labeled.alpha_composite(sheet, (LABEL_WIDTH, 0))
+        draw = ImageDraw.Draw(labeled)
+        y = ROW_PADDING * scale
+        for (num, _, _), height in zip(rows, row_heights):
+            draw.text((2, y), str(num), fill=LABEL_COLOR)
+            y += height * scale
+        return labeled
+
+
+_worker_renderer = None
+
+def init_render_worker(rects, sheet_name, charmap, margin_rule):
+    global _worker_renderer
+    with Image.open(sheet_name) as sheet:
+        _worker_renderer = TextRenderer(rects, sheet, charmap, margin_rule)
+
+
+def render_sheet_worker(job):
+    """
+    Render one contact sheet in worker process.
+    Returns elapsed seconds and error message (None on success).
+    """
+    (entries, limits, default_limit, scale, out_name) = job
+    start_time = time.perf_counter()
+    try:
+        _worker_renderer.contact_sheet(entries, limits, default_limit, scale).save(out_name)
+    except Exception as e:
+        return (time.perf_counter() - start_time, f"{type(e).__name__}: {e}")
+    return (time.perf_counter() - start_time, None)
+
+
+def render_script(rects, sheet_name, entries, out_dir, per_sheet=64, limits=None, default_limit=None,
+                  charmap=None, margin_rule='sum', scale=1, jobs=None):
+    """
+    Render all script entries to contact sheets 'sheet_NNNN.png' in out_dir, in parallel.
+    Yields (sheet name, elapsed seconds, error message) for each sheet.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs_list = [(entries[start:start + per_sheet], limits, default_limit, scale,
+                  os.path.join(out_dir, f"sheet_{start // per_sheet:04}.png"))
+                 for start in range(0, len(entries), per_sheet)]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_render_worker,
+                             initargs=(rects, sheet_name, charmap, margin_rule)) as executor:
+        for job, (elapsed, error) in zip(jobs_list, executor.map(render_sheet_worker, jobs_list)):
+            yield (job[-1], elapsed, error)
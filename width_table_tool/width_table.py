@@ -0,0 +1,209 @@
+#! /usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+width_table
+
+Width table tool for fonts of "Einhander" game for PSX, without GUI:
+batch converter of width tables and font QA commands.
+
+Author:    Griever
+Web site:  https://github.com/romhack/
+License:   MIT License https://opensource.org/licenses/mit-license.php
+'''
+import json
+import os
+import sys
+import time
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from einhander.widths import (FIELD_SCHEMA, FIRST_CODE, LINE_BREAK, RECORD_DTYPE, RECORD_FIELDS,  # noqa: E402,F401
+                              decode_table, encode_table, records_to_rects, rects_from_binary,
+                              rects_from_json, rects_to_binary, rects_to_json, rects_to_records)
+
+
+def load_binary(file_name):
+    with open(file_name, 'rb') as binf:
+        return rects_from_binary(binf.read())
+
+
+def save_binary(file_name, rects):
+    with open(file_name, 'wb') as outf:
+        outf.write(rects_to_binary(rects))
+
+
+def load_json(file_name):
+    with open(file_name, 'r') as inf:
+        return rects_from_json(inf.read())
+
+
+def save_json(file_name, rects):
+    with open(file_name, 'w') as outf:
+        outf.write(rects_to_json(rects))
+
+
+def convert_files(in_names, out_dir, load, save, extension):
+    for in_name in in_names:
+        out_name = os.path.splitext(os.path.basename(in_name))[0] + extension
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            out_name = os.path.join(out_dir, out_name)
+        else:
+            out_name = os.path.join(os.path.dirname(in_name), out_name)
+        rects = load(in_name)
+        save(out_name, rects)
+        click.echo(f"{in_name} -> {out_name}: {len(rects)} glyphs")
+
+
+@click.group()
+def cli():
+    """Width table tool without GUI: convert font width tables between binary and JSON.
+    """
+    pass
+
+
+@cli.command(name='tojson', short_help='convert binary width tables to JSON')
+@click.argument('in_names', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--out_dir', '-d', type=click.Path(file_okay=False), help='Output folder, input folder by default.')
+def to_json(in_names, out_dir):
+    """
+    Convert binary width tables IN_NAMES to JSON files of the same name.
+    """
+    convert_files(in_names, out_dir, load_binary, save_json, '.json')
+
+
+@cli.command(name='tobin', short_help='convert JSON width tables to binary')
+@click.argument('in_names', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--out_dir', '-d', type=click.Path(file_okay=False), help='Output folder, input folder by default.')
+def to_bin(in_names, out_dir):
+    """
+    Convert JSON width tables IN_NAMES to binary files of the same name.
+    """
+    convert_files(in_names, out_dir, load_json, save_binary, '.bin')
+
+
+@cli.command(name='detect', short_help='detect glyph boxes on glyph sheet')
+@click.argument('image_name', type=click.Path(exists=True))
+@click.option('--grid', '-g', nargs=2, type=int, default=None, help='Grid cell width and height to snap glyph boxes to.')
+@click.option('--first_code', '-f', default='0x20', help='Code of the first detected glyph.')
+@click.option('--out_name', '-o', default='glyphs.json', help='Output width table, binary if name ends with .bin')
+def detect(image_name, grid, first_code, out_name):
+    """\b
+    Detect glyph rectangles on IMAGE_NAME glyph sheet and save width table.
+    Non-background connected regions are merged to glyphs: by grid cells if
+    GRID is given, otherwise by overlapping columns in each text line.
+    With GRID each cell is a glyph, so blank cells keep their codes.
+    Background is the top left pixel color.
+    """
+    from PIL import Image
+    from glyph_detect import detect_glyphs
+    with Image.open(image_name) as image:
+        rects = detect_glyphs(image, grid, first_code=int(first_code, 16))
+    (save_binary if out_name.lower().endswith('.bin') else save_json)(out_name, rects)
+    click.echo(f"{image_name} -> {out_name}: {len(rects)} glyphs")
+
+
+@cli.command(name='fit', short_help='report script lines overflowing their boxes')
+@click.argument('table_name', type=click.Path(exists=True))
+@click.argument('script_name', type=click.Path(exists=True))
+@click.option('--limit', '-w', type=int, default=None, help='Default box width in pixels.')
+@click.option('--limits', '-l', 'limits_name', type=click.Path(exists=True), help='JSON file with box name to width in pixels.')
+@click.option('--charmap', '-c', type=click.Path(exists=True), help='Character table (.tbl), ASCII codes by default.')
+@click.option('--margin_rule', '-r', type=click.Choice(['sum', 'max']), default='sum', help='How margins of adjacent glyphs add up.')
+@click.option('--all', '-a', 'show_all', is_flag=True, help='Print widths of all lines, not only overflowing.')
+def fit(table_name, script_name, limit, limits_name, charmap, margin_rule, show_all):
+    """\b
+    Measure rendered widths of all lines of SCRIPT_NAME with TABLE_NAME width
+    table (binary or JSON) and report lines wider than their box.
+    Script is a text file, one entry per line: 'BOX<TAB>text' or just text.
+    '\\n' in text is a line break. Box limits are taken from LIMITS by box name,
+    otherwise LIMIT is used.
+    """
+    from text_fit import TextMeasurer, load_charmap, read_script, find_overflows
+    rects = (load_binary if table_name.lower().endswith('.bin') else load_json)(table_name)
+    measurer = TextMeasurer(rects, load_charmap(charmap) if charmap else None, margin_rule=margin_rule)
+    limits = {}
+    if limits_name:
+        with open(limits_name) as limits_file:
+            limits = json.load(limits_file)
+    entries = read_script(script_name)
+    if show_all:
+        for (num, box, texts) in entries:
+            text = LINE_BREAK.join(texts)
+            click.echo(f"{num}\t{box or ''}\t{int(measurer.measure_many(texts).max())}\t{text}")
+    overflows = find_overflows(measurer, entries, limits, limit)
+    for (num, box, text, width, box_limit) in overflows:
+        click.echo(f"Line {num}{f' [{box}]' if box else ''}: {width} > {box_limit} px: {text}")
+    if measurer.unknown:
+        click.echo(f"Unknown characters: {''.join(sorted(measurer.unknown))}", err=True)
+    click.echo(f"{len(overflows)} of {len(entries)} entries overflow.")
+
+
+@cli.command(name='render', short_help='render script lines to contact sheets')
+@click.argument('table_name', type=click.Path(exists=True))
+@click.argument('sheet_name', type=click.Path(exists=True))
+@click.argument('script_name', type=click.Path(exists=True))
+@click.option('--out_dir', '-d', type=click.Path(file_okay=False), default='render', help='Output contact sheets folder.')
+@click.option('--per_sheet', '-n', type=int, default=64, help='Script entries per contact sheet.')
+@click.option('--limit', '-w', type=int, default=None, help='Default box width in pixels.')
+@click.option('--limits', '-l', 'limits_name', type=click.Path(exists=True), help='JSON file with box name to width in pixels.')
+@click.option('--charmap', '-c', type=click.Path(exists=True), help='Character table (.tbl), ASCII codes by default.')
+@click.option('--margin_rule', '-r', type=click.Choice(['sum', 'max']), default='sum', help='How margins of adjacent glyphs add up.')
+@click.option('--scale', '-s', type=int, default=2, help='Contact sheet zoom.')
+@click.option('--jobs', '-j', type=int, default=None, help='Number of worker processes. Defaults to CPU count.')
+def render(table_name, sheet_name, script_name, out_dir, per_sheet, limit, limits_name, charmap, margin_rule, scale, jobs):
+    """\b
+    Render all lines of SCRIPT_NAME with TABLE_NAME width table and SHEET_NAME
+    glyph sheet to contact sheet png images, in parallel.
+    Script format and box limits are the same as for fit command,
+    box limits are marked with red lines.
+    """
+    from text_fit import load_charmap, read_script
+    from text_render import render_script
+    rects = (load_binary if table_name.lower().endswith('.bin') else load_json)(table_name)
+    limits = {}
+    if limits_name:
+        with open(limits_name) as limits_file:
+            limits = json.load(limits_file)
+    entries = read_script(script_name)
+    start_time = time.perf_counter()
+    failures = 0
+    for (out_name, elapsed, error) in render_script(rects, sheet_name, entries, out_dir, per_sheet, limits, limit,
+                                                    load_charmap(charmap) if charmap else None, margin_rule, scale, jobs):
+        if error is None:
+            click.echo(f"{out_name}: {elapsed * 1000:.1f} ms")
+        else:
+            failures += 1
+            click.echo(f"{out_name}: FAILED: {error}", err=True)
+    click.echo(f"Rendered {len(entries)} entries in {time.perf_counter() - start_time:.2f} s.")
+    if failures:
+        raise SystemExit(1)
+
+
+@cli.command(name='repack', short_help='repack glyph sheet into smallest size')
+@click.argument('table_name', type=click.Path(exists=True))
+@click.argument('sheet_name', type=click.Path(exists=True))
+@click.option('--out_table', '-o', default='glyphs_packed.json', help='Output width table, binary if name ends with .bin')
+@click.option('--out_sheet', '-i', default='glyphs_packed.png', help='Output glyph sheet image.')
+@click.option('--align', '-a', type=int, default=8, help='Sheet width and height alignment in pixels.')
+@click.option('--padding', '-p', type=int, default=0, help='Free pixels right and below each glyph.')
+@click.option('--max_width', '-m', type=int, default=0x100, help='Maximal sheet width in pixels.')
+def repack(table_name, sheet_name, out_table, out_sheet, align, padding, max_width):
+    """\b
+    Repack glyphs of TABLE_NAME width table on SHEET_NAME glyph sheet into
+    the smallest sheet with skyline bin packing. Glyph x and y are rewritten
+    in output table, output sheet keeps image mode and palette, so it can be
+    encoded with psx_bitmap_converter right away.
+    """
+    from PIL import Image
+    from atlas_pack import repack_atlas
+    rects = (load_binary if table_name.lower().endswith('.bin') else load_json)(table_name)
+    with Image.open(sheet_name) as sheet:
+        (new_rects, packed) = repack_atlas(rects, sheet, align, padding, max_width)
+        click.echo(f"{sheet.width}x{sheet.height} -> {packed.width}x{packed.height}")
+    packed.save(out_sheet)
+    (save_binary if out_table.lower().endswith('.bin') else save_json)(out_table, new_rects)
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,25 +1,14 @@
 import tkinter as tk
-from tkinter import messagebox, filedialog
+from tkinter import messagebox, filedialog, simpledialog
 from PIL import Image, ImageTk
 import json
-import struct
-
-# === CONFIGURATION ===
-FIELD_SCHEMA = {
-    "name": "",
-    "x": 0,
-    "y": 0,
-    "w": 1,
-    "h": 1,
-    "leftMargin": 0,
-    "topMargin": 0,
-    "rightMargin": 0,
-    "unknown1": 0,
-    "trimLeft": 0,
-    "trimRight": 0,
-    "unknown2": 0,
-    "unknown3": 0
-}
+from collections import OrderedDict
+import width_table
+from glyph_detect import detect_glyphs
+from width_table import FIELD_SCHEMA
+
+TILE_SIZE = 64  # zoom tile side, in original image pixels
+TILE_CACHE_SIZE = 256  # scaled tiles kept in memory
 
 scale = 2
 original_img = Image.open("glyphs.png")
@@ -30,7 +19,8 @@ root.iconphoto(True, icon_img)
 root.title("Width Table Tool")
 
 rects = []
-canvas_ids = []
+canvas_ids = []  # rectangle item ids, parallel to rects
+canvas_state = []  # (coords, outline color) last drawn for each item
 selected_index = None
 
 frame = tk.Frame(root)
@@ -48,22 +38,64 @@ hbar.pack(side=tk.BOTTOM, fill=tk.X)
 vbar = tk.Scrollbar(canvas_frame, orient=tk.VERTICAL)
 vbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-def update_scaled_image():
-    global scaled_img, tk_img, img_width, img_height
-    scaled_img = original_img.resize((original_img.width * scale, original_img.height * scale), Image.NEAREST)
-    img_width, img_height = scaled_img.size
-    tk_img = ImageTk.PhotoImage(scaled_img)
-
-update_scaled_image()
+tile_cache = OrderedDict()  # (scale, tx, ty) -> scaled tile PhotoImage, LRU order
+tile_items = {}  # (tx, ty) -> (canvas image id, PhotoImage) of tiles currently on canvas
+render_pending = False
 
-canvas = tk.Canvas(canvas_frame, width=original_img.width * 2, height=original_img.height * 2, bg='white', xscrollcommand=hbar.set, yscrollcommand=vbar.set)
+def update_scaled_image():
+    global img_width, img_height
+    img_width, img_height = original_img.width * scale, original_img.height * scale
+    for item, _ in tile_items.values(): canvas.delete(item)
+    tile_items.clear()
+
+def get_tile(tx, ty):
+    key = (scale, tx, ty)
+    tile = tile_cache.get(key)
+    if tile is not None:
+        tile_cache.move_to_end(key)
+        return tile
+    box = (tx * TILE_SIZE, ty * TILE_SIZE, min((tx + 1) * TILE_SIZE, original_img.width), min((ty + 1) * TILE_SIZE, original_img.height))
+    region = original_img.crop(box)
+    tile = ImageTk.PhotoImage(region.resize((region.width * scale, region.height * scale), Image.NEAREST))
+    tile_cache[key] = tile
+    if len(tile_cache) > TILE_CACHE_SIZE: tile_cache.popitem(last=False)
+    return tile
+
+def render_visible_tiles():
+    global render_pending
+    render_pending = False
+    step = TILE_SIZE * scale
+    x0, y0 = canvas.canvasx(0), canvas.canvasy(0)
+    x1 = canvas.canvasx(max(canvas.winfo_width(), int(canvas.cget('width'))))
+    y1 = canvas.canvasy(max(canvas.winfo_height(), int(canvas.cget('height'))))
+    cols, rows = -(-original_img.width // TILE_SIZE), -(-original_img.height // TILE_SIZE)
+    visible = {(tx, ty) for tx in range(max(0, int(x0 // step)), min(cols, int(x1 // step) + 1))
+                        for ty in range(max(0, int(y0 // step)), min(rows, int(y1 // step) + 1))}
+    for key in [k for k in tile_items if k not in visible]: canvas.delete(tile_items.pop(key)[0])
+    for tx, ty in visible - tile_items.keys():
+        tile = get_tile(tx, ty)
+        tile_items[(tx, ty)] = (canvas.create_image(tx * step, ty * step, anchor='nw', image=tile, tags="tile"), tile)
+    canvas.tag_lower("tile")
+
+def schedule_render(*_):
+    global render_pending
+    if not render_pending:
+        render_pending = True
+        canvas.after_idle(render_visible_tiles)
+
+def on_xscroll(*args): hbar.set(*args); schedule_render()
+
+def on_yscroll(*args): vbar.set(*args); schedule_render()
+
+canvas = tk.Canvas(canvas_frame, width=original_img.width * 2, height=original_img.height * 2, bg='white', xscrollcommand=on_xscroll, yscrollcommand=on_yscroll)
 canvas.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
 hbar.config(command=canvas.xview)
 vbar.config(command=canvas.yview)
 
-canvas_img_id = canvas.create_image(0, 0, anchor='nw', image=tk_img)
-canvas.image = tk_img
+update_scaled_image()
 canvas.config(scrollregion=(0, 0, img_width, img_height))
+canvas.bind("<Configure>", schedule_render)
+schedule_render()
 
 right_panel = tk.Frame(frame)
 right_panel.grid(row=0, column=1, padx=(10, 0), sticky='n')
@@ -96,6 +128,7 @@ def on_zoom_change(selected_zoom):
         redraw_rectangles()
         canvas.xview_moveto(max(0, x_ratio - 0.5 * canvas_width / (original_img.width * scale)))
         canvas.yview_moveto(max(0, y_ratio - 0.5 * canvas_height / (original_img.height * scale)))
+        schedule_render()
 
 tk.Label(zoom_frame, text="Zoom:").pack(side=tk.LEFT, padx=(0, 5))
 zoom_var = tk.StringVar(value="x2")
@@ -115,7 +148,10 @@ rect_scrollbar.config(command=rect_listbox.yview)
 rect_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 rect_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
-tk.Button(list_frame, text="Delete Selected", command=lambda: delete_selected_glyph()).pack(pady=(5, 0), anchor='w')
+list_buttons_frame = tk.Frame(list_frame)
+list_buttons_frame.pack(pady=(5, 0), anchor='w')
+tk.Button(list_buttons_frame, text="Delete Selected", command=lambda: delete_selected_glyph()).pack(side=tk.LEFT, padx=(0, 5))
+tk.Button(list_buttons_frame, text="Auto Detect", command=lambda: auto_detect_glyphs()).pack(side=tk.LEFT)
 
 def clamp(val, low, high): return max(low, min(val, high))
 
@@ -140,16 +176,20 @@ def update_listbox(preserve_scroll=False):
     elif not preserve_scroll: rect_listbox.see(tk.END)
 
 def redraw_rectangles():
-    canvas.delete("all")
-    canvas.create_image(0, 0, anchor='nw', image=tk_img)
-    canvas.image = tk_img
-    canvas_ids.clear()
-    canvas.config(scrollregion=(0, 0, img_width, img_height))
+    # keep persistent items, touch only rectangles whose coords or outline changed
     for i, r in enumerate(rects):
         x, y, w, h = [r[k] * scale for k in ("x", "y", "w", "h")]
-        color = 'yellow' if i == selected_index else 'red'
-        rid = canvas.create_rectangle(x, y, x + w, y + h, outline=color, width=2)
-        canvas_ids.append(rid)
+        coords, color = (x, y, x + w, y + h), 'yellow' if i == selected_index else 'red'
+        if i >= len(canvas_ids):
+            canvas_ids.append(canvas.create_rectangle(*coords, outline=color, width=2))
+            canvas_state.append((coords, color))
+            continue
+        old_coords, old_color = canvas_state[i]
+        if coords != old_coords: canvas.coords(canvas_ids[i], *coords)
+        if color != old_color: canvas.itemconfig(canvas_ids[i], outline=color)
+        canvas_state[i] = (coords, color)
+    for rid in canvas_ids[len(rects):]: canvas.delete(rid)
+    del canvas_ids[len(rects):], canvas_state[len(rects):]
 
 def delete_selected_glyph():
     global selected_index
@@ -162,33 +202,27 @@ def delete_selected_glyph():
         redraw_rectangles()
         if selected_index is not None and selected_index < rect_listbox.size(): rect_listbox.select_set(selected_index)
 
+def auto_detect_glyphs():
+    global rects, selected_index
+    if rects and not messagebox.askyesno("Confirm Auto Detect", f"Replace {len(rects)} glyphs with detected ones?"): return
+    grid_text = simpledialog.askstring("Auto Detect", "Grid cell size WxH (empty for tight boxes):", parent=root)
+    if grid_text is None: return
+    try:
+        grid = tuple(int(v) for v in grid_text.lower().split("x")) if grid_text.strip() else None
+        rects = detect_glyphs(original_img, grid)
+        selected_index = None
+        update_listbox(False)
+        redraw_rectangles()
+        messagebox.showinfo("Success", f"Detected {len(rects)} glyphs")
+    except Exception as e:
+        messagebox.showerror("Error", f"{e}")
+
 def load_binary_file():
     global rects, selected_index
     f = filedialog.askopenfilename(title="Load Binary", filetypes=[("Binary", "*.bin"), ("All", "*.*")])
     if not f: return
     try:
-        with open(f, 'rb') as binf: data = binf.read()
-        if len(data) % 12 != 0: raise ValueError("Invalid file size")
-        rects = []
-        for i in range(0, len(data), 12):
-            vals = struct.unpack('BBBBBBBBBBBB', data[i:i+12])
-            r = dict(FIELD_SCHEMA)
-            r.update({
-                "name": f"glyph_{(len(rects)+0x20):X}",
-                "x": vals[0],
-                "y": vals[1],
-                "w": vals[2]+1,
-                "h": vals[3]+1,
-                "leftMargin": vals[4],
-                "topMargin": vals[5],
-                "rightMargin": vals[6],
-                "unknown1": vals[7],
-                "trimLeft": vals[8],
-                "trimRight": vals[9],
-                "unknown2": vals[10],
-                "unknown3": vals[11]
-            })
-            rects.append(r)
+        rects = width_table.load_binary(f)
         selected_index = None
         update_listbox(False)
         redraw_rectangles()
@@ -201,8 +235,7 @@ def save_json_file():
     f = filedialog.asksaveasfilename(title="Save JSON", defaultextension=".json", filetypes=[("JSON", "*.json"), ("All", "*.*")])
     if not f: return
     try:
-        with open(f, 'w') as outf:
-            json.dump([{k: (f"0x{int(v):X}" if isinstance(FIELD_SCHEMA[k], int) else v) for k, v in r.items()} for r in rects], outf, indent=2)
+        width_table.save_json(f, rects)
         messagebox.showinfo("Success", f"Saved {len(rects)} glyphs")
     except Exception as e:
         messagebox.showerror("Error", f"{e}")
@@ -212,8 +245,7 @@ def load_json_file():
     f = filedialog.askopenfilename(title="Load JSON", filetypes=[("JSON", "*.json"), ("All", "*.*")])
     if not f: return
     try:
-        with open(f, 'r') as inf: data = json.load(inf)
-        rects = [{k: (int(str(v), 16) if isinstance(FIELD_SCHEMA[k], int) else v) for k, v in entry.items()} for entry in data]
+        rects = width_table.load_json(f)
         selected_index = None
         update_listbox(False)
         redraw_rectangles()
@@ -226,11 +258,7 @@ def save_binary_file():
     f = filedialog.asksaveasfilename(title="Save Binary", defaultextension=".bin", filetypes=[("Binary", "*.bin"), ("All", "*.*")])
     if not f: return
     try:
-        with open(f, 'wb') as outf:
-            for r in rects:
-                vals = [r.get(k, 0) for k in ["x", "y"]] + [max(0, r.get("w", 1)-1), max(0, r.get("h", 1)-1)]
-                vals += [r.get(k, 0) for k in ["leftMargin", "topMargin", "rightMargin", "unknown1", "trimLeft", "trimRight", "unknown2", "unknown3"]]
-                outf.write(struct.pack('BBBBBBBBBBBB', *vals))
+        width_table.save_binary(f, rects)
         messagebox.showinfo("Success", f"Saved {len(rects)} glyphs to binary")
     except Exception as e:
         messagebox.showerror("Error", f"{e}")